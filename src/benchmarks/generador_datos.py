@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+
+# generadores de datos sinteticos con la forma de las entradas reales:
+#   microdatos y metadatos tipo ENSANUT para el preprocesador (una fila por persona/hogar, valores como texto)
+#   tablas agregadas por escala tipo INEGI (state_cpv2020, mun_cpv2020) para el procesador
+
+VARIABLES_IDENTIFICADORAS_MICRODATOS = ['entidad', 'municipio']
+VARIABLES_IDENTIFICADORAS_ESCALAS = ['ENTIDAD', 'MUN', 'LOC']
+
+def generar_microdatos(filas:int, variables_categoricas:int, variables_numericas:int, categorias:int, municipios:int=2469, proporcion_nulos:float=0.1, semilla:int=0) -> tuple:
+
+    for nombre, valor, minimo in [('filas', filas, 1), ('variables_categoricas', variables_categoricas, 0), ('variables_numericas', variables_numericas, 0), ('categorias', categorias, 1), ('municipios', municipios, 1)]:
+        if not isinstance(valor, int):
+            raise TypeError(f'El parámetro {nombre} debe ser de tipo int')
+        if valor < minimo:
+            raise ValueError(f'El valor de {nombre} debe ser mayor o igual a {minimo}')
+    if not isinstance(proporcion_nulos, float) or not (0 <= proporcion_nulos < 1):
+        raise ValueError('El parámetro proporcion_nulos debe ser de tipo float entre 0 y 1')
+
+    rng = np.random.default_rng(semilla)
+
+    # los municipios se reparten entre 32 entidades, igual que en las claves geoestadisticas
+
+    id_municipio = rng.integers(0, municipios, filas)
+    columnas = {
+        'entidad': np.char.mod('%d', id_municipio % 32 + 1).astype(object),
+        'municipio': np.char.mod('%d', id_municipio + 1).astype(object)
+    }
+    metadatos = [
+        {'var': var, 'var_alias': var, 'var_type': 'id', 'posibles_valores': '[]', 'posibles_valores_alias': '[]'}
+        for var in VARIABLES_IDENTIFICADORAS_MICRODATOS
+    ]
+
+    posibles_valores = [str(i) for i in range(1, categorias+1)]
+    for i in range(variables_categoricas):
+        var = f'p{i}_cat'
+        valores = rng.choice(np.array(posibles_valores, dtype=object), filas)
+        valores[rng.random(filas) < proporcion_nulos] = ''
+        columnas[var] = valores
+        metadatos.append({
+            'var': var,
+            'var_alias': f'{var}_alias',
+            'var_type': 'options',
+            'posibles_valores': str(posibles_valores),
+            'posibles_valores_alias': str([f'opcion {valor}' for valor in posibles_valores])
+        })
+
+    for i in range(variables_numericas):
+        var = f'p{i}_num'
+        valores = np.char.mod('%.2f', rng.gamma(2.0, 20.0, filas)).astype(object)
+        valores[rng.random(filas) < proporcion_nulos] = ''
+        columnas[var] = valores
+        metadatos.append({'var': var, 'var_alias': f'{var}_alias', 'var_type': 'abierta', 'posibles_valores': '[]', 'posibles_valores_alias': '[]'})
+
+    return pd.DataFrame(columnas), pd.DataFrame(metadatos)
+
+def generar_escalas(entidades_escalas:dict, variables:int, proporcion_nulos:float=0.02, semilla:int=0) -> tuple:
+
+    if not isinstance(entidades_escalas, dict):
+        raise TypeError('El parámetro entidades_escalas debe ser de tipo dict')
+    if not isinstance(variables, int):
+        raise TypeError('El parámetro variables debe ser de tipo int')
+    if variables < 1:
+        raise ValueError('El valor de variables debe ser mayor o igual a 1')
+
+    rng = np.random.default_rng(semilla)
+    nombres_variables = ['POBTOT'] + [f'VAR_{i:03d}' for i in range(1, variables)]
+
+    dataframes_escalas = {}
+    for escala, entidades in entidades_escalas.items():
+        if not isinstance(entidades, int) or entidades < 1:
+            raise ValueError(f'El número de entidades de la escala {escala} debe ser un int mayor o igual a 1')
+
+        # claves ENTIDAD, MUN y LOC con ceros a la izquierda; las escalas con a lo mas 32 entidades son estatales
+
+        ids = np.arange(entidades)
+        columnas = {
+            'ENTIDAD': [f'{i % 32 + 1:02d}' for i in ids],
+            'MUN': [f'{i // 32 + 1:03d}' for i in ids] if entidades > 32 else ['000'] * entidades,
+            'LOC': ['0000'] * entidades,
+            'NOM_ENT': [f'Entidad {i % 32 + 1}' for i in ids]
+        }
+
+        # POBTOT sirve como variable base de normalizacion, las demas son subconjuntos de la poblacion
+
+        poblacion = rng.lognormal(9, 1.5, entidades).round()
+        columnas['POBTOT'] = poblacion
+        for var in nombres_variables[1:]:
+            valores = rng.binomial(poblacion.astype(np.int64), rng.uniform(0.01, 0.9)).astype(np.float64)
+            valores[rng.random(entidades) < proporcion_nulos] = np.nan
+            columnas[var] = valores
+        dataframes_escalas[escala] = pd.DataFrame(columnas)
+
+    diccionario_traducciones = pd.DataFrame({
+        'variable': VARIABLES_IDENTIFICADORAS_ESCALAS + ['NOM_ENT'] + nombres_variables,
+        'traduccion': [f'Descripción de {var}' for var in VARIABLES_IDENTIFICADORAS_ESCALAS + ['NOM_ENT'] + nombres_variables]
+    })
+
+    return dataframes_escalas, diccionario_traducciones
@@ -0,0 +1,306 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+import tempfile
+import tracemalloc
+from contextlib import redirect_stdout
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from preprocesador.preprocesador import Preprocesador
+from procesador.procesador import Procesador
+from benchmarks.generador_datos import generar_microdatos, generar_escalas, VARIABLES_IDENTIFICADORAS_MICRODATOS, VARIABLES_IDENTIFICADORAS_ESCALAS
+
+RUTA_SRC = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def medir(nombre:str, funcion, filas:int, repeticiones:int) -> dict:
+
+    # los tiempos se toman sin tracemalloc (agrega sobrecosto), la memoria pico se mide en una ejecucion adicional
+
+    tiempos = []
+    with open(os.devnull, 'w') as nulo, redirect_stdout(nulo):
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            funcion()
+            tiempos.append(time.perf_counter() - inicio)
+
+        tracemalloc.start()
+        funcion()
+        memoria_pico = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    resultado = {
+        'nombre': nombre,
+        'filas': filas,
+        'repeticiones': repeticiones,
+        'segundos_min': min(tiempos),
+        'segundos_mediana': statistics.median(tiempos),
+        'filas_por_segundo': filas / min(tiempos) if min(tiempos) > 0 else None,
+        'memoria_pico_mb': memoria_pico / 2**20,
+        'tipo_memoria': 'tracemalloc'
+    }
+    print(f"{nombre:<70} {resultado['segundos_min']:>10.4f} s {resultado['memoria_pico_mb']:>10.1f} MB")
+    return resultado
+
+def medir_cli(nombre:str, modulo:str, config:dict, filas:int, repeticiones:int, directorio_trabajo:str) -> dict:
+
+    # cada ejecucion es un proceso nuevo, la memoria pico es el RSS maximo de ese proceso (os.wait4)
+
+    ruta_config = os.path.join(directorio_trabajo, f'config_{modulo.split(".")[0]}.json')
+    with open(ruta_config, 'w') as f:
+        json.dump(config, f, indent=4)
+    ruta_log = os.path.join(directorio_trabajo, f'log_{modulo.split(".")[0]}.txt')
+
+    tiempos = []
+    memoria_pico = 0
+    for _ in range(repeticiones):
+        with open(ruta_log, 'w') as log:
+            inicio = time.perf_counter()
+            proceso = subprocess.Popen([sys.executable, '-m', modulo, '--config', ruta_config], cwd=RUTA_SRC, stdout=log, stderr=subprocess.STDOUT)
+            _, estado, uso = os.wait4(proceso.pid, 0)
+            tiempos.append(time.perf_counter() - inicio)
+        proceso.returncode = os.waitstatus_to_exitcode(estado)
+        if proceso.returncode != 0:
+            raise RuntimeError(f'La ejecución de {modulo} terminó con código {proceso.returncode}, revise el log en {ruta_log}')
+        memoria_pico = max(memoria_pico, uso.ru_maxrss * 1024 if sys.platform != 'darwin' else uso.ru_maxrss)
+
+    resultado = {
+        'nombre': nombre,
+        'filas': filas,
+        'repeticiones': repeticiones,
+        'segundos_min': min(tiempos),
+        'segundos_mediana': statistics.median(tiempos),
+        'filas_por_segundo': filas / min(tiempos) if min(tiempos) > 0 else None,
+        'memoria_pico_mb': memoria_pico / 2**20,
+        'tipo_memoria': 'rss'
+    }
+    print(f"{nombre:<70} {resultado['segundos_min']:>10.4f} s {resultado['memoria_pico_mb']:>10.1f} MB")
+    return resultado
+
+def benchmarks_preprocesador(config:dict, repeticiones:int) -> list:
+
+    filas = config.get('filas', 100000)
+    df, metadatos = generar_microdatos(
+        filas=filas,
+        variables_categoricas=config.get('variables_categoricas', 20),
+        variables_numericas=config.get('variables_numericas', 10),
+        categorias=config.get('categorias', 6),
+        municipios=config.get('municipios', 2469),
+        semilla=config.get('semilla', 0)
+    )
+    ids = VARIABLES_IDENTIFICADORAS_MICRODATOS
+    variables_categoricas = [var for var in df.columns if var.endswith('_cat')]
+    variables_numericas = [var for var in df.columns if var.endswith('_num')]
+
+    def crear_preprocesador():
+        return Preprocesador(df=df.copy(), metadatos=metadatos.copy(), columna_metadatos_nombres='var', columna_metadatos_posibles_valores='posibles_valores')
+
+    resultados = [medir('Preprocesador.normalizar_cadenas', lambda: crear_preprocesador().normalizar_cadenas(), filas, repeticiones)]
+
+    preprocesador = crear_preprocesador()
+    preprocesador.normalizar_cadenas()
+
+    resultados.append(medir('Preprocesador.agrupar_total_datos', lambda: preprocesador.agrupar_total_datos(variables_id_agrupacion=ids), filas, repeticiones))
+    if len(variables_categoricas) > 0:
+        resultados.append(medir(
+            'Preprocesador.contar_variables_categoricas',
+            lambda: preprocesador.contar_variables_categoricas(variables_id_agrupacion=ids, variables_a_agrupar=variables_categoricas),
+            filas, repeticiones
+        ))
+        resultados.append(medir(
+            'Preprocesador.agrupar_variables_categoricas',
+            lambda: preprocesador.agrupar_variables_categoricas(variables_id_agrupacion=ids, variables_a_agrupar=variables_categoricas),
+            filas, repeticiones
+        ))
+        resultados.append(medir(
+            'Preprocesador.generar_diccionario_traducciones_variables_categoricas',
+            lambda: preprocesador.generar_diccionario_traducciones_variables_categoricas(variables=variables_categoricas, columna_metadatos_alias='var_alias', columna_metadatos_posibles_valores_alias='posibles_valores_alias'),
+            len(variables_categoricas), repeticiones
+        ))
+    if len(variables_numericas) > 0:
+        for operacion in ['suma', 'media', 'mediana']:
+            resultados.append(medir(
+                f'Preprocesador.agrupar_variables_numericas[{operacion}]',
+                lambda: preprocesador.agrupar_variables_numericas(variables_id_agrupacion=ids, variables_a_agrupar=variables_numericas, operacion=operacion),
+                filas, repeticiones
+            ))
+
+    return resultados
+
+def benchmarks_procesador(config:dict, repeticiones:int) -> list:
+
+    entidades_escalas = config.get('entidades_escalas', {'state': 32, 'mun': 2469})
+    q = config.get('q', 10)
+    workers = config.get('workers', 1)
+    dataframes_escalas, diccionario_traducciones = generar_escalas(
+        entidades_escalas=entidades_escalas,
+        variables=config.get('variables', 100),
+        semilla=config.get('semilla', 0)
+    )
+    escalas = list(dataframes_escalas.keys())
+    escala_mayor = max(escalas, key=lambda escala: len(dataframes_escalas[escala]))
+    variables = [var for var in dataframes_escalas[escala_mayor].columns if var.startswith('VAR_')]
+    filas_escala_mayor = len(dataframes_escalas[escala_mayor]) * len(variables)
+    filas_escalas = sum(len(dataframe) for dataframe in dataframes_escalas.values()) * len(variables)
+
+    def crear_procesador():
+        return Procesador(
+            dataframes_escalas=dataframes_escalas,
+            diccionario_traducciones=diccionario_traducciones,
+            columna_diccionario_traducciones_nombres='traduccion',
+            columna_diccionario_traducciones_alias='variable',
+            variables_identificadoras=VARIABLES_IDENTIFICADORAS_ESCALAS,
+            variables_excluidas_list=['NOM_ENT'],
+            variables_excluidas_regex=[]
+        )
+
+    resultados = [medir('Procesador.__init__', crear_procesador, sum(len(dataframe) for dataframe in dataframes_escalas.values()), repeticiones)]
+    with open(os.devnull, 'w') as nulo, redirect_stdout(nulo):
+        procesador = crear_procesador()
+
+    for base in [None, 'POBTOT']:
+        sufijo = f'[base={base}]'
+        resultados.append(medir(
+            f'Procesador.categorizar_variable{sufijo}',
+            lambda: [procesador.categorizar_variable(escala=escala_mayor, var=var, var_base_normalizacion=base, q=q) for var in variables],
+            filas_escala_mayor, repeticiones
+        ))
+        resultados.append(medir(
+            f'Procesador.categorizar_multiples_variables{sufijo}',
+            lambda: procesador.categorizar_multiples_variables(escala=escala_mayor, variables=variables, var_base_normalizacion=base, q=q),
+            filas_escala_mayor, repeticiones
+        ))
+        resultados.append(medir(
+            f'Procesador.procesar_variable{sufijo}',
+            lambda: [procesador.procesar_variable(escalas=escalas, var=var, var_base_normalizacion=base, q=q) for var in variables],
+            filas_escalas, repeticiones
+        ))
+
+    resultados.append(medir(
+        f'Procesador.procesar_multiples_variables_list[workers={workers}]',
+        lambda: procesador.procesar_multiples_variables_list(escalas=escalas, dicc={None: variables, 'POBTOT': variables}, q=q, workers=workers),
+        2 * filas_escalas, repeticiones
+    ))
+
+    return resultados
+
+def benchmarks_cli(config_preprocesador:dict, config_procesador:dict, repeticiones:int, directorio_trabajo:str) -> list:
+
+    # se escriben los datos sinteticos a disco y se ejecutan ambos puntos de entrada completos
+
+    df, metadatos = generar_microdatos(
+        filas=config_preprocesador.get('filas', 100000),
+        variables_categoricas=config_preprocesador.get('variables_categoricas', 20),
+        variables_numericas=config_preprocesador.get('variables_numericas', 10),
+        categorias=config_preprocesador.get('categorias', 6),
+        municipios=config_preprocesador.get('municipios', 2469),
+        semilla=config_preprocesador.get('semilla', 0)
+    )
+    ruta_microdatos = os.path.join(directorio_trabajo, 'microdatos.csv')
+    ruta_metadatos = os.path.join(directorio_trabajo, 'metadatos.csv')
+    df.to_csv(ruta_microdatos, index=False)
+    metadatos.to_csv(ruta_metadatos, index=False)
+
+    config_cli_preprocesador = {
+        'ruta_csv_metadatos': ruta_metadatos,
+        'ruta_csv_dataset': ruta_microdatos,
+        'ruta_salida_dataset': os.path.join(directorio_trabajo, 'preprocesamiento_datos.csv'),
+        'ruta_salida_diccionario_traducciones': os.path.join(directorio_trabajo, 'preprocesamiento_diccionario.csv'),
+        'columna_metadatos_nombres': 'var',
+        'columna_metadatos_posibles_valores': 'posibles_valores',
+        'columna_metadatos_alias': 'var_alias',
+        'columna_metadatos_posibles_valores_alias': 'posibles_valores_alias',
+        'variables_identificadoras_list': ['municipio'],
+        'variables_a_agrupar': [
+            {'tipo_variables': 'categorico', 'variables_a_agrupar_list': [], 'variables_a_agrupar_regex': ['_cat$']},
+            {'tipo_variables': 'numerico', 'operacion': 'media', 'variables_a_agrupar_list': [], 'variables_a_agrupar_regex': ['_num$']}
+        ]
+    }
+    if config_preprocesador.get('tamano_chunk') is not None:
+        config_cli_preprocesador['tamano_chunk'] = config_preprocesador['tamano_chunk']
+
+    dataframes_escalas, diccionario_traducciones = generar_escalas(
+        entidades_escalas=config_procesador.get('entidades_escalas', {'state': 32, 'mun': 2469}),
+        variables=config_procesador.get('variables', 100),
+        semilla=config_procesador.get('semilla', 0)
+    )
+    rutas_escalas = {}
+    for escala, dataframe in dataframes_escalas.items():
+        rutas_escalas[escala] = os.path.join(directorio_trabajo, f'{escala}.csv')
+        dataframe.to_csv(rutas_escalas[escala], index=False)
+    ruta_diccionario = os.path.join(directorio_trabajo, 'diccionario_escalas.csv')
+    diccionario_traducciones.to_csv(ruta_diccionario, index=False)
+
+    config_cli_procesador = {
+        'rutas_csv_escalas': rutas_escalas,
+        'ruta_csv_diccionario_traducciones': ruta_diccionario,
+        'columna_diccionario_traducciones_nombres': 'traduccion',
+        'columna_diccionario_traducciones_alias': 'variable',
+        'variables_identificadoras': VARIABLES_IDENTIFICADORAS_ESCALAS,
+        'variables_excluidas_list': ['NOM_ENT'],
+        'variables_excluidas_regex': [],
+        'variables_a_procesar_regex': {'None': '^VAR_'},
+        'q': config_procesador.get('q', 10),
+        'workers': config_procesador.get('workers', 1),
+        'ruta_csv_salida': os.path.join(directorio_trabajo, 'procesamiento.csv')
+    }
+    variables = [var for var in diccionario_traducciones['variable'] if var.startswith('VAR_')]
+    filas_escalas = sum(len(dataframe) for dataframe in dataframes_escalas.values()) * len(variables)
+
+    return [
+        medir_cli('main_preprocesador', 'preprocesador.main_preprocesador', config_cli_preprocesador, len(df), repeticiones, directorio_trabajo),
+        medir_cli('main_procesador', 'procesador.main_procesador', config_cli_procesador, filas_escalas, repeticiones, directorio_trabajo)
+    ]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks de Preprocesador y Procesador con datos sintéticos')
+    parser.add_argument('--config', type=str, required=True, help='Archivo de configuración')
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        benchmarks_config = json.load(f)
+
+    if 'ruta_salida_resultados' not in benchmarks_config:
+        raise ValueError('El archivo JSON pasado para --config debe tener el campo ruta_salida_resultados')
+    ruta_salida_resultados = benchmarks_config['ruta_salida_resultados']
+
+    repeticiones = benchmarks_config.get('repeticiones', 3)
+    if not isinstance(repeticiones, int) or repeticiones < 1:
+        raise ValueError('El valor asociado al campo repeticiones debe ser un int mayor o igual a 1')
+
+    config_preprocesador = benchmarks_config.get('preprocesador', {})
+    config_procesador = benchmarks_config.get('procesador', {})
+    if not isinstance(config_preprocesador, dict) or not isinstance(config_procesador, dict):
+        raise TypeError('Los valores asociados a los campos preprocesador y procesador deben ser de tipo dict')
+
+    resultados = []
+    resultados += benchmarks_preprocesador(config_preprocesador, repeticiones)
+    resultados += benchmarks_procesador(config_procesador, repeticiones)
+
+    if benchmarks_config.get('medir_cli', True):
+        directorio_trabajo = benchmarks_config.get('directorio_trabajo')
+        if directorio_trabajo is None:
+            directorio_trabajo = tempfile.mkdtemp(prefix='benchmarks_c3_')
+        os.makedirs(directorio_trabajo, exist_ok=True)
+        resultados += benchmarks_cli(config_preprocesador, config_procesador, repeticiones, os.path.abspath(directorio_trabajo))
+
+    reporte = {
+        'fecha': datetime.now().isoformat(timespec='seconds'),
+        'entorno': {
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'plataforma': platform.platform(),
+            'procesadores': os.cpu_count()
+        },
+        'configuracion': benchmarks_config,
+        'resultados': resultados
+    }
+    with open(ruta_salida_resultados, 'w') as f:
+        json.dump(reporte, f, indent=4, ensure_ascii=False)
+    print(f'Benchmarks finalizados, los resultados se encuentran en la ruta:\n{ruta_salida_resultados}')
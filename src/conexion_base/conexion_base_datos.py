@@ -1,10 +1,95 @@
 import pandas as pd
+import numpy as np
 import argparse
 import os
+import re
 from dotenv import load_dotenv
 import psycopg
 from psycopg import sql
 from io import StringIO
+from utils.io_utils import leer_tabla_por_bloques
+
+# tipos SQL de --crear-tabla en la carga de texto (COPY CSV) segun el dtype de pandas; la carga binaria e incremental
+# usa los tipos inferidos por inferir_tipos_sql
+TIPOS_SQL_TEXTO = {
+    'int64': 'INTEGER',
+    'float64': 'FLOAT',
+    'object': 'TEXT',
+    'bool': 'BOOLEAN'
+}
+
+# nombres de los tipos para COPY binario (psycopg) segun el tipo SQL inferido
+TIPOS_COPIA_BINARIA = {
+    'BIGINT': 'int8',
+    'DOUBLE PRECISION': 'float8',
+    'BOOLEAN': 'bool',
+    'TIMESTAMP': 'timestamp',
+    'TEXT': 'text',
+    'BIGINT[]': 'int8[]',
+    'TEXT[]': 'text[]'
+}
+
+def elementos_arreglo(valor) -> list:
+    # las columnas cells guardan las entidades como texto en sintaxis de arreglo de postgres: {a,b,c}
+    if isinstance(valor, list):
+        return [str(x) for x in valor]
+    contenido = valor[1:-1]
+    return contenido.split(',') if contenido != '' else []
+
+def inferir_tipos_sql(df:pd.DataFrame) -> dict:
+    
+    tipos_sql = {}
+    for col, dtype in df.dtypes.items():
+        if pd.api.types.is_bool_dtype(dtype):
+            tipos_sql[col] = 'BOOLEAN'
+        elif pd.api.types.is_integer_dtype(dtype):
+            tipos_sql[col] = 'BIGINT'
+        elif pd.api.types.is_float_dtype(dtype):
+            tipos_sql[col] = 'DOUBLE PRECISION'
+        elif pd.api.types.is_datetime64_any_dtype(dtype):
+            tipos_sql[col] = 'TIMESTAMP'
+        else:
+            no_nulos = df[col].dropna()
+            es_arreglo = len(no_nulos) > 0 and all(
+                isinstance(valor, list) or (isinstance(valor, str) and valor.startswith('{') and valor.endswith('}'))
+                for valor in no_nulos
+            )
+            if not es_arreglo:
+                tipos_sql[col] = 'TEXT'
+                continue
+            # se usan enteros solo si ningun elemento pierde informacion al convertirse (ceros a la izquierda)
+            enteros = all(
+                re.fullmatch(r'-?[1-9][0-9]*|0', elemento) is not None
+                for valor in no_nulos for elemento in elementos_arreglo(valor)
+            )
+            tipos_sql[col] = 'BIGINT[]' if enteros else 'TEXT[]'
+    return tipos_sql
+
+def convertir_columna(serie:pd.Series, tipo_sql:str) -> list:
+    
+    # se convierten los valores a tipos de python, los nulos (NaN, NA) se envian como None
+    valores = serie.astype(object).where(serie.notna(), None).tolist()
+    if tipo_sql == 'BIGINT':
+        return [int(valor) if valor is not None else None for valor in valores]
+    if tipo_sql == 'DOUBLE PRECISION':
+        return [float(valor) if valor is not None else None for valor in valores]
+    if tipo_sql == 'TEXT':
+        return [str(valor) if valor is not None else None for valor in valores]
+    if tipo_sql == 'TEXT[]':
+        return [elementos_arreglo(valor) if valor is not None else None for valor in valores]
+    if tipo_sql == 'BIGINT[]':
+        try:
+            return [[int(x) for x in elementos_arreglo(valor)] if valor is not None else None for valor in valores]
+        except ValueError:
+            raise ValueError(f'La columna {serie.name} fue inferida como BIGINT[] pero un bloque posterior contiene elementos no enteros, use un --tamano-bloque mayor para inferir los tipos con más filas')
+    return valores
+
+def calcular_hash_filas(valores_columnas:list) -> list:
+    
+    # hash de 64 bits del contenido de cada fila, calculado sobre los valores ya convertidos para que no dependa
+    # del tipo con el que se leyo cada bloque; se guarda como BIGINT con signo
+    textos = pd.DataFrame({i: [repr(valor) for valor in valores] for i, valores in enumerate(valores_columnas)})
+    return pd.util.hash_pandas_object(textos, index=False).to_numpy().view(np.int64).tolist()
 
 if __name__ == "__main__":
     
@@ -12,9 +97,34 @@ if __name__ == "__main__":
     parser.add_argument("--ruta-datos-procesados", type=str, required=True, help="Ruta de los datos procesados que serán cargados a la base de datos")
     parser.add_argument("--ruta-env", type=str, default='./.env', help="Ruta al archivo .env")
     parser.add_argument("--crear-tabla", action='store_true', help="Adicionalmente crea la tabla especificada en el archivo .env")
+    parser.add_argument("--tamano-bloque", type=int, default=100000, help="Número de filas que se leen y envían a la base de datos a la vez")
+    parser.add_argument("--copia-binaria", action='store_true', help="Carga masiva con COPY binario y tipos inferidos a través de una tabla temporal, los índices se crean al final")
+    parser.add_argument("--columnas-indice", type=str, nargs='*', default=None, help="Columnas con índice en la carga binaria (por defecto code y bin): los índices se eliminan antes de insertar y se recrean después")
+    parser.add_argument("--incremental", action='store_true', help="Solo reescribe las filas nuevas o modificadas (según el hash de su contenido) con un upsert sobre las columnas llave y elimina las llaves que ya no están en los datos procesados")
+    parser.add_argument("--columnas-llave", type=str, nargs='+', default=['code', 'bin'], help="Columnas que identifican cada fila en la carga incremental (por defecto code y bin)")
     args = parser.parse_args()
     
-    df = pd.read_csv(args.ruta_datos_procesados)
+    if args.tamano_bloque < 1:
+        raise ValueError("El valor de --tamano-bloque debe ser mayor o igual a 1")
+    
+    # los datos se leen por bloques, el primero define las columnas y sus tipos
+    bloques = leer_tabla_por_bloques(args.ruta_datos_procesados, tamano_bloque=args.tamano_bloque)
+    df = next(bloques, None)
+    if df is None:
+        raise ValueError(f"El archivo {args.ruta_datos_procesados} no contiene datos")
+    columnas = list(df.columns)
+    tipos_sql = inferir_tipos_sql(df)
+    
+    columnas_indice = args.columnas_indice if args.columnas_indice is not None else [col for col in ['code', 'bin'] if col in columnas]
+    for col in columnas_indice:
+        if col not in columnas:
+            raise ValueError(f"La columna {col} especificada en --columnas-indice no existe en los datos procesados")
+    if args.incremental:
+        for col in args.columnas_llave:
+            if col not in columnas:
+                raise ValueError(f"La columna {col} especificada en --columnas-llave no existe en los datos procesados")
+        if 'hash_fila' in columnas:
+            raise ValueError("Los datos procesados no pueden contener la columna hash_fila en la carga incremental")
 
     if not os.path.exists(args.ruta_env):
         raise FileNotFoundError(f"No se encontró el archivo .env en la ruta: {args.ruta_env}")
@@ -33,15 +143,9 @@ if __name__ == "__main__":
             
             tabla = os.getenv("DB_TABLE")
             if args.crear_tabla == True:
-                tipos = {
-                    'int64': 'INTEGER',
-                    'float64': 'FLOAT',
-                    'object': 'TEXT',
-                    'bool': 'BOOLEAN'
-                }
                 columns = []
                 for col, dtype in df.dtypes.items():
-                    sql_type = tipos.get(str(dtype), 'TEXT')
+                    sql_type = tipos_sql[col] if args.copia_binaria or args.incremental else TIPOS_SQL_TEXTO.get(str(dtype), 'TEXT')
                     columns.append(f"{col} {sql_type}")
                 columns_sql = ",\n    ".join(columns)
                 create_table_sql = f"""
@@ -51,17 +155,124 @@ if __name__ == "__main__":
                 );
                 """
                 cursor.execute(create_table_sql)
+            
+            if args.incremental:
+                # la tabla destino guarda el hash de cada fila y necesita un índice único sobre las llaves para el upsert
+                cursor.execute(sql.SQL("ALTER TABLE {} ADD COLUMN IF NOT EXISTS hash_fila BIGINT").format(sql.Identifier(tabla)))
+                cursor.execute(sql.SQL("CREATE UNIQUE INDEX IF NOT EXISTS {} ON {} ({})").format(
+                    sql.Identifier(f"{tabla}_llave_idx"),
+                    sql.Identifier(tabla),
+                    sql.SQL(", ").join([sql.Identifier(col) for col in args.columnas_llave])
+                ))
         
-            # archivo temporal en memoria
-            buffer = StringIO()
-            df.to_csv(buffer, index=False, header=True)
-            buffer.seek(0)  # volver al inicio del archivo
-
-            with cursor.copy(sql.SQL("COPY {} ({}) FROM STDIN WITH CSV HEADER").format(
-                sql.Identifier(tabla),
-                sql.SQL(", ").join([sql.Identifier(col) for col in df.columns])
-            )) as copy:
-                copy.write(buffer.getvalue())
+            columnas_sql = sql.SQL(", ").join([sql.Identifier(col) for col in columnas])
+            columnas_enteras = [col for col, tipo in tipos_sql.items() if tipo == 'BIGINT']
+            
+            # cada bloque se serializa y se envía al flujo COPY en cuanto se lee, la memoria usada no depende del tamaño del archivo
+            filas = 0
+            if not args.copia_binaria and not args.incremental:
+                with cursor.copy(sql.SQL("COPY {} ({}) FROM STDIN WITH CSV").format(
+                    sql.Identifier(tabla),
+                    columnas_sql
+                )) as copy:
+                    while df is not None:
+                        # una columna entera del primer bloque puede leerse como flotante en otro si tiene valores nulos
+                        for col in columnas_enteras:
+                            if pd.api.types.is_float_dtype(df[col]):
+                                df[col] = df[col].astype('Int64')
+                        buffer = StringIO()
+                        df[columnas].to_csv(buffer, index=False, header=False)
+                        copy.write(buffer.getvalue())
+                        filas += len(df)
+                        df = next(bloques, None)
+            else:
+                # carga masiva: COPY binario (el servidor no interpreta texto) a una tabla temporal sin índices,
+                # despues se inserta en la tabla destino en una sola sentencia
+                columnas_temporal = columnas + (['hash_fila'] if args.incremental else [])
+                tipos_temporal = {**tipos_sql, 'hash_fila': 'BIGINT'}
+                columnas_temporal_sql = sql.SQL(", ").join([sql.Identifier(col) for col in columnas_temporal])
+                tabla_temporal = f"{tabla}_carga"
+                cursor.execute(sql.SQL("CREATE TEMP TABLE {} ({}) ON COMMIT DROP").format(
+                    sql.Identifier(tabla_temporal),
+                    sql.SQL(", ").join([sql.SQL("{} {}").format(sql.Identifier(col), sql.SQL(tipos_temporal[col])) for col in columnas_temporal])
+                ))
+                
+                # en la carga incremental se envian todas las filas con su hash; la comparacion con los hashes ya guardados
+                # se hace en el servidor, la memoria usada no depende del tamaño de la tabla destino
+                indices_llave = [columnas.index(col) for col in args.columnas_llave]
+                
+                with cursor.copy(sql.SQL("COPY {} ({}) FROM STDIN (FORMAT BINARY)").format(
+                    sql.Identifier(tabla_temporal),
+                    columnas_temporal_sql
+                )) as copy:
+                    copy.set_types([TIPOS_COPIA_BINARIA[tipos_temporal[col]] for col in columnas_temporal])
+                    while df is not None:
+                        valores_columnas = [convertir_columna(df[col], tipos_sql[col]) for col in columnas]
+                        if not args.incremental:
+                            for fila in zip(*valores_columnas):
+                                copy.write_row(fila)
+                        else:
+                            for fila, hash_fila in zip(zip(*valores_columnas), calcular_hash_filas(valores_columnas)):
+                                if any(fila[i] is None for i in indices_llave):
+                                    raise ValueError(f"Las columnas llave {args.columnas_llave} no pueden tener valores nulos: {tuple(fila[i] for i in indices_llave)}")
+                                copy.write_row(fila + (hash_fila,))
+                        filas += len(df)
+                        df = next(bloques, None)
+                
+                # los índices no únicos se eliminan antes de insertar y se construyen una sola vez con los datos ya cargados,
+                # tambien cuando la tabla ya existe; el índice único de las llaves se conserva para el upsert
+                for col in columnas_indice:
+                    cursor.execute(sql.SQL("DROP INDEX IF EXISTS {}").format(sql.Identifier(f"{tabla}_{col}_idx")))
+                
+                if not args.incremental:
+                    cursor.execute(sql.SQL("INSERT INTO {} ({}) SELECT {} FROM {}").format(
+                        sql.Identifier(tabla),
+                        columnas_sql,
+                        columnas_sql,
+                        sql.Identifier(tabla_temporal)
+                    ))
+                else:
+                    llaves_sql = sql.SQL(", ").join([sql.Identifier(col) for col in args.columnas_llave])
+                    cursor.execute(sql.SQL("ANALYZE {}").format(sql.Identifier(tabla_temporal)))
+                    cursor.execute(sql.SQL("SELECT {} FROM {} GROUP BY {} HAVING COUNT(*) > 1 LIMIT 1").format(
+                        llaves_sql,
+                        sql.Identifier(tabla_temporal),
+                        llaves_sql
+                    ))
+                    llave_repetida = cursor.fetchone()
+                    if llave_repetida is not None:
+                        raise ValueError(f"La llave {tuple(llave_repetida)} está repetida en los datos procesados")
+                    
+                    # un solo upsert aplica las filas nuevas y modificadas, las filas con el mismo hash no se reescriben
+                    columnas_actualizar = [col for col in columnas_temporal if col not in args.columnas_llave]
+                    cursor.execute(sql.SQL("INSERT INTO {} AS t ({}) SELECT {} FROM {} ON CONFLICT ({}) DO UPDATE SET {} WHERE t.hash_fila IS DISTINCT FROM EXCLUDED.hash_fila").format(
+                        sql.Identifier(tabla),
+                        columnas_temporal_sql,
+                        columnas_temporal_sql,
+                        sql.Identifier(tabla_temporal),
+                        llaves_sql,
+                        sql.SQL(", ").join([sql.SQL("{} = EXCLUDED.{}").format(sql.Identifier(col), sql.Identifier(col)) for col in columnas_actualizar])
+                    ))
+                    filas_aplicadas = cursor.rowcount
+                    
+                    # las llaves que ya no estan en los datos procesados se eliminan, la tabla queda igual que con una carga completa
+                    cursor.execute(sql.SQL("DELETE FROM {} AS t WHERE NOT EXISTS (SELECT 1 FROM {} AS c WHERE {})").format(
+                        sql.Identifier(tabla),
+                        sql.Identifier(tabla_temporal),
+                        sql.SQL(" AND ").join([sql.SQL("c.{} = t.{}").format(sql.Identifier(col), sql.Identifier(col)) for col in args.columnas_llave])
+                    ))
+                    filas_eliminadas = cursor.rowcount
+                
+                for col in columnas_indice:
+                    cursor.execute(sql.SQL("CREATE INDEX {} ON {} ({})").format(
+                        sql.Identifier(f"{tabla}_{col}_idx"),
+                        sql.Identifier(tabla),
+                        sql.Identifier(col)
+                    ))
+                cursor.execute(sql.SQL("ANALYZE {}").format(sql.Identifier(tabla)))
             
             conn.commit()
-            print(f"Datos insertados exitosamente en la tabla '{tabla}'")
+            if args.incremental:
+                print(f"{filas_aplicadas} filas nuevas o modificadas aplicadas y {filas_eliminadas} filas eliminadas exitosamente en la tabla '{tabla}' ({filas - filas_aplicadas} filas sin cambios)")
+            else:
+                print(f"{filas} filas insertadas exitosamente en la tabla '{tabla}'")
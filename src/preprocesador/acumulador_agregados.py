@@ -0,0 +1,352 @@
+import os
+import pickle
+import numpy as np
+import pandas as pd
+from preprocesador.preprocesador import Preprocesador
+
+# version del formato del estado persistido, un estado de otra version no se puede combinar
+VERSION_ESTADO = 3
+
+# numero de chunks cuyos agregados parciales se acumulan antes de combinarlos con el estado
+CHUNKS_POR_COMBINACION = 8
+
+# funcion de combinacion de cada estado parcial, los demas se suman
+FUNCIONES_COMBINACION = {'minimos': 'min', 'maximos': 'max'}
+
+class AcumuladorAgregados:
+
+    def __init__(self, variables_id_agrupacion:list, agrupaciones:list, configuracion:dict=None, suma_exacta:bool=False):
+
+        if not isinstance(variables_id_agrupacion, list):
+            raise TypeError('El valor del parámetro variables_id_agrupacion debe ser de tipo list')
+        self.variables_id_agrupacion = variables_id_agrupacion
+
+        if not isinstance(agrupaciones, list):
+            raise TypeError('El valor del parámetro agrupaciones debe ser de tipo list')
+        for agrupacion in agrupaciones:
+            if not isinstance(agrupacion, dict):
+                raise TypeError('La lista agrupaciones debe contener elementos de tipo dict')
+            if agrupacion.get('tipo_variables') not in ['categorico', 'numerico']:
+                raise ValueError('El valor de tipo_variables debe ser una de las cadenas: categorico, numerico')
+            if not isinstance(agrupacion.get('variables'), list):
+                raise TypeError('Cada agrupación debe tener una llave variables de tipo list')
+            if agrupacion['tipo_variables'] == 'numerico':
+                Preprocesador.normalizar_operaciones(agrupacion.get('operacion'))
+        self.agrupaciones = agrupaciones
+
+        # configuracion de agrupacion y agregacion con la que se construye el estado (campos del archivo de
+        # configuracion), se guarda con el estado y un estado construido con otra configuracion no se puede continuar
+        if configuracion is not None and not isinstance(configuracion, dict):
+            raise TypeError('El valor del parámetro configuracion debe ser de tipo dict o None')
+        self.configuracion = configuracion if configuracion is not None else {}
+        
+        # sin suma_exacta las sumas parciales de cada chunk se suman como flotantes: el resultado difiere de la suma
+        # del dataset completo (groupby.sum) solo por redondeo, en el orden de n * 1e-16 relativo para n filas por
+        # grupo. Con suma_exacta las sumas parciales son exactas (Fraction) y coinciden con Preprocesador.sumar_por_grupo
+        if not isinstance(suma_exacta, bool):
+            raise TypeError('El valor del parámetro suma_exacta debe ser de tipo bool')
+        self.suma_exacta = suma_exacta
+
+        # estados parciales combinables: conteos, sumas, conteos de valores no nulos, minimos, maximos, momentos
+        # (para desviaciones estandar) e histogramas (para medianas y percentiles, solo con lectura completa: el
+        # histograma crece con los valores distintos de cada grupo, main_preprocesador los rechaza con tamano_chunk)
+
+        self.estado_total = None
+        self.estados = [{} for _ in agrupaciones]
+        self.variables_no_numericas = [set() for _ in agrupaciones]
+
+        # los agregados de cada chunk se acumulan como parciales pendientes y se combinan con el estado cada
+        # CHUNKS_POR_COMBINACION chunks, en lugar de reagrupar el estado completo en cada chunk
+
+        self.pendientes_total = []
+        self.pendientes = [{} for _ in agrupaciones]
+        self.chunks_pendientes = 0
+
+    def __combinar(self, partes:list, funcion:str='sum') -> pd.DataFrame:
+
+        partes = [parte for parte in partes if parte is not None]
+        if len(partes) == 1:
+            return partes[0]
+        combinado = pd.concat(partes)
+        return combinado.groupby(level=list(range(combinado.index.nlevels)), observed=True).agg(funcion)
+
+    def __combinar_momentos(self, momentos:list) -> tuple:
+
+        # combinacion de (conteo, media, suma de cuadrados de las desviaciones) de varios bloques (Chan et al.):
+        # n = suma de n_i, media = suma de n_i * media_i / n, m2 = suma de m2_i + n_i * (media_i - media)**2
+
+        conteos = pd.concat([no_nulos for no_nulos, _, _ in momentos]).astype(np.float64).fillna(0.0)
+        medias = pd.concat([medias for _, medias, _ in momentos])
+        m2 = pd.concat([m2 for _, _, m2 in momentos])
+        niveles = list(range(conteos.index.nlevels))
+
+        n = conteos.groupby(level=niveles, observed=True).sum()
+        media = (medias.fillna(0.0) * conteos).groupby(level=niveles, observed=True).sum() / n.where(n > 0)
+        desviaciones = (medias - media.reindex(medias.index)).fillna(0.0)
+        suma_cuadrados = (m2.fillna(0.0) + conteos * desviaciones**2).groupby(level=niveles, observed=True).sum()
+
+        return media, suma_cuadrados
+
+    def __reducir(self):
+
+        # combina los parciales pendientes con el estado; los momentos se combinan con los conteos previos, antes de
+        # actualizarlos
+
+        if self.chunks_pendientes == 0:
+            return
+
+        self.estado_total = self.__combinar([self.estado_total] + self.pendientes_total)
+        self.pendientes_total = []
+
+        for estado, pendientes in zip(self.estados, self.pendientes):
+            momentos = pendientes.pop('momentos', [])
+            if len(momentos) > 0:
+                if 'medias' in estado:
+                    momentos = [(estado['no_nulos'], estado['medias'], estado['m2'])] + momentos
+                estado['medias'], estado['m2'] = self.__combinar_momentos(momentos)
+            for clave, partes in pendientes.items():
+                estado[clave] = self.__combinar([estado.get(clave)] + partes, funcion=FUNCIONES_COMBINACION.get(clave, 'sum'))
+            pendientes.clear()
+
+        self.chunks_pendientes = 0
+
+    def agregar(self, preprocesador:Preprocesador):
+
+        if not isinstance(preprocesador, Preprocesador):
+            raise TypeError('El valor del parámetro preprocesador debe ser de tipo Preprocesador')
+
+        ids = self.variables_id_agrupacion
+
+        self.pendientes_total.append(preprocesador.agrupar_total_datos(variables_id_agrupacion=ids).set_index(ids))
+
+        for i, agrupacion in enumerate(self.agrupaciones):
+
+            variables = agrupacion['variables']
+            pendientes = self.pendientes[i]
+
+            if agrupacion['tipo_variables'] == 'categorico':
+                parcial = preprocesador.contar_variables_categoricas(
+                    variables_id_agrupacion=ids,
+                    variables_a_agrupar=variables
+                ).set_index(ids + ['característica', 'observación'])
+                pendientes.setdefault('conteos', []).append(parcial)
+                continue
+
+            df, variables_numericas = preprocesador.convertir_variables_numericas(
+                variables_id_agrupacion=ids,
+                variables_a_agrupar=variables
+            )
+            self.variables_no_numericas[i] |= set(variables) - set(variables_numericas)
+            variables_numericas = [var for var in dict.fromkeys(variables_numericas) if var not in ids]
+
+            agrupado = df.groupby(ids, observed=True)
+
+            # el conteo de filas conserva los grupos aunque todos sus valores sean nulos
+            pendientes.setdefault('filas', []).append(agrupado.size().to_frame('filas'))
+
+            operaciones = Preprocesador.normalizar_operaciones(agrupacion['operacion'])
+
+            if any(op in ['suma', 'media'] for op in operaciones):
+                # con suma_exacta las sumas por chunk no se redondean (Fraction) y se redondean una sola vez en resultados
+                if self.suma_exacta:
+                    sumas = Preprocesador.sumar_por_grupo(df, agrupado, variables_numericas, exacta=True)
+                else:
+                    sumas = agrupado[variables_numericas].sum()
+                pendientes.setdefault('sumas', []).append(sumas)
+
+            if 'minimo' in operaciones:
+                pendientes.setdefault('minimos', []).append(agrupado[variables_numericas].min())
+            if 'maximo' in operaciones:
+                pendientes.setdefault('maximos', []).append(agrupado[variables_numericas].max())
+
+            if any(op in ['suma', 'media', 'conteo', 'desviacion_estandar'] for op in operaciones):
+                no_nulos = agrupado[variables_numericas].count()
+                if 'desviacion_estandar' in operaciones:
+                    medias = agrupado[variables_numericas].mean()
+                    desviaciones = df[variables_numericas] - agrupado[variables_numericas].transform('mean')
+                    m2 = (desviaciones**2).groupby([df[var] for var in ids], observed=True).sum()
+                    pendientes.setdefault('momentos', []).append((no_nulos, medias, m2))
+                pendientes.setdefault('no_nulos', []).append(no_nulos)
+
+            if any(op == 'mediana' or Preprocesador.obtener_percentil(op) is not None for op in operaciones):
+                histograma = (
+                    df.melt(id_vars=ids, value_vars=variables_numericas, var_name='variable', value_name='valor')
+                    .dropna(subset=['valor'])
+                    .groupby(ids + ['variable', 'valor'], observed=True)
+                    .size()
+                    .to_frame('conteo')
+                )
+                pendientes.setdefault('histograma', []).append(histograma)
+
+        self.chunks_pendientes += 1
+        if self.chunks_pendientes >= CHUNKS_POR_COMBINACION:
+            self.__reducir()
+
+    def __calcular_cuantiles(self, histograma:pd.DataFrame, variables:list, operaciones:list) -> dict:
+
+        # el histograma esta ordenado por grupo, variable y valor; cada cuantil se ubica con los conteos acumulados.
+        # La mediana promedia los dos valores centrales (como groupby.median) y los percentiles interpolan
+        # linealmente entre las posiciones vecinas (como groupby.quantile)
+
+        ids = self.variables_id_agrupacion
+        df = histograma.reset_index()
+        llaves = ids + ['variable']
+        conteos = df['conteo'].to_numpy()
+        acumulado = df.groupby(llaves, sort=False, observed=True)['conteo'].cumsum().to_numpy()
+        total = df.groupby(llaves, sort=False, observed=True)['conteo'].transform('sum').to_numpy()
+        previo = acumulado - conteos
+
+        fracciones = {}
+        for j, op in enumerate(operaciones):
+            if op == 'mediana':
+                posicion_inferior = (total - 1) // 2
+                posicion_superior = total // 2
+            else:
+                posicion = Preprocesador.obtener_percentil(op) * (total - 1)
+                posicion_inferior = np.floor(posicion).astype(np.int64)
+                fracciones[op] = posicion % 1
+                posicion_superior = posicion_inferior + (fracciones[op] > 0)
+                df[f'fraccion_{j}'] = fracciones[op]
+            df[f'inferior_{j}'] = np.where((previo <= posicion_inferior) & (acumulado > posicion_inferior), df['valor'], np.nan)
+            df[f'superior_{j}'] = np.where((previo <= posicion_superior) & (acumulado > posicion_superior), df['valor'], np.nan)
+
+        columnas = [col for col in df.columns if col.startswith(('inferior_', 'superior_', 'fraccion_'))]
+        extremos = df.groupby(llaves, observed=True)[columnas].max()
+
+        cuantiles = {}
+        for j, op in enumerate(operaciones):
+            inferior = extremos[f'inferior_{j}']
+            superior = extremos[f'superior_{j}']
+            if op == 'mediana':
+                cuantil = (inferior + superior) / 2
+            else:
+                fraccion = extremos[f'fraccion_{j}']
+                cuantil = inferior.where(fraccion == 0, inferior + (superior - inferior) * fraccion)
+            cuantiles[op] = cuantil.unstack('variable').reindex(columns=variables)
+
+        return cuantiles
+
+    def guardar_estado(self, ruta:str):
+
+        if not isinstance(ruta, str):
+            raise TypeError('El parámetro ruta debe ser de tipo str')
+
+        self.__reducir()
+        if self.estado_total is None:
+            raise ValueError('No se ha agregado ningún bloque de datos al acumulador')
+
+        estado = {
+            'version': VERSION_ESTADO,
+            'variables_id_agrupacion': self.variables_id_agrupacion,
+            'agrupaciones': self.agrupaciones,
+            'configuracion': self.configuracion,
+            'suma_exacta': self.suma_exacta,
+            'estado_total': self.estado_total,
+            'estados': self.estados,
+            'variables_no_numericas': self.variables_no_numericas
+        }
+
+        # se escribe a un archivo temporal y se renombra, un proceso interrumpido no deja un estado incompleto
+        ruta_temporal = f'{ruta}.{os.getpid()}.tmp'
+        with open(ruta_temporal, 'wb') as f:
+            pickle.dump(estado, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(ruta_temporal, ruta)
+
+    @classmethod
+    def cargar_estado(cls, ruta:str, variables_id_agrupacion:list, agrupaciones:list, configuracion:dict=None):
+
+        # el estado solo se puede continuar con las mismas llaves, las mismas agrupaciones (variables y operaciones)
+        # y la misma configuracion de agrupacion y agregacion
+
+        if not isinstance(ruta, str):
+            raise TypeError('El parámetro ruta debe ser de tipo str')
+        if not os.path.exists(ruta):
+            raise FileNotFoundError(f'La ruta especificada para el estado de agregados no existe ({ruta})')
+        with open(ruta, 'rb') as f:
+            estado = pickle.load(f)
+
+        if not isinstance(estado, dict) or estado.get('version') != VERSION_ESTADO:
+            raise ValueError(f'El estado de agregados {ruta} no es compatible con esta versión, se debe recalcular sobre el dataset completo')
+        acumulador = cls(variables_id_agrupacion=variables_id_agrupacion, agrupaciones=agrupaciones, configuracion=configuracion, suma_exacta=estado['suma_exacta'])
+        configuracion_estado = estado.get('configuracion', {})
+        campos_distintos = sorted(
+            campo for campo in set(configuracion_estado) | set(acumulador.configuracion)
+            if configuracion_estado.get(campo) != acumulador.configuracion.get(campo)
+        )
+        if len(campos_distintos) > 0:
+            raise ValueError(f'La configuración no coincide con la del estado de agregados (campos: {", ".join(campos_distintos)}), se debe recalcular sobre el dataset completo')
+        if estado['variables_id_agrupacion'] != acumulador.variables_id_agrupacion:
+            raise ValueError('Las variables identificadoras no coinciden con las del estado de agregados, se debe recalcular sobre el dataset completo')
+        if estado['agrupaciones'] != acumulador.agrupaciones:
+            raise ValueError('Las agrupaciones no coinciden con las del estado de agregados, se debe recalcular sobre el dataset completo')
+
+        acumulador.estado_total = estado['estado_total']
+        acumulador.estados = estado['estados']
+        acumulador.variables_no_numericas = estado['variables_no_numericas']
+        return acumulador
+
+    def resultados(self, conteos_dispersos:bool=False) -> list:
+
+        # con conteos_dispersos los bloques categoricos se regresan en formato disperso (Preprocesador.dispersar_conteos_categoricos)
+        if not isinstance(conteos_dispersos, bool):
+            raise TypeError('El parámetro conteos_dispersos debe ser de tipo bool')
+
+        self.__reducir()
+
+        if self.estado_total is None:
+            raise ValueError('No se ha agregado ningún bloque de datos al acumulador')
+
+        ids = self.variables_id_agrupacion
+        resultados_dfs = [self.estado_total.reset_index()]
+
+        for i, agrupacion in enumerate(self.agrupaciones):
+
+            estado = self.estados[i]
+
+            if agrupacion['tipo_variables'] == 'categorico':
+                df_conteos = estado['conteos'].reset_index()
+                if conteos_dispersos:
+                    df_agregado = Preprocesador.dispersar_conteos_categoricos(df_conteos=df_conteos, variables_id_agrupacion=ids)
+                else:
+                    df_agregado = Preprocesador.pivotear_conteos_categoricos(df_conteos=df_conteos, variables_id_agrupacion=ids)
+                resultados_dfs.append(df_agregado)
+                continue
+
+            variables = [var for var in dict.fromkeys(agrupacion['variables']) if var not in self.variables_no_numericas[i] and var not in ids]
+
+            operaciones = Preprocesador.normalizar_operaciones(agrupacion['operacion'])
+            grupos = estado['filas'].index
+            operaciones_cuantiles = [op for op in operaciones if op == 'mediana' or Preprocesador.obtener_percentil(op) is not None]
+            cuantiles = self.__calcular_cuantiles(estado['histograma'], variables, operaciones_cuantiles) if len(operaciones_cuantiles) > 0 else {}
+
+            sumas = None
+            if 'sumas' in estado:
+                sumas = estado['sumas'].reindex(index=grupos, columns=variables)
+                sumas = sumas.apply(lambda col: col.map(float) if col.dtype == object else col)
+
+            resultados_operaciones = []
+            for operacion in operaciones:
+                if operacion == 'suma':
+                    df_operacion = sumas.copy()
+                elif operacion == 'media':
+                    df_operacion = sumas.astype(float) / estado['no_nulos'].reindex(index=grupos, columns=variables)
+                elif operacion == 'conteo':
+                    df_operacion = estado['no_nulos'].reindex(index=grupos, columns=variables)
+                elif operacion == 'minimo':
+                    df_operacion = estado['minimos'].reindex(index=grupos, columns=variables)
+                elif operacion == 'maximo':
+                    df_operacion = estado['maximos'].reindex(index=grupos, columns=variables)
+                elif operacion == 'desviacion_estandar':
+                    # desviacion estandar muestral (ddof=1), como groupby.std
+                    no_nulos = estado['no_nulos'].reindex(index=grupos, columns=variables)
+                    with np.errstate(invalid='ignore', divide='ignore'):
+                        df_operacion = np.sqrt(estado['m2'].reindex(index=grupos, columns=variables) / (no_nulos - 1).where(no_nulos > 1))
+                else:
+                    df_operacion = cuantiles[operacion].reindex(index=grupos)
+                df_operacion.columns = [f'{operacion}::{var}' for var in df_operacion.columns]
+                resultados_operaciones.append(df_operacion)
+
+            df_agregado = pd.concat(resultados_operaciones, axis=1)
+            resultados_dfs.append(df_agregado.reset_index())
+
+        return resultados_dfs
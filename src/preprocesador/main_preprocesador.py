@@ -2,13 +2,25 @@ import os
 import argparse
 import json
 import pandas as pd
-import functools
-from utils.regex_utils import obtener_variables_regex_df
+from utils.regex_utils import SelectorColumnas
+from utils.io_utils import escribir_tabla
+from utils.conteos_dispersos import rutas_conteos_dispersos, a_coordenadas
+from utils.instrumentacion import Instrumentador, ruta_reporte_instrumentacion
 from preprocesador.preprocesador import Preprocesador
+from preprocesador.acumulador_agregados import AcumuladorAgregados
+
+# campos de configuracion de agrupacion y agregacion con los que se construye el estado de agregados
+CAMPOS_CONFIGURACION_ESTADO = [
+    'variables_identificadoras_list',
+    'variables_a_agrupar',
+    'columna_metadatos_nombres',
+    'columna_metadatos_posibles_valores'
+]
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Procesador de datos C3')
     parser.add_argument('--config', type=str, required=True, help='Archivo de configuración')
+    parser.add_argument('--ruta-delta', type=str, default=None, help='Archivo con solo las filas nuevas: se combinan con el estado de agregados guardado (campo ruta_estado_agregados) en lugar de procesar el dataset completo')
     args = parser.parse_args()
     
     with open(args.config) as f:
@@ -19,19 +31,42 @@ if __name__ == '__main__':
     if 'ruta_csv_dataset' not in preprocesador_config:
         raise ValueError('El archivo JSON pasado para --config debe tener el campo ruta_csv_dataset')
     ruta_csv_dataset = preprocesador_config['ruta_csv_dataset']
-    if not os.path.exists(ruta_csv_dataset):
+    
+    # estado de agregados opcional: se guarda junto a la salida y permite procesar despues solo las filas nuevas (--ruta-delta)
+    
+    ruta_estado_agregados = preprocesador_config.get('ruta_estado_agregados')
+    if ruta_estado_agregados is not None and not isinstance(ruta_estado_agregados, str):
+        raise TypeError('El valor asociado al campo ruta_estado_agregados debe ser de tipo str')
+    if args.ruta_delta is not None:
+        if ruta_estado_agregados is None:
+            raise ValueError('La opción --ruta-delta requiere el campo ruta_estado_agregados en el archivo JSON pasado para --config')
+        if not os.path.exists(ruta_estado_agregados):
+            raise FileNotFoundError(f'La ruta especificada para el estado de agregados no existe ({ruta_estado_agregados}), se debe procesar primero el dataset completo')
+        if not os.path.exists(args.ruta_delta):
+            raise FileNotFoundError(f'La ruta especificada para el archivo .csv de filas nuevas no existe ({args.ruta_delta})')
+    elif not os.path.exists(ruta_csv_dataset):
         raise FileNotFoundError(f'La ruta especificada para el archivo .csv del dataset no existe ({ruta_csv_dataset})')
-    df = pd.read_csv(ruta_csv_dataset, dtype=str)
-    if 'Unnamed: 0' in df.columns:
-        df.drop(columns=['Unnamed: 0'], inplace=True)
+    ruta_lectura_dataset = args.ruta_delta if args.ruta_delta is not None else ruta_csv_dataset
+    
+    # instrumentacion opcional: tiempo, filas, columnas y memoria de cada etapa en un reporte JSON junto a la salida
+    
+    instrumentar = preprocesador_config.get('instrumentar', False)
+    if not isinstance(instrumentar, bool):
+        raise TypeError('El valor asociado al campo instrumentar debe ser de tipo bool')
+    instrumentar_tracemalloc = preprocesador_config.get('instrumentar_tracemalloc', False)
+    if not isinstance(instrumentar_tracemalloc, bool):
+        raise TypeError('El valor asociado al campo instrumentar_tracemalloc debe ser de tipo bool')
+    instrumentador = Instrumentador(activo=instrumentar, medir_tracemalloc=instrumentar_tracemalloc)
     
     if 'ruta_csv_metadatos' not in preprocesador_config:
         raise ValueError('El archivo JSON pasado para --config debe tener el campo ruta_csv_metadatos')
     ruta_csv_metadatos = preprocesador_config['ruta_csv_metadatos']
     if not os.path.exists(ruta_csv_metadatos):
         raise FileNotFoundError(f'La ruta especificada para el archivo .csv de metadatos no existe ({ruta_csv_metadatos})')
-    metadatos = pd.read_csv(ruta_csv_metadatos, dtype=str)
-    if 'Unnamed: 0' in df.columns:
+    with instrumentador.etapa('carga_metadatos', ruta=ruta_csv_metadatos) as registro:
+        metadatos = pd.read_csv(ruta_csv_metadatos, dtype=str)
+        registro['filas'], registro['columnas'] = metadatos.shape
+    if 'Unnamed: 0' in metadatos.columns:
         metadatos.drop(columns=['Unnamed: 0'], inplace=True)
     
     if 'ruta_salida_dataset' not in preprocesador_config:
@@ -42,6 +77,19 @@ if __name__ == '__main__':
         raise ValueError('El archivo JSON pasado para --config debe tener el campo ruta_salida_diccionario_traducciones')
     ruta_salida_diccionario_traducciones = preprocesador_config['ruta_salida_diccionario_traducciones']
     
+    # conteos categoricos dispersos opcionales: los bloques categoricos no se agregan como columnas densas a la salida,
+    # se escriben como tabla de coordenadas (llaves, columna, conteo) mas un indice de columnas (utils.conteos_dispersos)
+    
+    conteos_categoricos_dispersos = preprocesador_config.get('conteos_categoricos_dispersos', False)
+    if not isinstance(conteos_categoricos_dispersos, bool):
+        raise TypeError('El valor asociado al campo conteos_categoricos_dispersos debe ser de tipo bool')
+    ruta_salida_conteos_categoricos, ruta_salida_columnas_categoricas = rutas_conteos_dispersos(ruta_salida_dataset)
+    ruta_salida_conteos_categoricos = preprocesador_config.get('ruta_salida_conteos_categoricos', ruta_salida_conteos_categoricos)
+    ruta_salida_columnas_categoricas = preprocesador_config.get('ruta_salida_columnas_categoricas', ruta_salida_columnas_categoricas)
+    for campo, valor in [('ruta_salida_conteos_categoricos', ruta_salida_conteos_categoricos), ('ruta_salida_columnas_categoricas', ruta_salida_columnas_categoricas)]:
+        if not isinstance(valor, str):
+            raise TypeError(f'El valor asociado al campo {campo} debe ser de tipo str')
+    
     # validacion de columnas indispensables (nombre y posibles valores)
     
     if 'columna_metadatos_nombres' not in preprocesador_config:
@@ -96,30 +144,6 @@ if __name__ == '__main__':
             raise TypeError('El valor asociado al campo valores_a_excluir debe ser de tipo list')
     '''
 
-    # definicion de preprocesador segun datos especificados en la configuracion
-
-    preprocesador = Preprocesador(
-        df=df, 
-        metadatos=metadatos,
-        columna_metadatos_nombres=columna_metadatos_nombres,
-        columna_metadatos_posibles_valores=columna_metadatos_posibles_valores
-    )
-    
-    preprocesador.eliminar_cadenas_vacias()
-        
-    '''
-    if columna_metadatos_tipos is not None:
-        preprocesador.convertir_tipos(
-            columna_metadatos_tipos=columna_metadatos_tipos)
-    
-    
-    if columna_metadatos_filtro_excluir is not None:
-        preprocesador.excluir_variables(
-            columna_metadatos_filtro_excluir=columna_metadatos_filtro_excluir, 
-            valores_a_excluir=valores_a_excluir
-        )
-    '''
-    
     # validacion de existencia de variables identificadoras
     
     if 'variables_identificadoras_list' not in preprocesador_config:
@@ -136,16 +160,15 @@ if __name__ == '__main__':
     if not isinstance(variables_a_agrupar, list):
         raise TypeError('El valor asociado al campo variables_a_agrupar debe ser de tipo list')
     
+    # resolucion de las variables de cada agrupacion contra el encabezado del dataset, antes de leer filas:
+    # solo se cargan las variables identificadoras y las variables que alguna agrupacion utiliza
     
-    # agrupaciones a realizar
-    
-    resultados_dfs = []
-    resultados_traducciones = []
-    
-    resultados_dfs.append(preprocesador.agrupar_total_datos(variables_id_agrupacion=variables_identificadoras_list))
-    resultados_traducciones.append(preprocesador.generar_diccionario_total_datos())
+    columnas_dataset = [col for col in pd.read_csv(ruta_lectura_dataset, nrows=0).columns if col != 'Unnamed: 0']
+    conjunto_columnas_dataset = set(columnas_dataset)
+    selector_columnas = SelectorColumnas(columnas_dataset)
     
-    for agrupacion in variables_a_agrupar:
+    agrupaciones = []
+    for i, agrupacion in enumerate(variables_a_agrupar):
         
         # validacion de estructura de agrupacion a realizar
         
@@ -155,7 +178,8 @@ if __name__ == '__main__':
         if 'tipo_variables' not in agrupacion.keys():
             raise ValueError('El campo agrupacion debe tener una llave tipo_variables')
         tipo_variables = agrupacion['tipo_variables']
-        print(f"Comenzando arupación de variables de tipo {tipo_variables}")
+        if tipo_variables not in ['categorico', 'numerico']:
+            raise ValueError('El valor de tipo_variables debe ser una de las cadenas: categorico, numerico')
         
         if 'variables_a_agrupar_list' not in agrupacion.keys():
             raise ValueError('El campo agrupacion debe tener una llave variables_a_agrupar_list')
@@ -171,72 +195,254 @@ if __name__ == '__main__':
         
         variables_a_agrupar_total = set(variables_a_agrupar_list)
         
-        for regex in variables_a_agrupar_regex:
-            #print(f"Procesando regex {regex}")
-            variables_a_agrupar_total = variables_a_agrupar_total | set(obtener_variables_regex_df(regex=regex, df=preprocesador.df))
+        with instrumentador.etapa('seleccion_regex', bloque=i, regex=variables_a_agrupar_regex, columnas=len(columnas_dataset)):
+            for variables in selector_columnas.seleccionar_lote(variables_a_agrupar_regex).values():
+                variables_a_agrupar_total = variables_a_agrupar_total | set(variables)
         
         if variables_a_agrupar_clasificacion_metadatos is not None:
             columna_metadatos_filtro = variables_a_agrupar_clasificacion_metadatos['columna_metadatos_filtro']
             valores = variables_a_agrupar_clasificacion_metadatos['valores']
             
-            #print(f"Se filtrarán las variables clasificadas con los valores {valores} en la columna {columna_metadatos_filtro} de los metadatos")
-            metadatos_filtrados = preprocesador.metadatos.loc[preprocesador.metadatos[columna_metadatos_filtro].isin(valores)]
-            variables_filtradas_clasificacion_metadatos = [var for var in metadatos_filtrados[columna_metadatos_nombres] if var in preprocesador.df.columns]    
+            metadatos_filtrados = metadatos.loc[metadatos[columna_metadatos_filtro].isin(valores)]
+            variables_filtradas_clasificacion_metadatos = [var for var in metadatos_filtrados[columna_metadatos_nombres] if var in conjunto_columnas_dataset]    
             variables_a_agrupar_total = variables_a_agrupar_total | set(variables_filtradas_clasificacion_metadatos)
             
         variables_a_agrupar_total = sorted(variables_a_agrupar_total)
-        print(f"Variables a agrupar según filtros: {variables_a_agrupar_total}")
+        print(f"Variables a agrupar de tipo {tipo_variables} según filtros: {variables_a_agrupar_total}")
         
-        # agrupacion segun tipo de variables
+        if tipo_variables == 'numerico':
+            if 'operacion' not in agrupacion.keys():
+                raise ValueError('El campo agrupacion debe tener una llave operacion cuando se selecciona el valor numerico para tipo_variables')
+            Preprocesador.normalizar_operaciones(agrupacion['operacion']) # una operacion o una lista de operaciones
+            agrupaciones.append({'tipo_variables': tipo_variables, 'variables': variables_a_agrupar_total, 'operacion': agrupacion['operacion']})
+        else:
+            agrupaciones.append({'tipo_variables': tipo_variables, 'variables': variables_a_agrupar_total})
+    
+    if conteos_categoricos_dispersos and not any(agrupacion['tipo_variables'] == 'categorico' for agrupacion in agrupaciones):
+        print('Advertencia: no hay agrupaciones de tipo categorico, el campo conteos_categoricos_dispersos no tiene efecto')
+        conteos_categoricos_dispersos = False
+    
+    # las variables que no existen en el encabezado no se cargan y se reportan al agrupar, como antes
+    
+    columnas_utilizadas = set(variables_identificadoras_list).union(*(agrupacion['variables'] for agrupacion in agrupaciones))
+    columnas_a_cargar = [col for col in columnas_dataset if col in columnas_utilizadas]
+    print(f'Se cargarán {len(columnas_a_cargar)} de {len(columnas_dataset)} columnas del dataset')
+    
+    # lectura completa del dataset (solo columnas utilizadas), o por chunks combinando agregados parciales cuando se especifica tamano_chunk
+    
+    tamano_chunk = preprocesador_config.get('tamano_chunk')
+    if tamano_chunk is not None:
+        if not isinstance(tamano_chunk, int):
+            raise TypeError('El valor asociado al campo tamano_chunk debe ser de tipo int')
+        if tamano_chunk < 1:
+            raise ValueError('El valor asociado al campo tamano_chunk debe ser mayor o igual a 1')
         
-        if tipo_variables == 'categorico':
-            
-            df_agregado = preprocesador.agrupar_variables_categoricas(
-                variables_id_agrupacion=variables_identificadoras_list,
-                variables_a_agrupar=variables_a_agrupar_total
-            )
+        # medianas y percentiles necesitan todos los valores de cada grupo, no tienen un estado parcial acotado por chunk
+        for agrupacion in agrupaciones:
+            if agrupacion['tipo_variables'] != 'numerico':
+                continue
+            operaciones_cuantiles = [
+                op for op in Preprocesador.normalizar_operaciones(agrupacion['operacion'])
+                if op == 'mediana' or Preprocesador.obtener_percentil(op) is not None
+            ]
+            if len(operaciones_cuantiles) > 0:
+                raise ValueError(f'Las operaciones {", ".join(operaciones_cuantiles)} no se pueden calcular por chunks (campo tamano_chunk), pues requieren todos los valores de cada grupo; se deben calcular con lectura completa del dataset')
+    
+    # suma exacta opcional: sumas y medias con un solo redondeo por grupo (math.fsum), de modo que la lectura completa,
+    # por chunks y con estado de agregados dan el mismo resultado; sin ella se usa groupby.sum/mean y el modo por chunks
+    # difiere de la lectura completa solo por redondeo (en el orden de n * 1e-16 relativo para n filas por grupo)
+    
+    suma_exacta = preprocesador_config.get('suma_exacta', False)
+    if not isinstance(suma_exacta, bool):
+        raise TypeError('El valor asociado al campo suma_exacta debe ser de tipo bool')
+    
+    # con estado de agregados se utiliza el acumulador aunque el dataset se lea completo
+    usar_acumulador = tamano_chunk is not None or ruta_estado_agregados is not None
+    
+    # ingestion compacta: las columnas se leen como categoricas (un codigo entero por celda) y las variables que solo
+    # se agrupan como numericas se convierten a tipos numericos reducidos; los resultados no cambian
+    
+    ingestion_compacta = preprocesador_config.get('ingestion_compacta', False)
+    if not isinstance(ingestion_compacta, bool):
+        raise TypeError('El valor asociado al campo ingestion_compacta debe ser de tipo bool')
+    tipo_lectura = 'category' if ingestion_compacta else str
+    variables_categoricas = {var for agrupacion in agrupaciones if agrupacion['tipo_variables'] == 'categorico' for var in agrupacion['variables']}
+    variables_solo_numericas = [
+        var for var in columnas_a_cargar
+        if var not in variables_categoricas and var not in variables_identificadoras_list
+    ]
+    
+    with instrumentador.etapa('carga', ruta=ruta_lectura_dataset, tamano_chunk=tamano_chunk, columnas_dataset=len(columnas_dataset), ingestion_compacta=ingestion_compacta) as registro:
+        if tamano_chunk is not None:
+            lector_chunks = pd.read_csv(ruta_lectura_dataset, dtype=tipo_lectura, usecols=columnas_a_cargar, chunksize=tamano_chunk)
+            df = next(lector_chunks)
+        else:
+            lector_chunks = []
+            df = pd.read_csv(ruta_lectura_dataset, dtype=tipo_lectura, usecols=columnas_a_cargar)
+        registro['filas'], registro['columnas'] = df.shape
+    
+    # definicion de preprocesador segun datos especificados en la configuracion
 
-            resultados_dfs.append(df_agregado)
+    preprocesador = Preprocesador(
+        df=df, 
+        metadatos=metadatos,
+        columna_metadatos_nombres=columna_metadatos_nombres,
+        columna_metadatos_posibles_valores=columna_metadatos_posibles_valores
+    )
+    
+    with instrumentador.etapa('normalizacion', filas=df.shape[0], columnas=df.shape[1]):
+        preprocesador.normalizar_cadenas()
+    if ingestion_compacta:
+        with instrumentador.etapa('compactacion', filas=df.shape[0], columnas=len(variables_solo_numericas)):
+            preprocesador.compactar_tipos(variables_numericas=variables_solo_numericas)
         
-            diccionario_traducciones = preprocesador.generar_diccionario_traducciones_variables_categoricas(
-                variables=variables_a_agrupar_total, 
-                columna_metadatos_alias=columna_metadatos_alias, 
-                columna_metadatos_posibles_valores_alias=columna_metadatos_posibles_valores_alias
-            )
+    '''
+    if columna_metadatos_tipos is not None:
+        preprocesador.convertir_tipos(
+            columna_metadatos_tipos=columna_metadatos_tipos)
+    
+    
+    if columna_metadatos_filtro_excluir is not None:
+        preprocesador.excluir_variables(
+            columna_metadatos_filtro_excluir=columna_metadatos_filtro_excluir, 
+            valores_a_excluir=valores_a_excluir
+        )
+    '''
+    
+    # agrupaciones a realizar
+    
+    resultados_dfs = []
+    resultados_traducciones = []
+    
+    if not usar_acumulador:
+        with instrumentador.etapa('agrupacion_total', filas=len(preprocesador.df)):
+            resultados_dfs.append(preprocesador.agrupar_total_datos(variables_id_agrupacion=variables_identificadoras_list))
+    resultados_traducciones.append(preprocesador.generar_diccionario_total_datos())
+    
+    for i, agrupacion in enumerate(agrupaciones):
+        
+        tipo_variables = agrupacion['tipo_variables']
+        variables_a_agrupar_total = agrupacion['variables']
+        print(f"Comenzando arupación de variables de tipo {tipo_variables}")
+        
+        # agrupacion segun tipo de variables
+        
+        with instrumentador.etapa('agrupacion', bloque=i, tipo_variables=tipo_variables, filas=len(preprocesador.df), columnas=len(variables_a_agrupar_total)):
             
-            resultados_traducciones.append(diccionario_traducciones)
+            if tipo_variables == 'categorico':
             
-        elif tipo_variables == 'numerico':
+                if not usar_acumulador and conteos_categoricos_dispersos:
+                    df_conteos = preprocesador.contar_variables_categoricas(
+                        variables_id_agrupacion=variables_identificadoras_list,
+                        variables_a_agrupar=variables_a_agrupar_total
+                    )
+                    df_agregado = Preprocesador.dispersar_conteos_categoricos(
+                        df_conteos=df_conteos,
+                        variables_id_agrupacion=variables_identificadoras_list
+                    )
+                    
+                    resultados_dfs.append(df_agregado)
+                
+                elif not usar_acumulador:
+                    df_agregado = preprocesador.agrupar_variables_categoricas(
+                        variables_id_agrupacion=variables_identificadoras_list,
+                        variables_a_agrupar=variables_a_agrupar_total
+                    )
+                
+                    resultados_dfs.append(df_agregado)
+        
+                diccionario_traducciones = preprocesador.generar_diccionario_traducciones_variables_categoricas(
+                    variables=variables_a_agrupar_total, 
+                    columna_metadatos_alias=columna_metadatos_alias, 
+                    columna_metadatos_posibles_valores_alias=columna_metadatos_posibles_valores_alias
+                )
             
-            if 'operacion' not in agrupacion.keys():
-                raise ValueError('El campo agrupacion debe tener una llave operacion cuando se selecciona el valor numerico para tipo_variables')
-            operacion = agrupacion['operacion']
+                resultados_traducciones.append(diccionario_traducciones)
             
-            df_agregado = preprocesador.agrupar_variables_numericas(
-                variables_id_agrupacion=variables_identificadoras_list,
-                variables_a_agrupar=variables_a_agrupar_total,
-                operacion=operacion
-            )
-
-            resultados_dfs.append(df_agregado)
+            elif tipo_variables == 'numerico':
             
-            diccionario_traducciones = preprocesador.generar_diccionario_traducciones_variables_numericas(
-                variables=variables_a_agrupar_total, 
-                columna_metadatos_alias=columna_metadatos_alias, 
-                operacion=operacion
-            )
+                operacion = agrupacion['operacion']
             
-            resultados_traducciones.append(diccionario_traducciones)
+                if not usar_acumulador:
+                    df_agregado = preprocesador.agrupar_variables_numericas(
+                        variables_id_agrupacion=variables_identificadoras_list,
+                        variables_a_agrupar=variables_a_agrupar_total,
+                        operacion=operacion,
+                        suma_exacta=suma_exacta
+                    )
+                
+                    resultados_dfs.append(df_agregado)
             
-        else:
-            raise ValueError('El valor de tipo_variables debe ser una de las cadenas: categorico, numerico')
+                diccionario_traducciones = preprocesador.generar_diccionario_traducciones_variables_numericas(
+                    variables=variables_a_agrupar_total, 
+                    columna_metadatos_alias=columna_metadatos_alias, 
+                    operacion=operacion
+                )
+            
+                resultados_traducciones.append(diccionario_traducciones)
         
+    # en el modo por chunks se acumulan los agregados parciales de cada chunk y se combinan al final;
+    # con --ruta-delta el acumulador parte del estado guardado y solo se agregan las filas nuevas
+    
+    if usar_acumulador:
+        # campos del archivo de configuracion que determinan los agregados, se registran en el estado guardado
+        configuracion_estado = {campo: preprocesador_config.get(campo) for campo in CAMPOS_CONFIGURACION_ESTADO}
+        configuracion_estado['suma_exacta'] = suma_exacta
+        if args.ruta_delta is not None:
+            with instrumentador.etapa('carga_estado_agregados', ruta=ruta_estado_agregados):
+                acumulador = AcumuladorAgregados.cargar_estado(
+                    ruta=ruta_estado_agregados,
+                    variables_id_agrupacion=variables_identificadoras_list,
+                    agrupaciones=agrupaciones,
+                    configuracion=configuracion_estado
+                )
+        else:
+            acumulador = AcumuladorAgregados(
+                variables_id_agrupacion=variables_identificadoras_list,
+                agrupaciones=agrupaciones,
+                configuracion=configuracion_estado,
+                suma_exacta=suma_exacta
+            )
+        with instrumentador.etapa('agregacion_chunk', chunk=1, filas=len(preprocesador.df)):
+            acumulador.agregar(preprocesador)
+        for i, chunk in enumerate(lector_chunks):
+            print(f'Agregando chunk {i+2} del dataset')
+            with instrumentador.etapa('agregacion_chunk', chunk=i+2, filas=len(chunk)):
+                preprocesador_chunk = Preprocesador(
+                    df=chunk,
+                    metadatos=metadatos,
+                    columna_metadatos_nombres=columna_metadatos_nombres,
+                    columna_metadatos_posibles_valores=columna_metadatos_posibles_valores
+                )
+                preprocesador_chunk.normalizar_cadenas()
+                if ingestion_compacta:
+                    preprocesador_chunk.compactar_tipos(variables_numericas=variables_solo_numericas)
+                acumulador.agregar(preprocesador_chunk)
+        with instrumentador.etapa('combinacion_chunks'):
+            resultados_dfs = acumulador.resultados(conteos_dispersos=conteos_categoricos_dispersos)
+        if ruta_estado_agregados is not None:
+            with instrumentador.etapa('escritura_estado_agregados', ruta=ruta_estado_agregados):
+                acumulador.guardar_estado(ruta_estado_agregados)
+            print(f'Estado de agregados guardado en la ruta {ruta_estado_agregados}')
+    
     # hacer join de todas las agrupaciones realizadas
     
-    join_dfs = functools.reduce(
-        lambda left, right: pd.merge(left, right, on=variables_identificadoras_list, how='inner'),
-        resultados_dfs
-    )
+    with instrumentador.etapa('union', columnas=sum(df_agregado.shape[1] for df_agregado in resultados_dfs)) as registro:
+        if conteos_categoricos_dispersos:
+            # resultados_dfs tiene el conteo total seguido de un resultado por agrupacion, en el mismo orden
+            es_categorico = [False] + [agrupacion['tipo_variables'] == 'categorico' for agrupacion in agrupaciones]
+            join_dfs, conteos_dispersos_df = Preprocesador.unir_agrupaciones_dispersas(
+                agrupaciones=[df_agregado for df_agregado, categorico in zip(resultados_dfs, es_categorico) if not categorico],
+                conteos_dispersos=[df_agregado for df_agregado, categorico in zip(resultados_dfs, es_categorico) if categorico],
+                variables_id_agrupacion=variables_identificadoras_list
+            )
+            registro['conteos_dispersos'] = len(conteos_dispersos_df)
+        else:
+            join_dfs = Preprocesador.unir_agrupaciones(
+                agrupaciones=resultados_dfs,
+                variables_id_agrupacion=variables_identificadoras_list
+            )
+        registro['filas'] = len(join_dfs)
     
     # combinar diccionarios obtenidos por cada agrupacion
 
@@ -247,8 +453,20 @@ if __name__ == '__main__':
     
     # convertir resultados a csv
     
-    join_dfs.to_csv(ruta_salida_dataset, index=False)
+    with instrumentador.etapa('escritura', filas=join_dfs.shape[0], columnas=join_dfs.shape[1], ruta=ruta_salida_dataset):
+        escribir_tabla(join_dfs, ruta_salida_dataset)
     print(f'Preprocesamiento creado en la ruta {ruta_salida_dataset}')
-    diccionario_final_df.to_csv(ruta_salida_diccionario_traducciones, index=False)
+    if conteos_categoricos_dispersos:
+        df_coordenadas, df_columnas = a_coordenadas(df_conteos=conteos_dispersos_df, variables_id_agrupacion=variables_identificadoras_list)
+        with instrumentador.etapa('escritura_conteos_categoricos', filas=len(df_coordenadas), columnas=len(df_columnas), ruta=ruta_salida_conteos_categoricos):
+            escribir_tabla(df_coordenadas, ruta_salida_conteos_categoricos)
+            escribir_tabla(df_columnas, ruta_salida_columnas_categoricas)
+        print(f'Conteos categóricos dispersos creados en las rutas {ruta_salida_conteos_categoricos} (coordenadas) y {ruta_salida_columnas_categoricas} (columnas)')
+    escribir_tabla(diccionario_final_df, ruta_salida_diccionario_traducciones)
     print(f'Diccionario de traducciones creado en la ruta {ruta_salida_diccionario_traducciones}')
+    
+    if instrumentar:
+        ruta_reporte = ruta_reporte_instrumentacion(ruta_salida_dataset)
+        instrumentador.escribir_reporte(ruta_reporte)
+        print(f'El reporte de instrumentación se encuentra en la ruta:\n{ruta_reporte}')
 
@@ -1,5 +1,14 @@
+import numpy as np
 import pandas as pd
+import re
 import ast
+import math
+import functools
+from fractions import Fraction
+
+# operaciones de agregacion numerica; ademas se aceptan percentiles de la forma percentil_XX (XX entre 0 y 100)
+OPERACIONES_NUMERICAS = ['suma', 'media', 'mediana', 'conteo', 'minimo', 'maximo', 'desviacion_estandar']
+PATRON_PERCENTIL = re.compile(r'percentil_(\d{1,3}(?:\.\d+)?)')
 
 class Preprocesador:
     
@@ -25,10 +34,107 @@ class Preprocesador:
             raise TypeError('El parámetro columna_metadatos_posibles_valores debe ser de tipo str')
         self.columna_metadatos_posibles_valores = columna_metadatos_posibles_valores
         
+        # indice de metadatos por nombre de variable (se conserva la primera fila de cada variable)
+        # y cache de las listas de posibles valores ya interpretadas con ast.literal_eval
+        self.indice_metadatos = self.metadatos.drop_duplicates(subset=[columna_metadatos_nombres], keep='first').set_index(columna_metadatos_nombres, drop=False)
+        self.__listas_metadatos = {}
+        
+        # indica si el DataFrame ya fue normalizado (cadenas sin espacios y cadenas vacias como NA)
+        self.normalizado = False
+        
     def eliminar_cadenas_vacias(self):
         
         self.df.replace(r'^\s*$', pd.NA, regex=True, inplace=True)
         
+    def normalizar_cadenas(self):
+        
+        # normalizacion unica posterior a la carga: elimina espacios al inicio y final y convierte cadenas vacias a NA,
+        # las agrupaciones posteriores omiten este trabajo
+        
+        for col in self.df.columns:
+            if isinstance(self.df[col].dtype, pd.CategoricalDtype):
+                self.df[col] = self.__normalizar_categorias(self.df[col])
+                continue
+            if not (pd.api.types.is_object_dtype(self.df[col]) or pd.api.types.is_string_dtype(self.df[col])):
+                continue
+            serie = self.df[col]
+            serie_sin_espacios = serie.str.strip()
+            serie = serie_sin_espacios.where(serie_sin_espacios.notna(), serie) # los valores que no son cadenas se conservan
+            self.df[col] = serie.mask(serie == '', pd.NA)
+        
+        self.normalizado = True
+    
+    def __normalizar_categorias(self, serie:pd.Series) -> pd.Series:
+        
+        # en columnas categoricas la normalizacion se aplica solo a las categorias; las categorias que coinciden
+        # despues de eliminar espacios se combinan y quedan ordenadas como cadenas, igual que al agrupar cadenas
+        
+        categorias = serie.cat.categories
+        if not (pd.api.types.is_object_dtype(categorias) or pd.api.types.is_string_dtype(categorias)):
+            return serie
+        categorias_sin_espacios = pd.Series(categorias, dtype=object).map(lambda x: x.strip() if isinstance(x, str) else x)
+        categorias_nuevas = sorted(set(categorias_sin_espacios) - {''})
+        posiciones = pd.Index(categorias_nuevas, dtype=object).get_indexer(categorias_sin_espacios) # las cadenas vacias quedan en -1 (NA)
+        codigos = serie.cat.codes.to_numpy()
+        codigos = np.where(codigos >= 0, posiciones[codigos], -1)
+        return pd.Series(pd.Categorical.from_codes(codigos, categories=pd.Index(categorias_nuevas, dtype=object)), index=serie.index, name=serie.name)
+    
+    def compactar_tipos(self, variables_numericas:list):
+        
+        # las columnas categoricas que solo se agrupan como numericas se guardan con el tipo numerico mas pequeño:
+        # enteros (nullable si tienen nulos) cuando todos sus valores son enteros, float64 en otro caso;
+        # las que contienen valores no numericos se conservan como categoricas
+        
+        if not isinstance(variables_numericas, list):
+            raise TypeError('El parámetro variables_numericas debe ser de tipo list')
+        
+        for var in dict.fromkeys(variables_numericas):
+            if var not in self.df.columns or not isinstance(self.df[var].dtype, pd.CategoricalDtype):
+                continue
+            serie = self.df[var].cat.remove_unused_categories()
+            try:
+                valores = pd.to_numeric(pd.Series(serie.cat.categories, dtype=object), errors='raise')
+            except Exception:
+                continue
+            
+            if pd.api.types.is_integer_dtype(valores):
+                codigos = serie.cat.codes.to_numpy()
+                nulos = codigos < 0
+                enteros = pd.to_numeric(valores, downcast='integer').to_numpy()[np.where(nulos, 0, codigos)]
+                arreglo = pd.arrays.IntegerArray(enteros, nulos) if nulos.any() else enteros
+                self.df[var] = pd.Series(arreglo, index=serie.index, name=var)
+            else:
+                self.df[var] = self.__convertir_a_numerico(serie)
+    
+    def __convertir_a_numerico(self, serie:pd.Series) -> pd.Series:
+        
+        # mismo resultado que pd.to_numeric sobre las cadenas originales: int64 cuando todos los valores son enteros
+        # y no hay nulos, float64 en otro caso; en columnas categoricas la conversion se hace una vez por categoria
+        
+        if not isinstance(serie, pd.Series):
+            return pd.to_numeric(serie, errors='raise')
+        
+        if isinstance(serie.dtype, pd.CategoricalDtype):
+            serie = serie.cat.remove_unused_categories()
+            codigos = serie.cat.codes.to_numpy()
+            nulos = codigos < 0
+            categorias = list(serie.cat.categories) + ([pd.NA] if nulos.any() else [])
+            valores = pd.to_numeric(pd.Series(categorias, dtype=object), errors='raise').to_numpy()
+            return pd.Series(valores[np.where(nulos, len(categorias) - 1, codigos)], index=serie.index, name=serie.name)
+        
+        if pd.api.types.is_integer_dtype(serie.dtype):
+            # enteros compactados (compactar_tipos)
+            return serie.astype('float64') if serie.isna().any() else serie.astype('int64')
+        
+        return pd.to_numeric(serie, errors='raise')
+    
+    def __seleccionar_columnas(self, columnas:list) -> pd.DataFrame:
+        
+        df = self.df.loc[:, columnas] # copia independiente, las conversiones posteriores no afectan a self.df
+        if not self.normalizado:
+            df = df.apply(lambda col: col.map(lambda x: x.strip() if isinstance(x, str) else x))
+        return df
+        
     def columnas_a_alias(self, columna_metadatos_alias:str):
         
         if not isinstance(columna_metadatos_alias, str):
@@ -58,6 +164,12 @@ class Preprocesador:
             except TypeError:
                 raise TypeError(f'El tipo {tipo} no es válido para la variable {var}')
 
+    def __obtener_lista_metadatos(self, variable:str, columna:str) -> list:
+        
+        if (variable, columna) not in self.__listas_metadatos:
+            self.__listas_metadatos[(variable, columna)] = ast.literal_eval(self.indice_metadatos.at[variable, columna])
+        return self.__listas_metadatos[(variable, columna)]
+
     def excluir_variables(self, columna_metadatos_filtro_excluir:str, valores_a_excluir:list):
 
         if not isinstance(columna_metadatos_filtro_excluir, str):
@@ -81,12 +193,11 @@ class Preprocesador:
 
         diccionario_traducciones = {}
         for variable in variables:
-            fila = self.metadatos[self.metadatos[self.columna_metadatos_nombres] == variable]
-            if fila.empty:
+            if variable not in self.indice_metadatos.index:
                 continue
-            variable_alias = fila[columna_metadatos_alias].values[0]
-            posibles_valores = ast.literal_eval(fila[self.columna_metadatos_posibles_valores].values[0])
-            posibles_valores_alias = ast.literal_eval(fila[columna_metadatos_posibles_valores_alias].values[0])
+            variable_alias = self.indice_metadatos.at[variable, columna_metadatos_alias]
+            posibles_valores = self.__obtener_lista_metadatos(variable, self.columna_metadatos_posibles_valores)
+            posibles_valores_alias = self.__obtener_lista_metadatos(variable, columna_metadatos_posibles_valores_alias)
             
             for valor, valor_alias in zip(posibles_valores, posibles_valores_alias):
                 diccionario_traducciones[f'{variable}-{valor}'] = f'{variable_alias}-{valor_alias}'
@@ -94,22 +205,22 @@ class Preprocesador:
         return diccionario_traducciones
     
     
-    def generar_diccionario_traducciones_variables_numericas(self, variables:list, columna_metadatos_alias:str, operacion:str):
+    def generar_diccionario_traducciones_variables_numericas(self, variables:list, columna_metadatos_alias:str, operacion):
         
         if not isinstance(variables, list):
             raise TypeError('El parámetro variables debe ser de tipo list')
         if not isinstance(columna_metadatos_alias, str):
             raise TypeError('El parámetro columna_metadatos_alias debe ser de tipo str')
-        if not isinstance(operacion, str):
-            raise TypeError('El parámetro operacion debe ser de tipo str')
+        operaciones = Preprocesador.normalizar_operaciones(operacion)
         
+        # mismo orden de columnas que agrupar_variables_numericas: por operacion y luego por variable
         diccionario_traducciones = {}
-        for variable in variables:
-            fila = self.metadatos[self.metadatos[self.columna_metadatos_nombres] == variable]
-            if fila.empty:
-                continue
-            variable_alias = fila[columna_metadatos_alias].values[0]
-            diccionario_traducciones[f'{operacion}::{variable}'] = f'{operacion}::{variable_alias}'
+        for operacion in operaciones:
+            for variable in variables:
+                if variable not in self.indice_metadatos.index:
+                    continue
+                variable_alias = self.indice_metadatos.at[variable, columna_metadatos_alias]
+                diccionario_traducciones[f'{operacion}::{variable}'] = f'{operacion}::{variable_alias}'
         
         return diccionario_traducciones
     
@@ -118,50 +229,151 @@ class Preprocesador:
         return {'conteo::total_datos':'conteo::total_datos'}
 
 
-    def agrupar_variables_categoricas(self, variables_id_agrupacion, variables_a_agrupar):
+    def __contar_codigos_categoricos(self, variables_id_agrupacion:list, variables_a_agrupar:list) -> tuple:
+        
+        # se factorizan los grupos (llaves de agrupacion) y cada variable categorica a codigos enteros,
+        # y los conteos de cada par (grupo, valor) se obtienen con np.bincount, sin formato largo intermedio
+        
+        df = self.__seleccionar_columnas(variables_id_agrupacion+variables_a_agrupar)
+
+        df = df.loc[:, ~df.columns.duplicated()] # si las variables de agrupacion se encuentran repetidas en las variables a agrupar, se eliminan
+        
+        agrupado = df.groupby(variables_id_agrupacion, sort=True, observed=True)
+        grupos = agrupado.size().index
+        codigos_grupos = agrupado.ngroup().to_numpy(dtype=np.float64) # las filas con llaves nulas no pertenecen a ningun grupo (NaN)
+        grupos_validos = ~np.isnan(codigos_grupos)
+        codigos_grupos = np.where(grupos_validos, codigos_grupos, 0).astype(np.int64)
+        
+        conteos = []
+        for var in sorted(set(variables_a_agrupar)):
+            codigos_valores, valores = pd.factorize(df[var], sort=True)
+            validos = grupos_validos & (codigos_valores >= 0)
+            n_valores = max(len(valores), 1)
+            llaves = codigos_grupos[validos] * n_valores + codigos_valores[validos]
+            
+            # conteo denso cuando la matriz grupos x valores es pequeña, disperso (np.unique) en otro caso
+            if len(grupos) * n_valores <= 4 * max(len(df), 1):
+                conteo = np.bincount(llaves, minlength=len(grupos) * n_valores)
+                llaves_presentes = np.flatnonzero(conteo)
+                conteo = conteo[llaves_presentes]
+            else:
+                llaves_presentes, conteo = np.unique(llaves, return_counts=True)
+            
+            conteos.append((var, np.asarray(valores, dtype=object), llaves_presentes // n_valores, llaves_presentes % n_valores, conteo.astype(np.int64)))
+        
+        return grupos, conteos
+    
+    
+    def contar_variables_categoricas(self, variables_id_agrupacion:list, variables_a_agrupar:list) -> pd.DataFrame:
         
         if not isinstance(variables_id_agrupacion, list):
             raise TypeError('El valor del parámetro variables_id_agrupacion debe ser de tipo list')
         
         if not isinstance(variables_a_agrupar, list):
             raise TypeError('El valor del parámetro variables_a_agrupar debe ser de tipo list')
-
-        df = self.df[variables_id_agrupacion+variables_a_agrupar]
-        df = df.apply(lambda col: col.map(lambda x: x.strip() if isinstance(x, str) else x))
-
-        df = df.loc[:, ~df.columns.duplicated()] # si las variables de agrupacion se encuentran repetidas en las variables a agrupar, se eliminan
-
-        df_melt = df.melt(
-            id_vars=variables_id_agrupacion,
-            value_vars=variables_a_agrupar,
-            var_name='característica',
-            value_name='observación'
-        )
         
-        df_conteos = (
-            df_melt
-            .groupby(variables_id_agrupacion + ['característica', 'observación'])
-            .size()
-            .reset_index(name='conteo')
-        )
+        grupos, conteos = self.__contar_codigos_categoricos(variables_id_agrupacion, variables_a_agrupar)
+        
+        codigos_grupos = np.concatenate([np.zeros(0, dtype=np.int64)] + [g for _, _, g, _, _ in conteos])
+        codigos_variables = np.concatenate([np.zeros(0, dtype=np.int64)] + [np.full(len(g), i) for i, (_, _, g, _, _) in enumerate(conteos)])
+        codigos_valores = np.concatenate([np.zeros(0, dtype=np.int64)] + [v for _, _, _, v, _ in conteos])
+        caracteristicas = np.concatenate([np.zeros(0, dtype=object)] + [np.full(len(g), var, dtype=object) for var, _, g, _, _ in conteos])
+        observaciones = np.concatenate([np.zeros(0, dtype=object)] + [valores[v] for _, valores, _, v, _ in conteos])
+        valores_conteos = np.concatenate([np.zeros(0, dtype=np.int64)] + [c for _, _, _, _, c in conteos])
+        
+        orden = np.lexsort((codigos_valores, codigos_variables, codigos_grupos))
+        
+        df_conteos = grupos.take(codigos_grupos[orden]).to_frame(index=False)
+        df_conteos['característica'] = caracteristicas[orden]
+        df_conteos['observación'] = observaciones[orden]
+        df_conteos['conteo'] = valores_conteos[orden]
+        
+        return df_conteos
+    
+    
+    @staticmethod
+    def pivotear_conteos_categoricos(df_conteos:pd.DataFrame, variables_id_agrupacion:list) -> pd.DataFrame:
+        
+        if not isinstance(df_conteos, pd.DataFrame):
+            raise TypeError('El valor del parámetro df_conteos debe ser de tipo pd.DataFrame')
+        
+        if not isinstance(variables_id_agrupacion, list):
+            raise TypeError('El valor del parámetro variables_id_agrupacion debe ser de tipo list')
+        
+        # se escribe la matriz ancha de conteos directamente a partir de los codigos de grupo y de columna
+        
+        agrupado_filas = df_conteos.groupby(variables_id_agrupacion, sort=True, observed=True)
+        agrupado_columnas = df_conteos.groupby(['característica', 'observación'], sort=True)
+        grupos = agrupado_filas.size().index
+        columnas = agrupado_columnas.size().index
+        
+        matriz = np.zeros((len(grupos), len(columnas)), dtype=np.int64)
+        matriz[agrupado_filas.ngroup().to_numpy(), agrupado_columnas.ngroup().to_numpy()] = df_conteos['conteo'].to_numpy()
+        
+        df_agregado = pd.DataFrame(matriz, columns=[f'{columna}-{valor}' for columna, valor in columnas])
+        df_agregado = pd.concat([grupos.to_frame(index=False), df_agregado], axis=1)
+        
+        return df_agregado
+    
+    
+    @staticmethod
+    def dispersar_conteos_categoricos(df_conteos:pd.DataFrame, variables_id_agrupacion:list) -> pd.DataFrame:
         
-        df_agregado = df_conteos.pivot_table(
-            index=variables_id_agrupacion,
-            columns=['característica', 'observación'],
-            values='conteo',
-            fill_value=0
+        if not isinstance(df_conteos, pd.DataFrame):
+            raise TypeError('El valor del parámetro df_conteos debe ser de tipo pd.DataFrame')
+        
+        if not isinstance(variables_id_agrupacion, list):
+            raise TypeError('El valor del parámetro variables_id_agrupacion debe ser de tipo list')
+        
+        # misma informacion que pivotear_conteos_categoricos sin construir la matriz ancha: una fila por celda distinta
+        # de cero y la columna variable-valor como categoria, con las categorias en el orden de las columnas densas
+        
+        agrupado_columnas = df_conteos.groupby(['característica', 'observación'], sort=True)
+        columnas = agrupado_columnas.size().index
+        
+        df_disperso = df_conteos[variables_id_agrupacion].copy()
+        df_disperso['variable'] = pd.Categorical.from_codes(
+            agrupado_columnas.ngroup().to_numpy(),
+            categories=[f'{columna}-{valor}' for columna, valor in columnas]
         )
+        df_disperso['conteo'] = df_conteos['conteo'].to_numpy()
+        
+        return df_disperso
+    
+    
+    def agrupar_variables_categoricas(self, variables_id_agrupacion, variables_a_agrupar):
+        
+        if not isinstance(variables_id_agrupacion, list):
+            raise TypeError('El valor del parámetro variables_id_agrupacion debe ser de tipo list')
+        
+        if not isinstance(variables_a_agrupar, list):
+            raise TypeError('El valor del parámetro variables_a_agrupar debe ser de tipo list')
+        
+        grupos, conteos = self.__contar_codigos_categoricos(variables_id_agrupacion, variables_a_agrupar)
+        
+        # solo se conservan los valores y los grupos con al menos una observacion, igual que pivot_table
         
-        columnas_conteos = [col for col in df_agregado.columns if col not in variables_id_agrupacion]
-        for col in columnas_conteos:
-            df_agregado[col] = df_agregado[col].astype(int)
-        df_agregado.columns = [f'{columna}-{valor}' for columna, valor in df_agregado.columns]
-        df_agregado = df_agregado.reset_index()
+        columnas = []
+        posiciones_columnas = []
+        inicio = 0
+        for var, valores, _, codigos_valores, _ in conteos:
+            valores_presentes = np.unique(codigos_valores)
+            columnas += [f'{var}-{valor}' for valor in valores[valores_presentes]]
+            posiciones_columnas.append(inicio + np.searchsorted(valores_presentes, codigos_valores))
+            inicio += len(valores_presentes)
+        
+        matriz = np.zeros((len(grupos), len(columnas)), dtype=np.int64)
+        for (_, _, codigos_grupos, _, conteo), posiciones in zip(conteos, posiciones_columnas):
+            matriz[codigos_grupos, posiciones] = conteo
+        filas_con_datos = (matriz > 0).any(axis=1)
+        
+        df_agregado = pd.DataFrame(matriz[filas_con_datos], columns=columnas)
+        df_agregado = pd.concat([grupos[filas_con_datos].to_frame(index=False), df_agregado], axis=1)
         
         return df_agregado
     
     
-    def agrupar_variables_numericas(self, variables_id_agrupacion:list, variables_a_agrupar:list, operacion:str):
+    def convertir_variables_numericas(self, variables_id_agrupacion:list, variables_a_agrupar:list) -> tuple:
         
         if not isinstance(variables_id_agrupacion, list):
             raise TypeError('El valor del parámetro variables_id_agrupacion debe ser de tipo list')
@@ -169,44 +381,208 @@ class Preprocesador:
         if not isinstance(variables_a_agrupar, list):
             raise TypeError('El valor del parámetro variables_a_agrupar debe ser de tipo list')
         
-        df = self.df[variables_id_agrupacion + variables_a_agrupar]
-        df = df.apply(lambda col: col.map(lambda x: x.strip() if isinstance(x, str) else x))
+        df = self.__seleccionar_columnas(variables_id_agrupacion + variables_a_agrupar)
         
         variables_numericas = []
         for var in variables_a_agrupar:
             try:
-                df[var] = pd.to_numeric(df[var], errors='raise')
+                df[var] = self.__convertir_a_numerico(df[var])
                 variables_numericas.append(var)
             except Exception:
                 print(f'La variable {var} contiene valores no numéricos (o no convertibles a numérico), no se agrupará')
         df = df[variables_id_agrupacion + variables_numericas]
         df = df.loc[:, ~df.columns.duplicated()] # si las variables de agrupacion se encuentran repetidas en las variables a agrupar, se eliminan
+        
+        return df, variables_numericas
+    
+    
+    @staticmethod
+    def obtener_percentil(operacion:str):
+        
+        # probabilidad (entre 0 y 1) de una operacion percentil_XX, None si la operacion no es un percentil
+        coincidencia = PATRON_PERCENTIL.fullmatch(operacion) if isinstance(operacion, str) else None
+        if coincidencia is None or float(coincidencia.group(1)) > 100:
+            return None
+        return float(coincidencia.group(1)) / 100
+    
+    
+    @staticmethod
+    def normalizar_operaciones(operacion) -> list:
+        
+        # una operacion (str) o una lista de operaciones, sin repetidos y en el orden especificado
+        operaciones = [operacion] if isinstance(operacion, str) else operacion
+        if not isinstance(operaciones, list) or not all(isinstance(op, str) for op in operaciones):
+            raise TypeError('El parámetro operacion debe ser de tipo str o una lista de str')
+        if len(operaciones) == 0:
+            raise ValueError('La lista de operaciones no puede estar vacía')
+        for op in operaciones:
+            if op not in OPERACIONES_NUMERICAS and Preprocesador.obtener_percentil(op) is None:
+                raise ValueError(f'La operación especificada ({op}) no existe, se implementan las siguientes: {", ".join(OPERACIONES_NUMERICAS)}, percentil_XX')
+        return list(dict.fromkeys(operaciones))
+    
+    
+    @staticmethod
+    def suma_exacta(valores:np.ndarray):
+        
+        # suma sin redondeo de valores flotantes (Fraction): math.fsum da la suma correctamente redondeada y se repite
+        # sobre el resto hasta que es cero; con valores infinitos se regresa la suma flotante
+        valores = np.asarray(valores, dtype=np.float64)
+        if not np.isfinite(valores).all():
+            return float(np.sum(valores))
+        
+        restos = [math.fsum(valores)]
+        while restos[-1] != 0:
+            restos.append(math.fsum(np.concatenate((valores, -np.asarray(restos)))))
+        return sum((Fraction(resto) for resto in restos), Fraction(0))
+    
+    
+    @staticmethod
+    def sumar_por_grupo(df:pd.DataFrame, agrupado, variables:list, exacta:bool=False) -> pd.DataFrame:
+        
+        # sumas con un solo redondeo final (opcion suma_exacta): las variables enteras con la suma de pandas y las
+        # flotantes con math.fsum, de modo que el resultado no depende del orden de las filas ni de como se dividan en
+        # chunks. Con exacta=True las sumas flotantes se regresan sin redondear (Fraction), para combinar sumas
+        # parciales de varios chunks
+        
+        sumas = agrupado[variables].sum()
+        
+        variables_flotantes = [var for var in variables if pd.api.types.is_float_dtype(df[var])]
+        if len(variables_flotantes) > 0:
+            codigos = agrupado.ngroup().to_numpy(dtype=np.float64) # las filas con llaves nulas no pertenecen a ningun grupo (NaN)
+            validos = ~np.isnan(codigos)
+            codigos = codigos[validos].astype(np.int64)
+            orden = np.argsort(codigos, kind='stable')
+            limites = np.cumsum(np.bincount(codigos, minlength=agrupado.ngroups))[:-1]
+            for var in variables_flotantes:
+                partes = np.split(df[var].to_numpy(dtype=np.float64)[validos][orden], limites)
+                partes = [parte[~np.isnan(parte)] for parte in partes]
+                if exacta:
+                    sumas[var] = pd.Series([Preprocesador.suma_exacta(parte) for parte in partes], index=sumas.index, dtype=object)
+                else:
+                    sumas[var] = [math.fsum(parte) if np.isfinite(parte).all() else float(np.sum(parte)) for parte in partes]
+        
+        return sumas
+    
+    
+    def agrupar_variables_numericas(self, variables_id_agrupacion:list, variables_a_agrupar:list, operacion, suma_exacta:bool=False):
+        
+        operaciones = Preprocesador.normalizar_operaciones(operacion)
+        if not isinstance(suma_exacta, bool):
+            raise TypeError('El parámetro suma_exacta debe ser de tipo bool')
+        
+        df, _ = self.convertir_variables_numericas(
+            variables_id_agrupacion=variables_id_agrupacion,
+            variables_a_agrupar=variables_a_agrupar
+        )
 
-        df_agregado = pd.DataFrame()
-        if operacion == 'suma':
-            df_agregado = df.groupby(variables_id_agrupacion, as_index=False).sum()
-        elif operacion == 'media': 
-            df_agregado = df.groupby(variables_id_agrupacion, as_index=False).mean()
-        elif operacion == 'mediana':
-            df_agregado = df.groupby(variables_id_agrupacion, as_index=False).median()
-        else:
-            raise ValueError('La operación especificada no existe, se implementan las siguientes: suma, media, mediana')
-        
-        df_agregado = df_agregado.copy() # defragmentacion
-        
-        renombramiento_columnas = [
-            var if var in variables_id_agrupacion else f"{operacion}::{var}"
-            for var in df_agregado.columns
-        ]
-        df_agregado.columns = renombramiento_columnas        
+        # todas las operaciones comparten la misma agrupacion (llaves factorizadas una sola vez) y los
+        # percentiles se calculan juntos, con un solo ordenamiento de los valores de cada grupo. Con suma_exacta, sumas
+        # y medias usan sumar_por_grupo (un solo redondeo), igual que AcumuladorAgregados en el modo por chunks
+        
+        agrupado = df.groupby(variables_id_agrupacion, observed=True)
+        variables = [var for var in df.columns if var not in variables_id_agrupacion]
+        sumas = Preprocesador.sumar_por_grupo(df, agrupado, variables) if suma_exacta and any(op in ['suma', 'media'] for op in operaciones) else None
+        
+        probabilidades = [Preprocesador.obtener_percentil(op) for op in operaciones if Preprocesador.obtener_percentil(op) is not None]
+        cuantiles = agrupado.quantile(list(dict.fromkeys(probabilidades))) if len(probabilidades) > 0 else None
+        
+        resultados = []
+        for op in operaciones:
+            if op == 'suma':
+                resultado = sumas.copy() if suma_exacta else agrupado.sum()
+            elif op == 'media':
+                resultado = sumas.astype(float) / agrupado[variables].count() if suma_exacta else agrupado.mean()
+            elif op == 'mediana':
+                resultado = agrupado.median()
+            elif op == 'conteo':
+                resultado = agrupado.count()
+            elif op == 'minimo':
+                resultado = agrupado.min()
+            elif op == 'maximo':
+                resultado = agrupado.max()
+            elif op == 'desviacion_estandar':
+                resultado = agrupado.std()
+            else:
+                resultado = cuantiles.xs(Preprocesador.obtener_percentil(op), level=-1)
+            resultado.columns = [f"{op}::{var}" for var in resultado.columns]
+            resultados.append(resultado)
+        
+        df_agregado = pd.concat(resultados, axis=1).reset_index() # defragmentacion
         
         return df_agregado
     
 
+    @staticmethod
+    def unir_agrupaciones(agrupaciones:list, variables_id_agrupacion:list) -> pd.DataFrame:
+        
+        if not isinstance(agrupaciones, list):
+            raise TypeError('El valor del parámetro agrupaciones debe ser de tipo list')
+        if not all(isinstance(df, pd.DataFrame) for df in agrupaciones):
+            raise TypeError('Los elementos del parámetro agrupaciones deben ser de tipo pd.DataFrame')
+        if not isinstance(variables_id_agrupacion, list):
+            raise TypeError('El valor del parámetro variables_id_agrupacion debe ser de tipo list')
+        
+        # si varias agrupaciones comparten nombres de columnas se conservan los sufijos que genera pd.merge
+        
+        columnas = [col for df in agrupaciones for col in df.columns if col not in variables_id_agrupacion]
+        if len(columnas) != len(set(columnas)):
+            return functools.reduce(
+                lambda left, right: pd.merge(left, right, on=variables_id_agrupacion, how='inner'),
+                agrupaciones
+            )
+        
+        # todas las agrupaciones se alinean sobre el mismo indice de llaves y se unen en una sola operacion (inner join)
+        
+        return pd.concat(
+            [df.set_index(variables_id_agrupacion) for df in agrupaciones],
+            axis=1,
+            join='inner'
+        ).reset_index()
+    
+
+    @staticmethod
+    def unir_agrupaciones_dispersas(agrupaciones:list, conteos_dispersos:list, variables_id_agrupacion:list) -> tuple:
+        
+        if not isinstance(conteos_dispersos, list):
+            raise TypeError('El valor del parámetro conteos_dispersos debe ser de tipo list')
+        if not all(isinstance(df, pd.DataFrame) for df in conteos_dispersos):
+            raise TypeError('Los elementos del parámetro conteos_dispersos deben ser de tipo pd.DataFrame')
+        if len(conteos_dispersos) == 0:
+            raise ValueError('El parámetro conteos_dispersos debe contener al menos un bloque de conteos categóricos')
+        
+        df_denso = Preprocesador.unir_agrupaciones(agrupaciones=agrupaciones, variables_id_agrupacion=variables_id_agrupacion)
+        
+        # mismos grupos que el inner join denso: cada bloque categorico solo contiene los grupos con al menos una observacion
+        
+        grupos = pd.MultiIndex.from_frame(df_denso[variables_id_agrupacion])
+        en_todos = np.ones(len(grupos), dtype=bool)
+        for df in conteos_dispersos:
+            en_todos &= grupos.isin(pd.MultiIndex.from_frame(df[variables_id_agrupacion]))
+        df_denso = df_denso.loc[en_todos].reset_index(drop=True)
+        grupos = grupos[en_todos]
+        
+        # los bloques se concatenan con las categorias (columnas) en orden de bloque; una columna repetida en varios
+        # bloques tiene los mismos conteos y se conserva una sola vez
+        
+        categorias = list(dict.fromkeys(categoria for df in conteos_dispersos for categoria in df['variable'].cat.categories))
+        bloques = [
+            df.loc[pd.MultiIndex.from_frame(df[variables_id_agrupacion]).isin(grupos)].assign(variable=lambda d: d['variable'].cat.set_categories(categorias))
+            for df in conteos_dispersos
+        ]
+        df_conteos = (
+            pd.concat(bloques)
+            .drop_duplicates(subset=variables_id_agrupacion + ['variable'])
+            .sort_values(variables_id_agrupacion + ['variable'], kind='stable')
+            .reset_index(drop=True)
+        )
+        
+        return df_denso, df_conteos
+    
+
     def agrupar_total_datos(self, variables_id_agrupacion):
         
         if not isinstance(variables_id_agrupacion, list):
             raise TypeError('El parámetro variables_id_agrupacion debe ser de tipo list')
         
-        return self.df.groupby(variables_id_agrupacion).size().reset_index(name='conteo::total_datos')
+        return self.df.groupby(variables_id_agrupacion, observed=True).size().reset_index(name='conteo::total_datos')
     
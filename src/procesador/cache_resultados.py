@@ -0,0 +1,109 @@
+import os
+import re
+import pickle
+import pandas as pd
+
+# las entradas de la cache son archivos <sha256>.pkl (y sus temporales de escritura); el directorio puede contener
+# otros archivos, que nunca se cuentan, desalojan ni eliminan
+PATRON_ENTRADA = re.compile(r'[0-9a-f]{64}\.pkl')
+PATRON_TEMPORAL = re.compile(r'[0-9a-f]{64}\.pkl\.\d+\.tmp')
+
+# errores de lectura de una entrada truncada o corrupta, que se trata como fallo y se elimina
+ERRORES_ENTRADA_CORRUPTA = (EOFError, pickle.UnpicklingError, AttributeError, ValueError, TypeError, IndexError, ImportError)
+
+class CacheResultados:
+
+    def __init__(self, directorio:str, tamano_maximo_mb:float=1024):
+
+        if not isinstance(directorio, str):
+            raise TypeError('El parámetro directorio debe ser de tipo str')
+        if not isinstance(tamano_maximo_mb, (int, float)) or isinstance(tamano_maximo_mb, bool):
+            raise TypeError('El parámetro tamano_maximo_mb debe ser de tipo int o float')
+        if tamano_maximo_mb <= 0:
+            raise ValueError('El valor de tamano_maximo_mb debe ser mayor a 0')
+
+        self.directorio = directorio
+        self.tamano_maximo = int(tamano_maximo_mb * 2**20)
+        os.makedirs(self.directorio, exist_ok=True)
+
+        # el tamaño total se calcula una sola vez y se actualiza con cada escritura
+        self.__tamano_total = sum(os.path.getsize(ruta) for ruta in self.__rutas_archivos())
+        self.aciertos = 0
+        self.fallos = 0
+
+    def __rutas_archivos(self) -> list:
+
+        return [os.path.join(self.directorio, archivo) for archivo in os.listdir(self.directorio) if PATRON_ENTRADA.fullmatch(archivo)]
+
+    def __ruta(self, llave:str) -> str:
+
+        if not isinstance(llave, str) or PATRON_ENTRADA.fullmatch(f'{llave}.pkl') is None:
+            raise ValueError('La llave de la cache debe ser un hash sha256 en hexadecimal')
+        return os.path.join(self.directorio, f'{llave}.pkl')
+
+    def obtener(self, llave:str):
+
+        ruta = self.__ruta(llave)
+        try:
+            resultado = pd.read_pickle(ruta)
+            if not isinstance(resultado, pd.DataFrame):
+                raise TypeError(f'La entrada {ruta} de la cache no contiene un DataFrame')
+        except FileNotFoundError:
+            self.fallos += 1
+            return None
+        except ERRORES_ENTRADA_CORRUPTA as error:
+            # una entrada truncada o corrupta se elimina y el resultado se vuelve a calcular
+            print(f'Advertencia: la entrada {ruta} de la cache no se pudo leer ({type(error).__name__}), se eliminará')
+            self.__eliminar(ruta)
+            self.fallos += 1
+            return None
+        # la fecha de modificacion marca el ultimo uso, para desalojar primero los menos usados (LRU)
+        os.utime(ruta)
+        self.aciertos += 1
+        return resultado
+
+    def guardar(self, llave:str, resultado:pd.DataFrame):
+
+        if not isinstance(resultado, pd.DataFrame):
+            raise TypeError('El parámetro resultado debe ser de tipo pd.DataFrame')
+
+        # se escribe a un archivo temporal y se renombra, un proceso interrumpido no deja archivos incompletos
+        ruta = self.__ruta(llave)
+        ruta_temporal = f'{ruta}.{os.getpid()}.tmp'
+        resultado.to_pickle(ruta_temporal)
+        tamano_previo = os.path.getsize(ruta) if os.path.exists(ruta) else 0
+        os.replace(ruta_temporal, ruta)
+        self.__tamano_total += os.path.getsize(ruta) - tamano_previo
+
+        if self.__tamano_total > self.tamano_maximo:
+            self.__desalojar()
+
+    def __eliminar(self, ruta:str):
+
+        try:
+            tamano = os.path.getsize(ruta)
+            os.remove(ruta)
+        except FileNotFoundError:
+            return
+        self.__tamano_total -= tamano
+
+    def __desalojar(self):
+
+        archivos = sorted(((os.path.getmtime(ruta), os.path.getsize(ruta), ruta) for ruta in self.__rutas_archivos()))
+        self.__tamano_total = sum(tamano for _, tamano, _ in archivos)
+        for _, tamano, ruta in archivos:
+            if self.__tamano_total <= self.tamano_maximo:
+                break
+            os.remove(ruta)
+            self.__tamano_total -= tamano
+
+    def limpiar(self):
+
+        # solo se eliminan las entradas de la cache, no el directorio ni otros archivos que contenga
+        for archivo in os.listdir(self.directorio):
+            if PATRON_ENTRADA.fullmatch(archivo) or PATRON_TEMPORAL.fullmatch(archivo):
+                try:
+                    os.remove(os.path.join(self.directorio, archivo))
+                except FileNotFoundError:
+                    pass
+        self.__tamano_total = 0
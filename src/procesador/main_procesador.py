@@ -2,11 +2,31 @@ import pandas as pd
 import os
 import argparse
 import json
-from procesador.procesador import Procesador
+from concurrent.futures import ThreadPoolExecutor
+from procesador.procesador import Procesador, ERROR_CUANTILES_MAXIMO
+from procesador.cache_resultados import CacheResultados
+from utils.io_utils import leer_tabla, leer_columnas, escribir_tabla
+from utils.conteos_dispersos import densificar_conteos
+from utils.regex_utils import SelectorColumnas
+from utils.instrumentacion import Instrumentador, ruta_reporte_instrumentacion
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Procesador de datos C3')
     parser.add_argument('--config', type=str, required=True, help='Archivo de configuración')
+    parser.add_argument('--sin-cache', action='store_true', help='Procesa todas las variables sin consultar ni actualizar la cache de resultados')
+    parser.add_argument('--limpiar-cache', action='store_true', help='Elimina la cache de resultados antes de procesar')
+    parser.add_argument(
+        '--error-cuantiles', type=float, default=None,
+        help=(
+            'Utiliza cuantiles aproximados (sketch KLL) con este error de rango, en lugar del campo error_cuantiles de la '
+            'configuración. Solo se aceptan valores de hasta 0.01: los bins no coinciden siempre con los de pd.qcut y en la '
+            'escala municipal de INEGI (q=10) con 0.01 o menos a lo más el 1%% de las entidades cae en un bin distinto, '
+            'mientras que con 0.05 en promedio el 9%% y hasta el 82%% en una variable donde dos bordes se unen. Escalas con '
+            'pocas entidades (estatal) coinciden exactamente. Las escalas se cargan completas y cada columna se categoriza '
+            'en memoria: el sketch evita ordenar la columna, no reduce la memoria. Detalle por variable en '
+            'data/inegi/validacion_cuantiles_inegi.csv'
+        )
+    )
     args = parser.parse_args()
     
     with open(args.config) as f:
@@ -44,46 +64,170 @@ if __name__ == '__main__':
         raise ValueError('El archivo JSON pasado para --config debe tener el campo q')
     q = procesador_config['q']
     
+    workers = procesador_config.get('workers', 1)
+    if not isinstance(workers, int):
+        raise TypeError('El valor asociado al campo workers debe ser de tipo int')
+    
     if 'ruta_csv_salida' not in procesador_config:
         raise ValueError('El archivo JSON pasado para --config debe tener el campo ruta_csv_salida')
     ruta_csv_salida = procesador_config['ruta_csv_salida']
     
-    dataframes_escalas = {}
+    # cuantiles aproximados opcionales (sketches KLL) con el error de rango indicado, None utiliza cuantiles exactos
+    
+    # solo hasta ERROR_CUANTILES_MAXIMO, con errores mayores los bins difieren notablemente de los exactos (ver --help)
+    
+    error_cuantiles = args.error_cuantiles if args.error_cuantiles is not None else procesador_config.get('error_cuantiles')
+    if error_cuantiles is not None:
+        if not isinstance(error_cuantiles, (int, float)) or isinstance(error_cuantiles, bool):
+            raise TypeError('El valor asociado al campo error_cuantiles debe ser de tipo float')
+        if not 0 < error_cuantiles <= ERROR_CUANTILES_MAXIMO:
+            raise ValueError(f'El valor de error_cuantiles debe ser mayor a 0 y a lo más {ERROR_CUANTILES_MAXIMO}: con errores mayores los bins difieren notablemente de los de pd.qcut (ver data/inegi/validacion_cuantiles_inegi.csv)')
+    
+    # representacion de cells: cadenas (llaves de las entidades) o enteros (ids de un diccionario de entidades por escala)
+    
+    representacion_cells = procesador_config.get('representacion_cells', 'cadenas')
+    ruta_salida_diccionario_entidades = procesador_config.get('ruta_salida_diccionario_entidades')
+    if ruta_salida_diccionario_entidades is None:
+        base, extension = os.path.splitext(ruta_csv_salida)
+        ruta_salida_diccionario_entidades = f'{base}_entidades{extension}'
+    if not isinstance(ruta_salida_diccionario_entidades, str):
+        raise TypeError('El valor asociado al campo ruta_salida_diccionario_entidades debe ser de tipo str')
+    
+    # instrumentacion opcional: tiempo, filas, columnas y memoria de cada etapa en un reporte JSON junto a la salida
+    
+    instrumentar = procesador_config.get('instrumentar', False)
+    if not isinstance(instrumentar, bool):
+        raise TypeError('El valor asociado al campo instrumentar debe ser de tipo bool')
+    instrumentar_tracemalloc = procesador_config.get('instrumentar_tracemalloc', False)
+    if not isinstance(instrumentar_tracemalloc, bool):
+        raise TypeError('El valor asociado al campo instrumentar_tracemalloc debe ser de tipo bool')
+    instrumentador = Instrumentador(activo=instrumentar, medir_tracemalloc=instrumentar_tracemalloc)
+    
+    # cache opcional de resultados por variable: solo se procesan las variables cuyo contenido o parametros cambiaron
+    
+    ruta_cache = procesador_config.get('ruta_cache')
+    if ruta_cache is not None and not isinstance(ruta_cache, str):
+        raise TypeError('El valor asociado al campo ruta_cache debe ser de tipo str')
+    tamano_maximo_cache_mb = procesador_config.get('tamano_maximo_cache_mb', 1024)
+    cache = None
+    if ruta_cache is not None:
+        cache = CacheResultados(directorio=ruta_cache, tamano_maximo_mb=tamano_maximo_cache_mb)
+        if args.limpiar_cache:
+            cache.limpiar()
+            print(f'Cache de resultados eliminada ({ruta_cache})')
+        if args.sin_cache:
+            cache = None
+    elif args.limpiar_cache or args.sin_cache:
+        print('Advertencia: no se especificó el campo ruta_cache, las opciones --sin-cache y --limpiar-cache no tienen efecto')
+    
     for escala, ruta in rutas_csv_escalas.items():
         if not os.path.exists(ruta):
             raise FileNotFoundError(f'La ruta especificada para el archivo .csv de la escala {escala} no existe')
-        dtype_dict = {col: str for col in variables_identificadoras}
-        dataframes_escalas = {escala:pd.read_csv(ruta, dtype=dtype_dict)}
+    
+    # conteos categoricos dispersos opcionales por escala (salida del preprocesador con conteos_categoricos_dispersos):
+    # solo las columnas variable-valor que la configuracion utiliza se expanden y se unen a la escala
+    
+    rutas_conteos_categoricos_escalas = procesador_config.get('rutas_conteos_categoricos_escalas', {})
+    if not isinstance(rutas_conteos_categoricos_escalas, dict):
+        raise TypeError('El valor asociado al campo rutas_conteos_categoricos_escalas debe ser de tipo dict')
+    for escala, rutas in rutas_conteos_categoricos_escalas.items():
+        if escala not in rutas_csv_escalas:
+            raise ValueError(f'La escala {escala} del campo rutas_conteos_categoricos_escalas no se encuentra en rutas_csv_escalas')
+        if not isinstance(rutas, dict) or 'ruta_conteos' not in rutas or 'ruta_columnas' not in rutas:
+            raise ValueError(f'Las rutas de conteos categóricos de la escala {escala} deben tener los campos ruta_conteos y ruta_columnas')
+        for ruta in [rutas['ruta_conteos'], rutas['ruta_columnas']]:
+            if not os.path.exists(ruta):
+                raise FileNotFoundError(f'La ruta especificada para los conteos categóricos de la escala {escala} no existe ({ruta})')
+    
+    for campo, valor in [('variables_a_procesar_list', variables_a_procesar_list), ('variables_a_procesar_regex', variables_a_procesar_regex)]:
+        if valor is not None and not isinstance(valor, dict):
+            raise TypeError(f'El valor asociado al campo {campo} debe ser de tipo dict')
+    
+    # de cada escala solo se leen las columnas que la configuracion utiliza: identificadoras, bases de normalizacion,
+    # variables de las listas y variables que coinciden con las expresiones regulares segun el encabezado
+    
+    bases_normalizacion = {
+        base
+        for dicc in [variables_a_procesar_list, variables_a_procesar_regex] if dicc is not None
+        for base in dicc.keys() if base not in [None, 'None']
+    }
+    variables_listas = {var for variables in (variables_a_procesar_list or {}).values() for var in variables}
+    expresiones_regulares = list((variables_a_procesar_regex or {}).values())
+    dtype_dict = {col: str for col in variables_identificadoras}
+    
+    def cargar_escala(escala:str, ruta:str) -> pd.DataFrame:
+        columnas = leer_columnas(ruta)
+        rutas_conteos = rutas_conteos_categoricos_escalas.get(escala)
+        columnas_conteos = []
+        if rutas_conteos is not None:
+            df_columnas = leer_tabla(rutas_conteos['ruta_columnas'])
+            columnas_conteos = [col for col in df_columnas['variable'] if col not in columnas]
+        
+        columnas_necesarias = set(variables_identificadoras) | bases_normalizacion | variables_listas
+        for variables in SelectorColumnas(columnas + columnas_conteos).seleccionar_lote(expresiones_regulares).values():
+            columnas_necesarias = columnas_necesarias | set(variables)
+        dataframe = leer_tabla(ruta, columnas=[col for col in columnas if col in columnas_necesarias], dtype=dtype_dict)
         
-    diccionario_traducciones = pd.read_csv(ruta_csv_diccionario_traducciones)
+        columnas_conteos = [col for col in columnas_conteos if col in columnas_necesarias]
+        if len(columnas_conteos) > 0:
+            df_coordenadas = leer_tabla(rutas_conteos['ruta_conteos'], dtype=dtype_dict)
+            df_conteos = densificar_conteos(df_coordenadas, df_columnas, variables_identificadoras, variables=columnas_conteos)
+            # los grupos sin observaciones en las columnas seleccionadas tienen conteo cero
+            dataframe = dataframe.merge(df_conteos, on=variables_identificadoras, how='left')
+            dataframe[columnas_conteos] = dataframe[columnas_conteos].fillna(0).astype('int64')
+        return dataframe
+    
+    # todas las escalas se leen al mismo tiempo
+    
+    with instrumentador.etapa('carga_escalas', rutas=rutas_csv_escalas) as registro:
+        with ThreadPoolExecutor(max_workers=max(1, len(rutas_csv_escalas))) as executor:
+            futuros = {escala: executor.submit(cargar_escala, escala, ruta) for escala, ruta in rutas_csv_escalas.items()}
+            dataframes_escalas = {escala: futuro.result() for escala, futuro in futuros.items()}
+        registro['filas'] = sum(len(dataframe) for dataframe in dataframes_escalas.values())
+        registro['columnas_escalas'] = {escala: dataframe.shape[1] for escala, dataframe in dataframes_escalas.items()}
+        
+    with instrumentador.etapa('carga_diccionario', ruta=ruta_csv_diccionario_traducciones) as registro:
+        diccionario_traducciones = leer_tabla(ruta_csv_diccionario_traducciones)
+        registro['filas'], registro['columnas'] = diccionario_traducciones.shape
     if columna_diccionario_traducciones_nombres not in diccionario_traducciones.columns:
         raise ValueError(f'El DataFrame correspondiente al campo ruta_csv_diccionario_traducciones debe contener la columna {columna_diccionario_traducciones_nombres}')
     if columna_diccionario_traducciones_alias not in diccionario_traducciones.columns:
         raise ValueError(f'El DataFrame correspondiente al campo ruta_csv_diccionario_traducciones debe contener la columna {columna_diccionario_traducciones_alias}')
     
-    procesador = Procesador(
-        dataframes_escalas=dataframes_escalas, 
-        diccionario_traducciones=diccionario_traducciones, 
-        columna_diccionario_traducciones_nombres=columna_diccionario_traducciones_nombres,
-        columna_diccionario_traducciones_alias=columna_diccionario_traducciones_alias,
-        variables_identificadoras=variables_identificadoras,
-        variables_excluidas_list=variables_excluidas_list, 
-        variables_excluidas_regex=variables_excluidas_regex 
-    )
+    with instrumentador.etapa('inicializacion_procesador'):
+        procesador = Procesador(
+            dataframes_escalas=dataframes_escalas, 
+            diccionario_traducciones=diccionario_traducciones, 
+            columna_diccionario_traducciones_nombres=columna_diccionario_traducciones_nombres,
+            columna_diccionario_traducciones_alias=columna_diccionario_traducciones_alias,
+            variables_identificadoras=variables_identificadoras,
+            variables_excluidas_list=variables_excluidas_list, 
+            variables_excluidas_regex=variables_excluidas_regex 
+        )
+    if instrumentar:
+        procesador.set_instrumentador(instrumentador)
+    if cache is not None:
+        procesador.set_cache(cache)
+    procesador.set_representacion_cells(representacion_cells)
+    procesador.set_error_cuantiles(error_cuantiles)
     
     procesamiento_listas = pd.DataFrame()
     if variables_a_procesar_list is not None:
         if 'None' in variables_a_procesar_list:
             variables_a_procesar_list[None] = variables_a_procesar_list.pop('None')
-        procesamiento_listas_dict = procesador.procesar_multiples_variables_list(escalas=list(dataframes_escalas.keys()), dicc=variables_a_procesar_list, q=q)
-        procesamiento_listas = pd.concat(list(procesamiento_listas_dict.values()))
+        with instrumentador.etapa('procesamiento_list', columnas=sum(len(variables) for variables in variables_a_procesar_list.values())) as registro:
+            procesamiento_listas_dict = procesador.procesar_multiples_variables_list(escalas=list(dataframes_escalas.keys()), dicc=variables_a_procesar_list, q=q, workers=workers)
+            procesamiento_listas = pd.concat(list(procesamiento_listas_dict.values()))
+            registro['filas'] = len(procesamiento_listas)
         
     procesamiento_regex = pd.DataFrame()
     if variables_a_procesar_regex is not None:
         if 'None' in variables_a_procesar_regex:
             variables_a_procesar_regex[None] = variables_a_procesar_regex.pop('None')
-        procesamiento_regex_dict = procesador.procesar_multiples_variables_regex(escalas=list(dataframes_escalas.keys()), dicc=variables_a_procesar_regex, q=q)
-        procesamiento_regex = pd.concat(list(procesamiento_regex_dict.values()))
+        with instrumentador.etapa('procesamiento_regex', regex=variables_a_procesar_regex) as registro:
+            procesamiento_regex_dict = procesador.procesar_multiples_variables_regex(escalas=list(dataframes_escalas.keys()), dicc=variables_a_procesar_regex, q=q, workers=workers)
+            procesamiento_regex = pd.concat(list(procesamiento_regex_dict.values()))
+            registro['filas'] = len(procesamiento_regex)
 
     resultado = pd.DataFrame()
     if variables_a_procesar_list and variables_a_procesar_regex:
@@ -99,5 +243,16 @@ if __name__ == '__main__':
         print('Advertencia: el resultado del procesamiento contiene categorías duplicadas:')
         print(resultado.loc[duplicados, ['code', 'bin']])
         
-    resultado.to_csv(ruta_csv_salida, index=False)
-    print(f'Procesamiento finalizado, el archivo .csv resultante se encuentra en la ruta:\n{ruta_csv_salida}')
\ No newline at end of file
+    with instrumentador.etapa('escritura', filas=resultado.shape[0], columnas=resultado.shape[1], ruta=ruta_csv_salida):
+        escribir_tabla(resultado, ruta_csv_salida)
+    print(f'Procesamiento finalizado, el archivo .csv resultante se encuentra en la ruta:\n{ruta_csv_salida}')
+    
+    if representacion_cells == 'enteros':
+        diccionario_entidades = procesador.generar_diccionario_entidades()
+        escribir_tabla(diccionario_entidades, ruta_salida_diccionario_entidades)
+        print(f'El diccionario de entidades se encuentra en la ruta:\n{ruta_salida_diccionario_entidades}')
+    
+    if instrumentar:
+        ruta_reporte = ruta_reporte_instrumentacion(ruta_csv_salida)
+        instrumentador.escribir_reporte(ruta_reporte)
+        print(f'El reporte de instrumentación se encuentra en la ruta:\n{ruta_reporte}')
\ No newline at end of file
@@ -1,9 +1,55 @@
 import os
+import json
+import hashlib
 import numpy as np
 import pandas as pd
 pd.set_option('future.no_silent_downcasting', True)
 import re
-from utils.regex_utils import obtener_variables_regex_df
+import warnings
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from utils.regex_utils import obtener_selector_columnas
+from utils.instrumentacion import Instrumentador
+from procesador.cache_resultados import CacheResultados
+from procesador.sketch_cuantiles import SketchCuantiles, k_para_error
+
+# version del formato de resultados, forma parte de las llaves de cache para invalidarlas si el formato cambia
+VERSION_CACHE = 1
+
+# representaciones de las listas de entidades (cells) de cada bin:
+#   cadenas   arreglo de postgres con las llaves concatenadas de las entidades, en el orden de las filas
+#   enteros   arreglo de postgres con los ids enteros de las entidades (ordenados), el diccionario de entidades
+#             relaciona cada id con su llave
+REPRESENTACIONES_CELLS = ['cadenas', 'enteros']
+
+# mayor error de rango de los cuantiles aproximados con el que los bins se mantienen cerca de los de pd.qcut: en la
+# validacion sobre INEGI (data/inegi/validacion_cuantiles_inegi.csv) a lo mas el 1% de las entidades cambia de bin con
+# 0.01, y con 0.05 en promedio el 9% y hasta el 82% en una variable donde dos bordes se unen
+ERROR_CUANTILES_MAXIMO = 0.01
+
+# filas por bloque al construir los sketches de cuantiles aproximados (cada bloque genera un sketch que se combina)
+TAMANO_BLOQUE_SKETCH = 100000
+
+# procesador compartido con los procesos trabajadores, se hereda por fork (o se serializa una sola vez por proceso)
+_procesador_trabajador = None
+
+def _inicializar_trabajador(procesador):
+    global _procesador_trabajador
+    _procesador_trabajador = procesador
+
+def _procesar_bloque_trabajador(bloque:tuple) -> tuple:
+    escalas, variables, var_base_normalizacion, q = bloque
+    # los registros de instrumentacion generados en el trabajador se regresan junto con los resultados
+    # (con niveles relativos al bloque, el proceso principal los anida bajo su etapa actual)
+    instrumentador = _procesador_trabajador.instrumentador
+    if instrumentador is None:
+        return _procesador_trabajador._procesar_grupo_variables(escalas=escalas, variables=variables, var_base_normalizacion=var_base_normalizacion, q=q), []
+    inicio_registros = len(instrumentador.registros)
+    nivel_base = instrumentador.nivel_actual()
+    resultados = _procesador_trabajador._procesar_grupo_variables(escalas=escalas, variables=variables, var_base_normalizacion=var_base_normalizacion, q=q)
+    registros = [{**registro, 'nivel': registro['nivel'] - nivel_base} for registro in instrumentador.registros[inicio_registros:]]
+    return resultados, registros
 
 class Procesador:
 
@@ -51,11 +97,24 @@ class Procesador:
         self.diccionario_traducciones = diccionario_traducciones
         self.diccionario_traducciones = dict(zip(diccionario_traducciones[columna_diccionario_traducciones_alias], diccionario_traducciones[columna_diccionario_traducciones_nombres]))
         self.variables_identificadoras = variables_identificadoras
+        self.instrumentador = None
+        self.cache = None
+        self.representacion_cells = 'cadenas'
+        self.error_cuantiles = None
+        self.__huellas_columnas = {}
+        
+        # indice de entidades por escala: llave concatenada, id entero de la entidad y orden de la fila
+        
+        self.indices_entidades = {escala: self.__construir_indice_entidades(dataframe) for escala, dataframe in dataframes_escalas.items()}
+
+        # selector de columnas por escala: las expresiones regulares se resuelven una vez por escala y se reutilizan
+        
+        self.selectores_columnas = {escala: obtener_selector_columnas(list(dataframe.columns)) for escala, dataframe in dataframes_escalas.items()}
 
         variables_excluidas = set(variables_excluidas_list) | set(variables_identificadoras)
-        for regex in variables_excluidas_regex:
-            for dataframe in dataframes_escalas.values():
-                variables_excluidas = variables_excluidas | set(obtener_variables_regex_df(dataframe, regex))
+        for selector in self.selectores_columnas.values():
+            for variables in selector.seleccionar_lote(variables_excluidas_regex).values():
+                variables_excluidas = variables_excluidas | set(variables)
 
         self.variables_faltantes_diccionario = []
         
@@ -104,11 +163,14 @@ class Procesador:
             if var_base_normalizacion in self.variables_excluidas:
                 raise ValueError(f'La variable {var_base_normalizacion} está en la lista de variables excluidas')
         
-            if df[var_base_normalizacion].eq(0).any():
+            # los ceros de la base se reemplazan en una copia local: el DataFrame de la escala no se modifica, de modo que
+            # el resultado no depende del orden de las llamadas ni de los procesos en que se ejecuten
+            base = df[var_base_normalizacion]
+            if base.eq(0).any():
                 print(f'Advertencia: La variable {var_base_normalizacion} contiene valores de cero, reemplazando por NaN para evitar potenciales divisiones entre cero')
-                df[var_base_normalizacion] = df[var_base_normalizacion].replace(0, np.nan)
+                base = base.replace(0, np.nan)
             
-        return df[var] / df[var_base_normalizacion] if var_base_normalizacion is not None else df[var]
+        return df[var] / base if var_base_normalizacion is not None else df[var]
     
     def categorizar_variable(self, escala:str, var:str, var_base_normalizacion:str=None, q:int=10) -> pd.Series:
         
@@ -138,7 +200,246 @@ class Procesador:
         if q < 1:
             raise ValueError('El valor de q debe ser mayor a 1')
         
-        return pd.qcut(self.normalizar_variable(escala=escala, var=var, var_base_normalizacion=var_base_normalizacion), q=q, duplicates='drop')
+        serie = self.normalizar_variable(escala=escala, var=var, var_base_normalizacion=var_base_normalizacion)
+        if self.error_cuantiles is not None and pd.api.types.is_numeric_dtype(serie):
+            bordes = self.bordes_cuantiles(serie.to_numpy(dtype=np.float64, na_value=np.nan), q=q)
+            if np.isfinite(bordes).all():
+                return pd.cut(serie, bins=bordes if len(bordes) == 2 else pd.unique(bordes), include_lowest=True)
+        
+        return pd.qcut(serie, q=q, duplicates='drop')
+    
+    def bordes_cuantiles(self, valores:np.ndarray, q:int) -> np.ndarray:
+        
+        # bordes de los q cuantiles sin eliminar duplicados: exactos (percentiles lineales, como pd.qcut) o aproximados
+        # a partir de un sketch combinable (KLL) construido por bloques de filas. Los bloques salen de la columna ya
+        # cargada en memoria (las escalas se leen completas): el sketch no reduce la memoria de la carga, solo evita
+        # ordenar la columna completa. Precision medida en data/inegi/validacion_cuantiles_inegi.csv
+        
+        if self.error_cuantiles is None:
+            with np.errstate(all='ignore'), warnings.catch_warnings():
+                warnings.simplefilter('ignore', category=RuntimeWarning)
+                return np.nanpercentile(valores, np.linspace(0, 1, q + 1) * 100)
+        
+        k = k_para_error(self.error_cuantiles)
+        sketch = SketchCuantiles(k=k)
+        for inicio in range(0, len(valores), TAMANO_BLOQUE_SKETCH):
+            sketch.combinar(SketchCuantiles(k=k, semilla=inicio).actualizar(valores[inicio:inicio + TAMANO_BLOQUE_SKETCH]))
+        return sketch.cuantiles(np.linspace(0, 1, q + 1))
+    
+    def categorizar_multiples_variables(self, escala:str, variables:list, var_base_normalizacion:str=None, q:int=10) -> dict:
+        
+        if not isinstance(escala, str):
+            raise TypeError('El parámetro escala debe ser de tipo str')
+        if escala not in self.dataframes_escalas.keys():
+            raise ValueError('La escala especificada no es válida')
+        
+        df = self.dataframes_escalas[escala]
+        if not isinstance(variables, list):
+            raise TypeError('El parámetro variables debe ser de tipo list')
+        for var in variables:
+            if not isinstance(var, str):
+                raise TypeError('Los elementos del parámetro variables deben ser de tipo str')
+            if var not in df.columns:
+                raise ValueError(f'La variable {var} no existe en el DataFrame de la escala especificada')
+            if var in self.variables_excluidas:
+                raise ValueError(f'La variable {var} está en la lista de variables excluidas')
+        
+        if var_base_normalizacion is not None:
+            if not isinstance(var_base_normalizacion, str):
+                raise TypeError('El parámetro var_base_normalizacion debe ser de tipo str o None')
+            if var_base_normalizacion not in df.columns:
+                raise ValueError(f'La variable {var_base_normalizacion} no existe en el DataFrame de la escala especificada')
+            if var_base_normalizacion in self.variables_excluidas:
+                raise ValueError(f'La variable {var_base_normalizacion} está en la lista de variables excluidas')
+        
+        if not isinstance(q, int):
+            raise TypeError('El parámetro q debe ser de tipo int')
+        if q < 1:
+            raise ValueError('El valor de q debe ser mayor a 1')
+        
+        # las variables no numericas se categorizan individualmente (pd.qcut reporta el error correspondiente)
+        
+        variables_numericas = [var for var in dict.fromkeys(variables) if pd.api.types.is_numeric_dtype(df[var])]
+        if var_base_normalizacion is not None and not pd.api.types.is_numeric_dtype(df[var_base_normalizacion]):
+            variables_numericas = []
+        
+        resultado = {}
+        if len(variables_numericas) > 0:
+            
+            # normalizacion de todas las variables en una sola matriz
+            
+            matriz = df[variables_numericas].to_numpy(dtype=np.float64, na_value=np.nan)
+            if var_base_normalizacion is not None:
+                # copia local de la base, igual que en normalizar_variable
+                base = df[var_base_normalizacion].to_numpy(dtype=np.float64, na_value=np.nan)
+                if (base == 0).any():
+                    print(f'Advertencia: La variable {var_base_normalizacion} contiene valores de cero, reemplazando por NaN para evitar potenciales divisiones entre cero')
+                    base = np.where(base == 0, np.nan, base)
+                matriz = matriz / base[:, None]
+            
+            # las columnas con valores infinitos no se agrupan, se categorizan individualmente con pd.qcut (que reporta el
+            # error correspondiente); tampoco las columnas sin bordes validos (por ejemplo, sin valores no nulos)
+            
+            con_infinitos = np.isinf(matriz).any(axis=0)
+            
+            # bordes de los cuantiles de todas las columnas, calculados igual que pd.qcut (percentiles lineales sin NaN)
+            
+            if self.error_cuantiles is not None:
+                bordes_matriz = np.column_stack([self.bordes_cuantiles(matriz[:, j], q=q) for j in range(matriz.shape[1])])
+            else:
+                with np.errstate(all='ignore'), warnings.catch_warnings():
+                    warnings.simplefilter('ignore', category=RuntimeWarning)
+                    bordes_matriz = np.nanpercentile(matriz, np.linspace(0, 1, q + 1) * 100, axis=0)
+            
+            categorias_cache = {}
+            for j, var in enumerate(variables_numericas):
+                
+                bordes = bordes_matriz[:, j]
+                if con_infinitos[j] or np.isnan(bordes).any():
+                    continue
+                if len(bordes) != 2:
+                    bordes = pd.unique(bordes) # duplicates='drop', excepto con dos bordes al igual que pd.qcut
+                
+                valores = matriz[:, j]
+                codigos = np.searchsorted(bordes, valores, side='left')
+                codigos[valores == bordes[0]] = 1
+                codigos[np.isnan(valores) | (codigos == len(bordes)) | (codigos == 0)] = 0
+                codigos = codigos - 1
+                
+                llave_bordes = bordes.tobytes()
+                if llave_bordes not in categorias_cache:
+                    categorias_cache[llave_bordes] = pd.cut(bordes, bins=bordes, include_lowest=True).categories
+                
+                resultado[var] = pd.Series(
+                    pd.Categorical.from_codes(codigos, dtype=pd.CategoricalDtype(categorias_cache[llave_bordes], ordered=True)),
+                    index=df.index,
+                    name=var if var_base_normalizacion is None else None
+                )
+        
+        for var in variables:
+            if var not in resultado:
+                resultado[var] = self.categorizar_variable(escala=escala, var=var, var_base_normalizacion=var_base_normalizacion, q=q)
+        
+        return resultado
+    
+    def __construir_indice_entidades(self, df:pd.DataFrame) -> pd.DataFrame:
+        
+        entidades = pd.Series('', index=df.index, dtype=object)
+        if len(df) > 0:
+            # se replica el tipo de una fila completa del DataFrame para conservar el formato de cada llave
+            tipo_fila = df.iloc[0].dtype
+            for col in self.variables_identificadoras:
+                entidades = entidades + df[col].astype(tipo_fila).astype(str)
+        
+        return pd.DataFrame({
+            'entidad': entidades,
+            'id_entidad': pd.factorize(entidades)[0],
+            'orden': np.arange(len(df))
+        }, index=df.index)
+    
+    def set_instrumentador(self, instrumentador:Instrumentador):
+        
+        if instrumentador is not None and not isinstance(instrumentador, Instrumentador):
+            raise TypeError('El parámetro instrumentador debe ser de tipo Instrumentador o None')
+        self.instrumentador = instrumentador
+    
+    def set_cache(self, cache:CacheResultados):
+        
+        if cache is not None and not isinstance(cache, CacheResultados):
+            raise TypeError('El parámetro cache debe ser de tipo CacheResultados o None')
+        self.cache = cache
+    
+    def set_representacion_cells(self, representacion_cells:str):
+        
+        if not isinstance(representacion_cells, str):
+            raise TypeError('El parámetro representacion_cells debe ser de tipo str')
+        if representacion_cells not in REPRESENTACIONES_CELLS:
+            raise ValueError(f'El valor de representacion_cells debe ser una de las cadenas: {", ".join(REPRESENTACIONES_CELLS)}')
+        self.representacion_cells = representacion_cells
+    
+    def set_error_cuantiles(self, error_cuantiles:float):
+        
+        # None utiliza los cuantiles exactos (pd.qcut); un valor entre 0 y 1 utiliza cuantiles aproximados con ese error de
+        # rango sobre las columnas en memoria (ver bordes_cuantiles). Valores mayores a ERROR_CUANTILES_MAXIMO solo se
+        # aceptan con advertencia (validacion_cuantiles los usa para medir la precision), main_procesador los rechaza
+        
+        if error_cuantiles is not None:
+            if not isinstance(error_cuantiles, (int, float)) or isinstance(error_cuantiles, bool):
+                raise TypeError('El parámetro error_cuantiles debe ser de tipo float o None')
+            if not 0 < error_cuantiles < 1:
+                raise ValueError('El valor de error_cuantiles debe estar entre 0 y 1')
+            if error_cuantiles > ERROR_CUANTILES_MAXIMO:
+                print(f'Advertencia: con error_cuantiles mayor a {ERROR_CUANTILES_MAXIMO} los bins pueden diferir notablemente de los de pd.qcut (ver data/inegi/validacion_cuantiles_inegi.csv)')
+        self.error_cuantiles = error_cuantiles
+    
+    def __huella_columna(self, escala:str, col:str) -> str:
+        
+        # huella del contenido (y tipo) de una columna de una escala, se calcula una sola vez por columna;
+        # la columna especial None corresponde a las llaves de las entidades (variables identificadoras)
+        
+        if (escala, col) not in self.__huellas_columnas:
+            if not isinstance(escala, str) or escala not in self.dataframes_escalas or (col is not None and (not isinstance(col, str) or col not in self.dataframes_escalas[escala].columns)):
+                return 'ausente'
+            serie = self.indices_entidades[escala]['entidad'] if col is None else self.dataframes_escalas[escala][col]
+            hashes = pd.util.hash_pandas_object(serie, index=False).to_numpy()
+            self.__huellas_columnas[(escala, col)] = hashlib.sha256(str(serie.dtype).encode() + hashes.tobytes()).hexdigest()
+        return self.__huellas_columnas[(escala, col)]
+    
+    def __llave_cache(self, escalas:list, var:str, var_base_normalizacion:str, q:int) -> str:
+        
+        componentes = {
+            'version': VERSION_CACHE,
+            'escalas': [
+                {
+                    'escala': escala,
+                    'entidades': self.__huella_columna(escala, None),
+                    'var': self.__huella_columna(escala, var),
+                    'var_base_normalizacion': self.__huella_columna(escala, var_base_normalizacion) if var_base_normalizacion is not None else None
+                }
+                for escala in escalas
+            ],
+            'var': var,
+            'var_base_normalizacion': var_base_normalizacion,
+            'q': q,
+            'representacion_cells': self.representacion_cells,
+            'error_cuantiles': self.error_cuantiles,
+            'nombre': self.diccionario_traducciones.get(var) if isinstance(var, str) else None
+        }
+        return hashlib.sha256(json.dumps(componentes, sort_keys=True, default=str).encode()).hexdigest()
+    
+    def __etapa(self, nombre:str, **detalles):
+        
+        if self.instrumentador is None:
+            return nullcontext({})
+        return self.instrumentador.etapa(nombre, **detalles)
+    
+    def get_indice_entidades(self, escala:str) -> pd.DataFrame:
+        
+        if escala not in self.indices_entidades.keys():
+            raise ValueError('La escala especificada no es válida')
+        return self.indices_entidades[escala]
+    
+    def generar_diccionario_entidades(self, escalas:list=None) -> pd.DataFrame:
+        
+        # relacion entre el id entero de cada entidad (representacion de cells 'enteros') y su llave, por escala
+        
+        if escalas is None:
+            escalas = list(self.indices_entidades.keys())
+        if not isinstance(escalas, list):
+            raise TypeError('El parámetro escalas debe ser de tipo list o None')
+        
+        diccionarios = []
+        for escala in escalas:
+            indice = self.get_indice_entidades(escala)
+            diccionario = indice.drop_duplicates(subset=['id_entidad'], keep='first').sort_values('id_entidad')
+            diccionarios.append(pd.DataFrame({
+                'escala': escala,
+                'id_entidad': diccionario['id_entidad'].to_numpy(),
+                'entidad': diccionario['entidad'].to_numpy()
+            }))
+        if len(diccionarios) == 0:
+            return pd.DataFrame(columns=['escala', 'id_entidad', 'entidad'])
+        return pd.concat(diccionarios, ignore_index=True)
     
     def __list_a_postgres_array(self, obj):
         
@@ -149,6 +450,22 @@ class Procesador:
     
     def procesar_variable(self, escalas:list, var:str, var_base_normalizacion:str=None, q:int=10) -> pd.DataFrame:
         
+        # las validaciones se realizan antes de consultar la cache: un resultado guardado solo se regresa para
+        # parametros que tambien serian validos sin cache
+        
+        validaciones = self.__validar_parametros(escalas=escalas, var=var, var_base_normalizacion=var_base_normalizacion, q=q)
+        if self.cache is None:
+            return self.__procesar_variable(escalas=escalas, var=var, var_base_normalizacion=var_base_normalizacion, q=q, categorizaciones_escalas={}, validaciones=validaciones)
+        
+        llave = self.__llave_cache(escalas=escalas, var=var, var_base_normalizacion=var_base_normalizacion, q=q)
+        resultado = self.cache.obtener(llave)
+        if resultado is None:
+            resultado = self.__procesar_variable(escalas=escalas, var=var, var_base_normalizacion=var_base_normalizacion, q=q, categorizaciones_escalas={}, validaciones=validaciones)
+            self.cache.guardar(llave, resultado)
+        return resultado
+    
+    def __validar_parametros(self, escalas:list, var:str, var_base_normalizacion:str, q:int) -> tuple:
+        
         # validaciones de parametros
         
         if not isinstance(escalas, list):
@@ -175,21 +492,12 @@ class Procesador:
         if q < 1:
             raise ValueError('El valor de q debe ser mayor a 1')
         
-        resultado = {
-            'name': [],
-            'code': [],
-            'bin': []
-        }
-        
         # se valida si la variable a procesar existe en al menos un dataframe de las escalas especificadas
         
         validacion_escalas_var = {escala:False for escala in escalas}
         validacion_escalas_var_base_normalizacion = {escala:False for escala in escalas}
         for escala in escalas:
             
-            resultado[f'interval_{escala}'] = []
-            resultado[f'cells_{escala}'] = []
-            
             if var not in self.dataframes_escalas[escala].columns:
                 print(f'La variable {var} (var) no existe en el DataFrame de la escala {escala}')
             else:
@@ -207,6 +515,25 @@ class Procesador:
         if all(validacion_escalas_var_base_normalizacion[escala] == False for escala in escalas):
             raise ValueError(f'La variable {var_base_normalizacion} (var_base_normalizacion) no existe en ninguno de los DataFrames de las escalas especificadas')
         
+        return validacion_escalas_var, validacion_escalas_var_base_normalizacion
+    
+    def __procesar_variable(self, escalas:list, var:str, var_base_normalizacion:str, q:int, categorizaciones_escalas:dict, validaciones:tuple=None) -> pd.DataFrame:
+        
+        # validaciones de parametros (procesar_variable las realiza antes de consultar la cache y las pasa en validaciones)
+        
+        if validaciones is None:
+            validaciones = self.__validar_parametros(escalas=escalas, var=var, var_base_normalizacion=var_base_normalizacion, q=q)
+        validacion_escalas_var, validacion_escalas_var_base_normalizacion = validaciones
+        
+        resultado = {
+            'name': [],
+            'code': [],
+            'bin': []
+        }
+        for escala in escalas:
+            resultado[f'interval_{escala}'] = []
+            resultado[f'cells_{escala}'] = []
+        
         nombre = self.diccionario_traducciones[var]
         codigo = var
         
@@ -217,14 +544,30 @@ class Procesador:
         for escala in escalas:
             
             if validacion_escalas_var[escala] and validacion_escalas_var_base_normalizacion[escala]:
-                variable_categorizada = self.categorizar_variable(escala=escala, var=var, var_base_normalizacion=var_base_normalizacion, q=q)
+                if escala in categorizaciones_escalas:
+                    variable_categorizada = categorizaciones_escalas[escala]
+                else:
+                    variable_categorizada = self.categorizar_variable(escala=escala, var=var, var_base_normalizacion=var_base_normalizacion, q=q)
                 variable_categorizada = variable_categorizada.cat.add_categories(['NaN'])
                 variable_categorizada = variable_categorizada.fillna('NaN')
                 
-                cells = {intervalo: [] for intervalo in variable_categorizada.cat.categories}
-                for i, intervalo in enumerate(variable_categorizada):
-                    entidad = "".join(str(self.dataframes_escalas[escala].iloc[i][col]) for col in self.variables_identificadoras)
-                    cells[intervalo].append(entidad)
+                # se agrupan las entidades segun el codigo de su intervalo, conservando el orden de las filas
+                
+                codigos = variable_categorizada.cat.codes.to_numpy()
+                orden = np.argsort(codigos, kind='stable')
+                limites = np.concatenate(([0], np.cumsum(np.bincount(codigos, minlength=len(variable_categorizada.cat.categories)))))
+                if self.representacion_cells == 'enteros':
+                    entidades_ordenadas = self.indices_entidades[escala]['id_entidad'].to_numpy()[orden]
+                    cells = {
+                        intervalo: np.sort(entidades_ordenadas[limites[j]:limites[j+1]]).tolist()
+                        for j, intervalo in enumerate(variable_categorizada.cat.categories)
+                    }
+                else:
+                    entidades_ordenadas = self.indices_entidades[escala]['entidad'].to_numpy()[orden]
+                    cells = {
+                        intervalo: entidades_ordenadas[limites[j]:limites[j+1]].tolist()
+                        for j, intervalo in enumerate(variable_categorizada.cat.categories)
+                    }
                                     
                 if len(cells['NaN']) == 0:
                     variable_categorizada = variable_categorizada.cat.remove_categories(['NaN'])
@@ -262,7 +605,112 @@ class Procesador:
         
         return df_resultado[~bins_nulos].reset_index(drop=True)
     
-    def procesar_multiples_variables_list(self, escalas:list, dicc:dict, q:int=10) -> dict:
+    def _procesar_grupo_variables(self, escalas:list, variables:list, var_base_normalizacion:str, q:int) -> list:
+        
+        # las variables que comparten var_base_normalizacion se categorizan en lote por escala
+        
+        categorizaciones = {}
+        for escala in escalas:
+            columnas = self.dataframes_escalas[escala].columns
+            if var_base_normalizacion is not None and var_base_normalizacion not in columnas:
+                categorizaciones[escala] = {}
+                continue
+            variables_escala = [var for var in variables if var in columnas]
+            with self.__etapa('categorizar_multiples_variables', filas=len(self.dataframes_escalas[escala]), columnas=len(variables_escala), escala=escala, var_base_normalizacion=var_base_normalizacion):
+                categorizaciones[escala] = self.categorizar_multiples_variables(
+                    escala=escala,
+                    variables=variables_escala,
+                    var_base_normalizacion=var_base_normalizacion,
+                    q=q
+                )
+        
+        filas_escalas = sum(len(self.dataframes_escalas[escala]) for escala in escalas)
+        resultados = []
+        for var in variables:
+            with self.__etapa('procesar_variable', filas=filas_escalas, columnas=1, variable=var, var_base_normalizacion=var_base_normalizacion):
+                resultados.append(self.__procesar_variable(
+                    escalas=escalas,
+                    var=var,
+                    var_base_normalizacion=var_base_normalizacion,
+                    q=q,
+                    categorizaciones_escalas={escala: categorizaciones[escala][var] for escala in escalas if var in categorizaciones[escala]}
+                ))
+        return resultados
+    
+    def __procesar_tareas_cache(self, tareas:list, workers:int) -> list:
+        
+        # se consultan los resultados guardados antes de repartir el trabajo, solo se procesan las variables faltantes
+        
+        llaves_tareas = [[self.__llave_cache(escalas, var, var_base_normalizacion, q) for var in variables] for escalas, variables, var_base_normalizacion, q in tareas]
+        resultados_tareas = [[self.cache.obtener(llave) for llave in llaves] for llaves in llaves_tareas]
+        
+        # los resultados obtenidos de la cache pasan por las mismas validaciones que las variables que se procesan
+        
+        for (escalas, variables, var_base_normalizacion, q), resultados in zip(tareas, resultados_tareas):
+            for var, resultado in zip(variables, resultados):
+                if resultado is not None:
+                    self.__validar_parametros(escalas=escalas, var=var, var_base_normalizacion=var_base_normalizacion, q=q)
+        
+        tareas_faltantes = []
+        for (escalas, variables, var_base_normalizacion, q), resultados in zip(tareas, resultados_tareas):
+            variables_faltantes = [var for var, resultado in zip(variables, resultados) if resultado is None]
+            if len(variables_faltantes) > 0:
+                tareas_faltantes.append((escalas, variables_faltantes, var_base_normalizacion, q))
+        total_faltantes = sum(len(variables) for _, variables, _, _ in tareas_faltantes)
+        print(f'Resultados obtenidos de la cache: {sum(len(llaves) for llaves in llaves_tareas) - total_faltantes}, variables a procesar: {total_faltantes}')
+        
+        procesados = iter(self.__procesar_tareas(tareas_faltantes, workers=workers, usar_cache=False))
+        
+        resultados_ordenados = []
+        for llaves, resultados in zip(llaves_tareas, resultados_tareas):
+            for llave, resultado in zip(llaves, resultados):
+                if resultado is None:
+                    resultado = next(procesados)
+                    self.cache.guardar(llave, resultado)
+                resultados_ordenados.append(resultado)
+        return resultados_ordenados
+    
+    def __procesar_tareas(self, tareas:list, workers:int, usar_cache:bool=True) -> list:
+        
+        # cada tarea es una tupla (escalas, variables, var_base_normalizacion, q), los resultados conservan el orden de las variables
+        
+        if usar_cache and self.cache is not None:
+            return self.__procesar_tareas_cache(tareas, workers)
+        
+        if workers == 1:
+            return [
+                resultado
+                for escalas, variables, var_base_normalizacion, q in tareas
+                for resultado in self._procesar_grupo_variables(escalas=escalas, variables=variables, var_base_normalizacion=var_base_normalizacion, q=q)
+            ]
+        
+        # los grupos se dividen en bloques de variables para repartirlos entre los procesos
+        
+        total_variables = sum(len(variables) for _, variables, _, _ in tareas)
+        tamano_bloque = max(1, -(-total_variables // (workers * 4)))
+        bloques = [
+            (escalas, variables[inicio:inicio+tamano_bloque], var_base_normalizacion, q)
+            for escalas, variables, var_base_normalizacion, q in tareas
+            for inicio in range(0, len(variables), tamano_bloque)
+        ]
+        if len(bloques) <= 1:
+            return self.__procesar_tareas(tareas, workers=1, usar_cache=False)
+        
+        metodo_inicio = 'fork' if 'fork' in multiprocessing.get_all_start_methods() else None
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(bloques)),
+            mp_context=multiprocessing.get_context(metodo_inicio),
+            initializer=_inicializar_trabajador,
+            initargs=(self,)
+        ) as executor:
+            resultados_bloques = []
+            for resultados, registros in executor.map(_procesar_bloque_trabajador, bloques):
+                resultados_bloques += resultados
+                if self.instrumentador is not None:
+                    self.instrumentador.agregar_registros(registros)
+            return resultados_bloques
+    
+    def procesar_multiples_variables_list(self, escalas:list, dicc:dict, q:int=10, workers:int=1) -> dict:
         
         if not isinstance(escalas, list):
             raise TypeError('El parámetro escalas debe ser de tipo list')
@@ -282,7 +730,12 @@ class Procesador:
         if q < 1:
             raise ValueError('El valor de q debe ser mayor a 1')
         
-        resultado = {}
+        if not isinstance(workers, int):
+            raise TypeError('El parámetro workers debe ser de tipo int')
+        if workers < 1:
+            raise ValueError('El valor de workers debe ser mayor o igual a 1')
+        
+        variables_grupos = {}
         
         for var_base_normalizacion, lista_vars in dicc.items():
             
@@ -296,7 +749,7 @@ class Procesador:
             if not isinstance(lista_vars, list):
                 raise TypeError('Los valores del diccionario deben ser de tipo list')
             
-            variables_procesadas = []
+            variables = []
             
             for var in lista_vars:
                 if not isinstance(var, str):
@@ -305,13 +758,26 @@ class Procesador:
                     print(f'La variable {var} está en la lista de variables excluidas, no se procesará')
                     continue
                 
-                variables_procesadas.append(self.procesar_variable(escalas=escalas, var=var, var_base_normalizacion=var_base_normalizacion, q=q))
-                
-            resultado[var_base_normalizacion] = pd.concat(variables_procesadas, ignore_index=True)
+                variables.append(var)
+            
+            variables_grupos[var_base_normalizacion] = variables
+        
+        # las variables de todos los grupos se procesan juntas y despues se reparten en su grupo
+        
+        variables_procesadas = self.__procesar_tareas(
+            [(escalas, variables, var_base_normalizacion, q) for var_base_normalizacion, variables in variables_grupos.items()],
+            workers=workers
+        )
+        
+        resultado = {}
+        inicio = 0
+        for var_base_normalizacion, variables in variables_grupos.items():
+            resultado[var_base_normalizacion] = pd.concat(variables_procesadas[inicio:inicio+len(variables)], ignore_index=True)
+            inicio += len(variables)
             
         return resultado
     
-    def procesar_multiples_variables_regex(self, escalas:list, dicc:dict, q:int=10) -> dict:
+    def procesar_multiples_variables_regex(self, escalas:list, dicc:dict, q:int=10, workers:int=1) -> dict:
     
         if not isinstance(escalas, list):
             raise TypeError('El parámetro escalas debe ser de tipo list')
@@ -331,7 +797,18 @@ class Procesador:
         if q < 1:
             raise ValueError('El valor de q debe ser mayor a 1')
         
-        resultado = {}
+        if not isinstance(workers, int):
+            raise TypeError('El parámetro workers debe ser de tipo int')
+        if workers < 1:
+            raise ValueError('El valor de workers debe ser mayor o igual a 1')
+        
+        # todas las expresiones se resuelven en un solo lote por escala, el ciclo consulta los resultados ya calculados
+        
+        expresiones = [regex for regex in dicc.values() if isinstance(regex, str)]
+        for escala in escalas:
+            self.selectores_columnas[escala].seleccionar_lote(expresiones)
+        
+        variables_grupos = {}
         
         for var_base_normalizacion, regex in dicc.items():
             
@@ -353,12 +830,12 @@ class Procesador:
             
             for escala in escalas:
                 
-                variables_regex = variables_regex | (set(obtener_variables_regex_df(self.dataframes_escalas[escala], regex)))
+                variables_regex = variables_regex | set(self.selectores_columnas[escala].seleccionar(regex))
                 
                 if len(variables_regex) == 0:
                     print(f'La expresión regular {regex} no coincide con ninguna variable')
                     
-            variables_procesadas = []
+            variables = []
                 
             for var in sorted(list(variables_regex)):
                 
@@ -366,8 +843,21 @@ class Procesador:
                     print(f'La variable {var} está en la lista de variables excluidas, no se procesará')
                     continue
 
-                variables_procesadas.append(self.procesar_variable(escalas=escalas, var=var, var_base_normalizacion=var_base_normalizacion, q=q))
-                
-            resultado[var_base_normalizacion] = pd.concat(variables_procesadas, ignore_index=True) if len(variables_procesadas) > 0 else None
+                variables.append(var)
+            
+            variables_grupos[var_base_normalizacion] = variables
+        
+        # las variables de todos los grupos se procesan juntas y despues se reparten en su grupo
+        
+        variables_procesadas = self.__procesar_tareas(
+            [(escalas, variables, var_base_normalizacion, q) for var_base_normalizacion, variables in variables_grupos.items()],
+            workers=workers
+        )
+        
+        resultado = {}
+        inicio = 0
+        for var_base_normalizacion, variables in variables_grupos.items():
+            resultado[var_base_normalizacion] = pd.concat(variables_procesadas[inicio:inicio+len(variables)], ignore_index=True) if len(variables) > 0 else None
+            inicio += len(variables)
             
         return resultado
@@ -0,0 +1,121 @@
+import math
+import numpy as np
+
+# sketch de cuantiles tipo KLL (Karnin, Lang, Liberty): niveles de compactadores donde cada elemento del nivel h
+# representa 2**h valores originales; al llenarse un nivel se ordena y se promueve la mitad de sus elementos
+# (posiciones pares o impares al azar) al nivel siguiente. Los sketches se combinan uniendo sus niveles, por lo que
+# se pueden construir por bloques de filas o en procesos distintos y unirse despues.
+
+C_CAPACIDAD = 2 / 3 # razon de capacidad entre un nivel y el siguiente
+CAPACIDAD_MINIMA = 8
+TAMANO_BLOQUE = 2**16 # valores que se agregan al nivel 0 antes de compactar
+
+def k_para_error(error:float) -> int:
+
+    # el error normalizado de rango de KLL es del orden de 1.7/k (con alta probabilidad); el reporte de
+    # validacion mide el error real obtenido
+    if not isinstance(error, (int, float)) or isinstance(error, bool):
+        raise TypeError('El parámetro error debe ser de tipo float')
+    if not 0 < error < 1:
+        raise ValueError('El valor de error debe estar entre 0 y 1')
+    return max(CAPACIDAD_MINIMA, math.ceil(2 / error))
+
+class SketchCuantiles:
+
+    def __init__(self, k:int=200, semilla:int=0):
+
+        if not isinstance(k, int) or isinstance(k, bool):
+            raise TypeError('El parámetro k debe ser de tipo int')
+        if k < CAPACIDAD_MINIMA:
+            raise ValueError(f'El valor de k debe ser mayor o igual a {CAPACIDAD_MINIMA}')
+
+        self.k = k
+        self.n = 0
+        self.minimo = np.nan
+        self.maximo = np.nan
+        self.niveles = [np.zeros(0, dtype=np.float64)]
+        self.__aleatorio = np.random.default_rng(semilla)
+
+    def __capacidad(self, nivel:int) -> int:
+
+        altura = len(self.niveles)
+        return max(CAPACIDAD_MINIMA, math.ceil(self.k * C_CAPACIDAD ** (altura - nivel - 1)))
+
+    def __compactar(self):
+
+        nivel = 0
+        while nivel < len(self.niveles):
+            elementos = self.niveles[nivel]
+            if len(elementos) > self.__capacidad(nivel):
+                if nivel + 1 == len(self.niveles):
+                    self.niveles.append(np.zeros(0, dtype=np.float64))
+                elementos = np.sort(elementos)
+                # con un numero impar de elementos, uno se conserva en el nivel actual
+                restante = elementos[:len(elementos) % 2]
+                elementos = elementos[len(elementos) % 2:]
+                promovidos = elementos[self.__aleatorio.integers(2)::2]
+                self.niveles[nivel] = restante
+                self.niveles[nivel + 1] = np.concatenate((self.niveles[nivel + 1], promovidos))
+            nivel += 1
+
+    def actualizar(self, valores) -> 'SketchCuantiles':
+
+        valores = np.asarray(valores, dtype=np.float64).ravel()
+        valores = valores[~np.isnan(valores)]
+        if len(valores) == 0:
+            return self
+
+        self.n += len(valores)
+        self.minimo = np.fmin(self.minimo, valores.min())
+        self.maximo = np.fmax(self.maximo, valores.max())
+
+        # los valores se agregan por bloques: la memoria adicional queda acotada por el tamaño del bloque
+        for inicio in range(0, len(valores), TAMANO_BLOQUE):
+            self.niveles[0] = np.concatenate((self.niveles[0], valores[inicio:inicio + TAMANO_BLOQUE]))
+            self.__compactar()
+        return self
+
+    def combinar(self, otro:'SketchCuantiles') -> 'SketchCuantiles':
+
+        if not isinstance(otro, SketchCuantiles):
+            raise TypeError('El parámetro otro debe ser de tipo SketchCuantiles')
+        if otro.n == 0:
+            return self
+
+        self.n += otro.n
+        self.minimo = np.fmin(self.minimo, otro.minimo)
+        self.maximo = np.fmax(self.maximo, otro.maximo)
+        while len(self.niveles) < len(otro.niveles):
+            self.niveles.append(np.zeros(0, dtype=np.float64))
+        for nivel, elementos in enumerate(otro.niveles):
+            self.niveles[nivel] = np.concatenate((self.niveles[nivel], elementos))
+        self.__compactar()
+        return self
+
+    def cuantiles(self, probabilidades) -> np.ndarray:
+
+        # interpolacion lineal entre elementos ponderados, equivalente a np.percentile (metodo lineal) mientras
+        # ningun nivel se haya compactado; los extremos son el minimo y el maximo exactos
+
+        probabilidades = np.asarray(probabilidades, dtype=np.float64)
+        if self.n == 0:
+            return np.full(probabilidades.shape, np.nan)
+
+        elementos = np.concatenate(self.niveles)
+        pesos = np.concatenate([np.full(len(niveles), 2.0 ** nivel) for nivel, niveles in enumerate(self.niveles)])
+        orden = np.argsort(elementos, kind='stable')
+        elementos = elementos[orden]
+        pesos = pesos[orden]
+
+        # cada elemento ocupa las posiciones [acumulado previo, acumulado) y se ubica en el centro de su rango
+        centros = np.cumsum(pesos) - pesos + (pesos - 1) / 2
+        posiciones = probabilidades * (self.n - 1)
+        resultado = np.interp(posiciones, centros, elementos)
+        resultado = np.clip(resultado, self.minimo, self.maximo)
+        resultado[probabilidades <= 0] = self.minimo
+        resultado[probabilidades >= 1] = self.maximo
+        return resultado
+
+    def tamano(self) -> int:
+
+        return int(sum(len(elementos) for elementos in self.niveles))
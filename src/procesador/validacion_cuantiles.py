@@ -0,0 +1,114 @@
+import os
+import json
+import argparse
+import numpy as np
+import pandas as pd
+from procesador.procesador import Procesador
+from utils.io_utils import leer_tabla, escribir_tabla
+
+# reporte de validacion de los cuantiles aproximados (sketches KLL) contra los cuantiles exactos (pd.qcut):
+# por escala, variable y error configurado se compara la posicion (rango) de cada borde aproximado, la diferencia
+# de los bordes relativa al rango de la variable y la proporcion de entidades asignadas a un bin distinto
+
+def comparar_cuantiles(valores:np.ndarray, bordes_exactos:np.ndarray, bordes_aproximados:np.ndarray, exacta:pd.Series, aproximada:pd.Series) -> dict:
+
+    validos = np.sort(valores[~np.isnan(valores)])
+    if len(validos) == 0 or np.isnan(bordes_aproximados).any():
+        return {}
+
+    # el rango de un borde es la fraccion de valores menores o iguales a el; los extremos (minimo y maximo) son exactos
+    rangos_exactos = np.searchsorted(validos, bordes_exactos[1:-1], side='right') / len(validos)
+    rangos_aproximados = np.searchsorted(validos, bordes_aproximados[1:-1], side='right') / len(validos)
+    amplitud = validos[-1] - validos[0]
+
+    codigos_exactos = exacta.cat.codes.to_numpy()
+    codigos_aproximados = aproximada.cat.codes.to_numpy()
+    con_valor = ~np.isnan(valores)
+
+    return {
+        'n': len(validos),
+        'bins_exactos': len(exacta.cat.categories),
+        'bins_aproximados': len(aproximada.cat.categories),
+        'error_rango_maximo': float(np.max(np.abs(rangos_aproximados - rangos_exactos), initial=0.0)),
+        'diferencia_bordes_relativa_maxima': float(np.max(np.abs(bordes_aproximados - bordes_exactos)) / amplitud) if amplitud > 0 else 0.0,
+        'proporcion_bins_distintos': float(np.mean(codigos_exactos[con_valor] != codigos_aproximados[con_valor]))
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Validación de cuantiles aproximados contra cuantiles exactos')
+    parser.add_argument('--config', type=str, required=True, help='Archivo de configuración')
+    args = parser.parse_args()
+
+    with open(args.config) as f:
+        validacion_config = json.load(f)
+
+    if 'rutas_csv_escalas' not in validacion_config:
+        raise ValueError('El archivo JSON pasado para --config debe tener el campo rutas_csv_escalas')
+    rutas_csv_escalas = validacion_config['rutas_csv_escalas']
+    for escala, ruta in rutas_csv_escalas.items():
+        if not os.path.exists(ruta):
+            raise FileNotFoundError(f'La ruta especificada para el archivo .csv de la escala {escala} no existe')
+
+    if 'variables_identificadoras' not in validacion_config:
+        raise ValueError('El archivo JSON pasado para --config debe tener el campo variables_identificadoras')
+    variables_identificadoras = validacion_config['variables_identificadoras']
+    variables_excluidas_list = validacion_config.get('variables_excluidas_list', [])
+    variables_excluidas_regex = validacion_config.get('variables_excluidas_regex', [])
+    var_base_normalizacion = validacion_config.get('var_base_normalizacion')
+    q = validacion_config.get('q', 10)
+
+    errores_cuantiles = validacion_config.get('errores_cuantiles', [0.05, 0.01, 0.002])
+    if not isinstance(errores_cuantiles, list):
+        raise TypeError('El valor asociado al campo errores_cuantiles debe ser de tipo list')
+
+    if 'ruta_csv_salida' not in validacion_config:
+        raise ValueError('El archivo JSON pasado para --config debe tener el campo ruta_csv_salida')
+    ruta_csv_salida = validacion_config['ruta_csv_salida']
+
+    dtype_dict = {col: str for col in variables_identificadoras}
+    dataframes_escalas = {escala: leer_tabla(ruta, dtype=dtype_dict) for escala, ruta in rutas_csv_escalas.items()}
+
+    # el reporte no utiliza nombres descriptivos, cada variable se traduce a si misma
+    columnas = list(dict.fromkeys(col for dataframe in dataframes_escalas.values() for col in dataframe.columns))
+    diccionario_traducciones = pd.DataFrame({'variable': columnas, 'traduccion': columnas})
+
+    procesador = Procesador(
+        dataframes_escalas=dataframes_escalas,
+        diccionario_traducciones=diccionario_traducciones,
+        columna_diccionario_traducciones_nombres='traduccion',
+        columna_diccionario_traducciones_alias='variable',
+        variables_identificadoras=variables_identificadoras,
+        variables_excluidas_list=variables_excluidas_list,
+        variables_excluidas_regex=variables_excluidas_regex
+    )
+    variables_excluidas = set(procesador.get_variables_excluidas())
+
+    registros = []
+    for escala, dataframe in dataframes_escalas.items():
+
+        variables = [
+            var for var in dataframe.columns
+            if var not in variables_excluidas and var != var_base_normalizacion and pd.api.types.is_numeric_dtype(dataframe[var])
+        ]
+        print(f'Escala {escala}: {len(variables)} variables')
+
+        procesador.set_error_cuantiles(None)
+        exactas = procesador.categorizar_multiples_variables(escala=escala, variables=variables, var_base_normalizacion=var_base_normalizacion, q=q)
+        valores = {var: procesador.normalizar_variable(escala=escala, var=var, var_base_normalizacion=var_base_normalizacion).to_numpy(dtype=np.float64, na_value=np.nan) for var in variables}
+        bordes_exactos = {var: procesador.bordes_cuantiles(valores[var], q=q) for var in variables}
+
+        for error_cuantiles in errores_cuantiles:
+            procesador.set_error_cuantiles(error_cuantiles)
+            aproximadas = procesador.categorizar_multiples_variables(escala=escala, variables=variables, var_base_normalizacion=var_base_normalizacion, q=q)
+            for var in variables:
+                bordes_aproximados = procesador.bordes_cuantiles(valores[var], q=q)
+                comparacion = comparar_cuantiles(valores[var], bordes_exactos[var], bordes_aproximados, exactas[var], aproximadas[var])
+                if len(comparacion) > 0:
+                    registros.append({'escala': escala, 'variable': var, 'error_cuantiles': error_cuantiles, **comparacion})
+
+    reporte = pd.DataFrame(registros)
+    escribir_tabla(reporte, ruta_csv_salida)
+
+    resumen = reporte.groupby(['escala', 'error_cuantiles'])[['error_rango_maximo', 'diferencia_bordes_relativa_maxima', 'proporcion_bins_distintos']].agg(['mean', 'max'])
+    print(resumen.to_string())
+    print(f'El reporte de validación se encuentra en la ruta:\n{ruta_csv_salida}')
@@ -0,0 +1,60 @@
+import os
+import numpy as np
+import pandas as pd
+
+# representacion dispersa (COO) de los conteos categoricos: en lugar de la matriz ancha (grupos x variable-valor),
+# que es casi toda ceros cuando las variables tienen muchas categorias, se guarda una tabla de coordenadas con una
+# fila por celda distinta de cero (llaves del grupo, columna, conteo) y un indice de columnas (columna, variable)
+# con el orden de la matriz densa. La matriz ancha solo se construye cuando un consumidor la necesita
+
+def rutas_conteos_dispersos(ruta_salida:str) -> tuple:
+    # rutas por defecto de la tabla de coordenadas y del indice de columnas, junto a la salida del preprocesamiento
+    if not isinstance(ruta_salida, str):
+        raise TypeError('El parámetro ruta_salida debe ser de tipo str')
+    base, extension = os.path.splitext(ruta_salida)
+    return f'{base}_conteos{extension}', f'{base}_columnas{extension}'
+
+def a_coordenadas(df_conteos:pd.DataFrame, variables_id_agrupacion:list) -> tuple:
+    # de conteos en formato largo (llaves, variable categorica ordenada, conteo) a la tabla de coordenadas y su indice
+    if not isinstance(df_conteos, pd.DataFrame):
+        raise TypeError('El parámetro df_conteos debe ser de tipo pd.DataFrame')
+    if not isinstance(variables_id_agrupacion, list):
+        raise TypeError('El parámetro variables_id_agrupacion debe ser de tipo list')
+    if not isinstance(df_conteos['variable'].dtype, pd.CategoricalDtype):
+        raise TypeError('La columna variable de df_conteos debe ser de tipo category')
+
+    df_coordenadas = df_conteos[variables_id_agrupacion].copy()
+    df_coordenadas['columna'] = df_conteos['variable'].cat.codes.astype(np.int64)
+    df_coordenadas['conteo'] = df_conteos['conteo'].to_numpy()
+
+    categorias = df_conteos['variable'].cat.categories
+    df_columnas = pd.DataFrame({'columna': np.arange(len(categorias), dtype=np.int64), 'variable': categorias.astype(str)})
+
+    return df_coordenadas, df_columnas
+
+def densificar_conteos(df_coordenadas:pd.DataFrame, df_columnas:pd.DataFrame, variables_id_agrupacion:list, variables:list=None) -> pd.DataFrame:
+    # matriz ancha de conteos (una columna entera por variable-valor, ceros donde no hay observaciones), solo con las
+    # variables indicadas (todas si variables es None) y en el orden del indice de columnas
+    if not isinstance(df_coordenadas, pd.DataFrame):
+        raise TypeError('El parámetro df_coordenadas debe ser de tipo pd.DataFrame')
+    if not isinstance(df_columnas, pd.DataFrame):
+        raise TypeError('El parámetro df_columnas debe ser de tipo pd.DataFrame')
+    if not isinstance(variables_id_agrupacion, list):
+        raise TypeError('El parámetro variables_id_agrupacion debe ser de tipo list')
+    if variables is not None and not isinstance(variables, list):
+        raise TypeError('El parámetro variables debe ser de tipo list o None')
+
+    seleccion = df_columnas.sort_values('columna')
+    if variables is not None:
+        seleccion = seleccion.loc[seleccion['variable'].isin(variables)]
+    posiciones = pd.Series(np.arange(len(seleccion)), index=seleccion['columna'].to_numpy())
+
+    df_coordenadas = df_coordenadas.loc[df_coordenadas['columna'].isin(posiciones.index)]
+    agrupado_filas = df_coordenadas.groupby(variables_id_agrupacion, sort=True, observed=True)
+    grupos = agrupado_filas.size().index
+
+    matriz = np.zeros((len(grupos), len(seleccion)), dtype=np.int64)
+    matriz[agrupado_filas.ngroup().to_numpy(), posiciones.loc[df_coordenadas['columna'].to_numpy()].to_numpy()] = df_coordenadas['conteo'].to_numpy()
+
+    df_denso = pd.DataFrame(matriz, columns=seleccion['variable'].tolist())
+    return pd.concat([grupos.to_frame(index=False), df_denso], axis=1)
@@ -0,0 +1,108 @@
+import os
+import sys
+import json
+import time
+import resource
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+class Instrumentador:
+
+    def __init__(self, activo:bool=True, medir_tracemalloc:bool=False):
+
+        if not isinstance(activo, bool):
+            raise TypeError('El parámetro activo debe ser de tipo bool')
+        if not isinstance(medir_tracemalloc, bool):
+            raise TypeError('El parámetro medir_tracemalloc debe ser de tipo bool')
+        self.activo = activo
+        self.medir_tracemalloc = medir_tracemalloc
+
+        # registros en orden de inicio de cada etapa; las etapas anidadas guardan su nivel
+        self.registros = []
+        self.__pila = []
+        self.__inicio = time.perf_counter()
+        self.__fecha_inicio = datetime.now().isoformat(timespec='seconds')
+
+    def __rss_maximo_mb(self) -> float:
+
+        # ru_maxrss esta en KB en linux y en bytes en macOS; es el maximo del proceso hasta el momento
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss / 2**20 if sys.platform == 'darwin' else rss / 2**10
+
+    @contextmanager
+    def etapa(self, nombre:str, filas:int=None, columnas:int=None, **detalles):
+
+        # el registro se entrega al bloque para que pueda completar filas, columnas o detalles al final de la etapa
+        registro = {'etapa': nombre, 'filas': filas, 'columnas': columnas, **detalles}
+        if not self.activo:
+            yield registro
+            return
+
+        if self.medir_tracemalloc and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+        registro['nivel'] = len(self.__pila)
+        registro['proceso'] = os.getpid()
+        self.registros.append(registro)
+
+        # tracemalloc tiene un solo pico global: se reinicia al entrar a cada etapa y el pico previo
+        # se conserva en la etapa contenedora para no perderlo
+        marco = {'pico_hijos': 0}
+        if self.medir_tracemalloc:
+            actual, pico_previo = tracemalloc.get_traced_memory()
+            if len(self.__pila) > 0:
+                self.__pila[-1]['pico_hijos'] = max(self.__pila[-1]['pico_hijos'], pico_previo)
+            tracemalloc.reset_peak()
+            registro['memoria_inicial_mb'] = actual / 2**20
+        self.__pila.append(marco)
+
+        inicio = time.perf_counter()
+        try:
+            yield registro
+        finally:
+            registro['segundos'] = time.perf_counter() - inicio
+            self.__pila.pop()
+            if self.medir_tracemalloc:
+                pico = max(tracemalloc.get_traced_memory()[1], marco['pico_hijos'])
+                registro['memoria_pico_mb'] = pico / 2**20
+                if len(self.__pila) > 0:
+                    self.__pila[-1]['pico_hijos'] = max(self.__pila[-1]['pico_hijos'], pico)
+            registro['rss_maximo_mb'] = self.__rss_maximo_mb()
+
+    def nivel_actual(self) -> int:
+
+        return len(self.__pila)
+
+    def agregar_registros(self, registros:list):
+
+        # registros generados en otros procesos (trabajadores), se anidan bajo la etapa actual
+        if not self.activo:
+            return
+        if not isinstance(registros, list):
+            raise TypeError('El parámetro registros debe ser de tipo list')
+        nivel = len(self.__pila)
+        for registro in registros:
+            self.registros.append({**registro, 'nivel': registro.get('nivel', 0) + nivel})
+
+    def generar_reporte(self) -> dict:
+
+        return {
+            'fecha_inicio': self.__fecha_inicio,
+            'segundos_totales': time.perf_counter() - self.__inicio,
+            'tracemalloc': self.medir_tracemalloc,
+            'rss_maximo_mb': self.__rss_maximo_mb(),
+            'etapas': self.registros
+        }
+
+    def escribir_reporte(self, ruta:str):
+
+        if not isinstance(ruta, str):
+            raise TypeError('El parámetro ruta debe ser de tipo str')
+        with open(ruta, 'w') as f:
+            json.dump(self.generar_reporte(), f, indent=4, ensure_ascii=False, default=str)
+
+def ruta_reporte_instrumentacion(ruta_salida:str) -> str:
+
+    # el reporte se escribe junto al archivo de salida: <salida sin extension>_instrumentacion.json
+    return f'{os.path.splitext(ruta_salida)[0]}_instrumentacion.json'
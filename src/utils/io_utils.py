@@ -0,0 +1,121 @@
+import os
+import numpy as np
+import pandas as pd
+
+# formatos soportados entre etapas segun la extension del archivo:
+#   .csv (y otras)    texto, se vuelve a interpretar en cada lectura
+#   .parquet          columnar binario comprimido, conserva los tipos de cada columna
+#   .feather, .arrow  Arrow IPC sin compresion, lectura mas rapida y con tipos conservados
+# los formatos binarios requieren pyarrow
+
+EXTENSIONES_FORMATOS = {
+    '.csv': 'csv',
+    '.parquet': 'parquet',
+    '.feather': 'feather',
+    '.arrow': 'feather'
+}
+
+def obtener_formato(ruta:str) -> str:
+    if not isinstance(ruta, str):
+        raise TypeError('El parámetro ruta debe ser de tipo str')
+    extension = os.path.splitext(ruta)[1].lower()
+    return EXTENSIONES_FORMATOS.get(extension, 'csv') # cualquier otra extension se interpreta como texto .csv
+
+def _importar_pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise ImportError('Los formatos .parquet, .feather y .arrow requieren la librería pyarrow (pip install pyarrow)')
+    return pyarrow
+
+def leer_columnas(ruta:str) -> list:
+    formato = obtener_formato(ruta)
+    if formato == 'csv':
+        return list(pd.read_csv(ruta, nrows=0).columns)
+    _importar_pyarrow()
+    if formato == 'parquet':
+        import pyarrow.parquet
+        return list(pyarrow.parquet.ParquetFile(ruta).schema_arrow.names)
+    import pyarrow.ipc
+    with pyarrow.ipc.open_file(ruta) as lector:
+        return list(lector.schema.names)
+
+def leer_tabla(ruta:str, columnas:list=None, dtype:dict=None) -> pd.DataFrame:
+    formato = obtener_formato(ruta)
+    if columnas is not None and not isinstance(columnas, list):
+        raise TypeError('El parámetro columnas debe ser de tipo list o None')
+    if dtype is not None and not isinstance(dtype, dict):
+        raise TypeError('El parámetro dtype debe ser de tipo dict o None')
+
+    if formato == 'csv':
+        return pd.read_csv(ruta, usecols=columnas, dtype=dtype)
+
+    _importar_pyarrow()
+    if formato == 'parquet':
+        df = pd.read_parquet(ruta, columns=columnas)
+    else:
+        df = pd.read_feather(ruta, columns=columnas)
+
+    df = _arreglos_a_listas(df)
+    if dtype is not None:
+        df = df.astype({col: tipo for col, tipo in dtype.items() if col in df.columns})
+    return df
+
+def _arreglos_a_listas(df:pd.DataFrame) -> pd.DataFrame:
+    # las columnas de listas (cells) se leen como arreglos de numpy, se regresan a listas como en memoria
+    for col in df.columns[df.dtypes == object]:
+        no_nulos = df[col].dropna()
+        if len(no_nulos) > 0 and isinstance(no_nulos.iloc[0], np.ndarray):
+            df[col] = df[col].map(lambda valor: valor.tolist() if isinstance(valor, np.ndarray) else valor)
+    return df
+
+def leer_tabla_por_bloques(ruta:str, tamano_bloque:int, columnas:list=None):
+    formato = obtener_formato(ruta)
+    if not isinstance(tamano_bloque, int) or isinstance(tamano_bloque, bool):
+        raise TypeError('El parámetro tamano_bloque debe ser de tipo int')
+    if tamano_bloque < 1:
+        raise ValueError('El parámetro tamano_bloque debe ser mayor o igual a 1')
+    if columnas is not None and not isinstance(columnas, list):
+        raise TypeError('El parámetro columnas debe ser de tipo list o None')
+
+    # generador de DataFrames de a lo mas tamano_bloque filas, nunca se carga la tabla completa en memoria
+
+    if formato == 'csv':
+        with pd.read_csv(ruta, usecols=columnas, chunksize=tamano_bloque) as lector:
+            for bloque in lector:
+                yield bloque
+        return
+
+    pyarrow = _importar_pyarrow()
+    if formato == 'parquet':
+        import pyarrow.parquet
+        lotes = pyarrow.parquet.ParquetFile(ruta).iter_batches(batch_size=tamano_bloque, columns=columnas)
+        for lote in lotes:
+            yield _arreglos_a_listas(lote.to_pandas())
+        return
+
+    import pyarrow.ipc
+    with pyarrow.memory_map(ruta) as archivo:
+        lector = pyarrow.ipc.open_file(archivo)
+        for i in range(lector.num_record_batches):
+            lote = lector.get_batch(i)
+            if columnas is not None:
+                lote = lote.select(columnas)
+            for inicio in range(0, lote.num_rows, tamano_bloque):
+                yield _arreglos_a_listas(lote.slice(inicio, tamano_bloque).to_pandas())
+
+def escribir_tabla(df:pd.DataFrame, ruta:str):
+    if not isinstance(df, pd.DataFrame):
+        raise TypeError('El parámetro df debe ser de tipo pd.DataFrame')
+    formato = obtener_formato(ruta)
+
+    if formato == 'csv':
+        df.to_csv(ruta, index=False)
+        return
+
+    _importar_pyarrow()
+    df = df.reset_index(drop=True)
+    if formato == 'parquet':
+        df.to_parquet(ruta, index=False)
+    else:
+        df.to_feather(ruta)
@@ -1,13 +1,91 @@
 import pandas as pd
 import re
+import functools
 
-def obtener_variables_regex_df(df: pd.DataFrame, regex: str) -> list:
-    if not isinstance(df, pd.DataFrame):
-        raise TypeError('El parámetro df debe ser de tipo pd.DataFrame')
+# las expresiones con referencias a grupos (\1, (?P=nombre)) o banderas globales no pueden combinarse
+# en una sola alternancia sin cambiar su significado, se evaluan por separado
+PATRON_NO_COMBINABLE = re.compile(r'\\[1-9]|\(\?P=|\(\?[aiLmsux]+\)')
+
+def compilar_regex(regex: str) -> re.Pattern:
     if not isinstance(regex, str):
         raise TypeError('El parámetro regex debe ser de tipo str')
+    return _compilar_regex(regex)
+
+@functools.lru_cache(maxsize=1024)
+def _compilar_regex(regex: str) -> re.Pattern:
     try:
-        pattern = re.compile(regex)
+        return re.compile(regex)
     except re.error:
         raise ValueError(f'La expresión regular {regex} no es válida')
-    return list(df.filter(regex=regex).columns)
\ No newline at end of file
+
+class SelectorColumnas:
+
+    def __init__(self, columnas: list):
+
+        if not isinstance(columnas, (list, tuple)):
+            raise TypeError('El parámetro columnas debe ser de tipo list')
+        self.columnas = tuple(columnas)
+        self.__nombres = [str(col) for col in self.columnas]
+        self.__resultados = {}
+
+    def seleccionar(self, regex: str) -> list:
+
+        # misma seleccion que DataFrame.filter(regex=...): columnas en su orden original donde la expresion encuentra coincidencia
+        if regex not in self.__resultados:
+            self.seleccionar_lote([regex])
+        return list(self.__resultados[regex])
+
+    def seleccionar_lote(self, expresiones: list) -> dict:
+
+        if not isinstance(expresiones, list):
+            raise TypeError('El parámetro expresiones debe ser de tipo list')
+        # DataFrame.filter(regex='') no selecciona columnas sino que falla, una expresion vacia tampoco se acepta aqui
+        if '' in expresiones:
+            raise ValueError('La expresión regular no puede estar vacía')
+        patrones = {regex: compilar_regex(regex) for regex in expresiones}
+        pendientes = [regex for regex in patrones if regex not in self.__resultados]
+
+        if len(pendientes) > 0:
+            combinables = [regex for regex in pendientes if PATRON_NO_COMBINABLE.search(regex) is None]
+
+            # una sola alternancia descarta las columnas que no coinciden con ninguna expresion del lote,
+            # solo las columnas restantes se evaluan con cada expresion
+            indices_candidatos = range(len(self.__nombres))
+            if len(combinables) > 1:
+                try:
+                    combinado = re.compile('|'.join(f'(?:{regex})' for regex in combinables))
+                    indices_candidatos = [i for i, nombre in enumerate(self.__nombres) if combinado.search(nombre) is not None]
+                except re.error:
+                    pass
+
+            for regex in pendientes:
+                indices = indices_candidatos if regex in combinables else range(len(self.__nombres))
+                patron = patrones[regex]
+                self.__resultados[regex] = tuple(self.columnas[i] for i in indices if patron.search(self.__nombres[i]) is not None)
+
+        return {regex: list(self.__resultados[regex]) for regex in patrones}
+
+@functools.lru_cache(maxsize=64)
+def _obtener_selector(columnas: tuple) -> SelectorColumnas:
+    return SelectorColumnas(columnas)
+
+def obtener_selector_columnas(columnas: list) -> SelectorColumnas:
+    # un selector por conjunto de columnas, compartido entre llamadas para reutilizar sus resultados
+    if not isinstance(columnas, (list, tuple)):
+        raise TypeError('El parámetro columnas debe ser de tipo list')
+    return _obtener_selector(tuple(columnas))
+
+def obtener_variables_regex_df(df: pd.DataFrame, regex: str) -> list:
+    if not isinstance(df, pd.DataFrame):
+        raise TypeError('El parámetro df debe ser de tipo pd.DataFrame')
+    if not isinstance(regex, str):
+        raise TypeError('El parámetro regex debe ser de tipo str')
+    return obtener_variables_regex_columnas(list(df.columns), regex)
+
+def obtener_variables_regex_columnas(columnas: list, regex: str) -> list:
+    # misma seleccion que DataFrame.filter(regex=...), pero sobre una lista de nombres (por ejemplo, solo el encabezado de un archivo)
+    if not isinstance(columnas, list):
+        raise TypeError('El parámetro columnas debe ser de tipo list')
+    if not isinstance(regex, str):
+        raise TypeError('El parámetro regex debe ser de tipo str')
+    return obtener_selector_columnas(columnas).seleccionar(regex)
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# los paquetes se importan desde src, igual que al ejecutar los modulos con python -m desde esa carpeta
+RUTA_SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src')
+sys.path.insert(0, RUTA_SRC)
@@ -0,0 +1,100 @@
+import os
+import hashlib
+import pickle
+import pandas as pd
+import pytest
+from benchmarks.generador_datos import generar_escalas
+from procesador.procesador import Procesador
+from procesador.cache_resultados import CacheResultados
+
+def llave(texto:str) -> str:
+    return hashlib.sha256(texto.encode()).hexdigest()
+
+@pytest.fixture
+def resultado():
+    return pd.DataFrame({'code': ['VAR_001'] * 3, 'bin': [0, 1, 2], 'cells_mun': [['01'], ['02', '03'], []]})
+
+def test_acierto_y_fallo(tmp_path, resultado):
+    cache = CacheResultados(directorio=str(tmp_path))
+    assert cache.obtener(llave('a')) is None
+    cache.guardar(llave('a'), resultado)
+    pd.testing.assert_frame_equal(cache.obtener(llave('a')), resultado)
+    assert (cache.aciertos, cache.fallos) == (1, 1)
+
+def test_llave_invalida(tmp_path, resultado):
+    cache = CacheResultados(directorio=str(tmp_path))
+    with pytest.raises(ValueError):
+        cache.guardar('../fuera', resultado)
+
+@pytest.mark.parametrize('contenido', [b'no es un pickle', None, pickle.dumps({'no': 'es un DataFrame'})])
+def test_entrada_corrupta_se_elimina(tmp_path, resultado, contenido):
+    cache = CacheResultados(directorio=str(tmp_path))
+    cache.guardar(llave('a'), resultado)
+    ruta = tmp_path / f'{llave("a")}.pkl'
+
+    # None: pickle truncado a la mitad
+    datos = ruta.read_bytes()
+    ruta.write_bytes(datos[:len(datos) // 2] if contenido is None else contenido)
+
+    assert cache.obtener(llave('a')) is None
+    assert not ruta.exists()
+    assert cache.fallos == 1
+
+    cache.guardar(llave('a'), resultado)
+    pd.testing.assert_frame_equal(cache.obtener(llave('a')), resultado)
+
+def test_limpiar_conserva_archivos_ajenos(tmp_path, resultado):
+    (tmp_path / 'estado_agregados.pkl').write_bytes(b'estado')
+    (tmp_path / 'notas.txt').write_text('notas')
+    cache = CacheResultados(directorio=str(tmp_path))
+    cache.guardar(llave('a'), resultado)
+    (tmp_path / f'{llave("b")}.pkl.123.tmp').write_bytes(b'incompleto')
+
+    cache.limpiar()
+
+    assert sorted(os.listdir(tmp_path)) == ['estado_agregados.pkl', 'notas.txt']
+    assert cache.obtener(llave('a')) is None
+
+def test_desalojo_conserva_archivos_ajenos(tmp_path, resultado):
+    (tmp_path / 'estado_agregados.pkl').write_bytes(b'x' * 2**20)
+    resultado.to_pickle(tmp_path / 'medida.tmp')
+    tamano_entrada = os.path.getsize(tmp_path / 'medida.tmp')
+    os.remove(tmp_path / 'medida.tmp')
+    cache = CacheResultados(directorio=str(tmp_path), tamano_maximo_mb=1.5 * tamano_entrada / 2**20)
+    cache.guardar(llave('a'), resultado)
+    cache.guardar(llave('b'), resultado)
+
+    # solo cabe una entrada; el archivo ajeno no cuenta para el tamaño y no se elimina
+    assert (tmp_path / 'estado_agregados.pkl').exists()
+    assert cache.obtener(llave('a')) is None
+    pd.testing.assert_frame_equal(cache.obtener(llave('b')), resultado)
+
+def test_cambio_de_datos_invalida_resultado(tmp_path):
+    dataframes_escalas, diccionario_traducciones = generar_escalas({'mun': 100}, variables=4)
+    argumentos = dict(
+        diccionario_traducciones=diccionario_traducciones,
+        columna_diccionario_traducciones_nombres='traduccion',
+        columna_diccionario_traducciones_alias='variable',
+        variables_identificadoras=['ENTIDAD', 'MUN', 'LOC'],
+        variables_excluidas_list=[],
+        variables_excluidas_regex=['^NOM_']
+    )
+    cache = CacheResultados(directorio=str(tmp_path))
+
+    procesador = Procesador(dataframes_escalas=dataframes_escalas, **argumentos)
+    procesador.set_cache(cache)
+    procesador.procesar_variable(escalas=['mun'], var='VAR_002', var_base_normalizacion='POBTOT', q=4)
+    procesador.procesar_variable(escalas=['mun'], var='VAR_002', var_base_normalizacion='POBTOT', q=4)
+    assert (cache.aciertos, cache.fallos) == (1, 1)
+
+    # un valor distinto en la variable o en la base de normalizacion cambia la llave
+    for var in ['VAR_002', 'POBTOT']:
+        modificados = {'mun': dataframes_escalas['mun'].copy()}
+        modificados['mun'].loc[0, var] = modificados['mun'].loc[0, var] + 1
+        procesador_modificado = Procesador(dataframes_escalas=modificados, **argumentos)
+        procesador_modificado.set_cache(cache)
+        fallos = cache.fallos
+        resultado = procesador_modificado.procesar_variable(escalas=['mun'], var='VAR_002', var_base_normalizacion='POBTOT', q=4)
+        assert cache.fallos == fallos + 1
+        sin_cache = Procesador(dataframes_escalas=modificados, **argumentos).procesar_variable(escalas=['mun'], var='VAR_002', var_base_normalizacion='POBTOT', q=4)
+        pd.testing.assert_frame_equal(resultado, sin_cache)
@@ -0,0 +1,299 @@
+import os
+import sys
+import json
+import subprocess
+import numpy as np
+import pandas as pd
+import pytest
+from conftest import RUTA_SRC
+from benchmarks.generador_datos import generar_microdatos, generar_escalas
+from utils.conteos_dispersos import densificar_conteos
+from procesador.procesador import Procesador
+from procesador.cache_resultados import CacheResultados
+
+# cada modo alternativo (chunks, estado + delta, ingestion compacta, conteos dispersos, varios procesos, cache)
+# debe dar el mismo resultado que el modo en memoria / secuencial sobre datos sinteticos. Los modos que combinan
+# agregados parciales se comparan con suma_exacta, con la que las sumas no dependen de como se dividan las filas
+
+IDS = ['entidad', 'municipio']
+OPERACIONES = ['suma', 'media', 'conteo', 'minimo', 'maximo']
+OPERACIONES_CUANTILES = ['mediana', 'percentil_90'] # solo con lectura completa
+
+@pytest.fixture(scope='module')
+def microdatos(tmp_path_factory):
+    directorio = tmp_path_factory.mktemp('microdatos')
+    df, metadatos = generar_microdatos(filas=20000, variables_categoricas=3, variables_numericas=3, categorias=6, municipios=300)
+    df.to_csv(directorio / 'datos.csv', index=False)
+    metadatos.to_csv(directorio / 'metadatos.csv', index=False)
+    return directorio, df
+
+def configuracion(directorio, nombre:str, operaciones:list=OPERACIONES, **campos) -> str:
+    config = {
+        'ruta_csv_metadatos': str(directorio / 'metadatos.csv'),
+        'ruta_csv_dataset': str(directorio / 'datos.csv'),
+        'ruta_salida_dataset': str(directorio / f'{nombre}.csv'),
+        'ruta_salida_diccionario_traducciones': str(directorio / f'{nombre}_diccionario.csv'),
+        'columna_metadatos_nombres': 'var',
+        'columna_metadatos_posibles_valores': 'posibles_valores',
+        'columna_metadatos_alias': 'var_alias',
+        'columna_metadatos_posibles_valores_alias': 'posibles_valores_alias',
+        'variables_identificadoras_list': IDS,
+        'variables_a_agrupar': [
+            {'tipo_variables': 'categorico', 'variables_a_agrupar_list': [], 'variables_a_agrupar_regex': ['_cat$']},
+            {'tipo_variables': 'numerico', 'operacion': operaciones, 'variables_a_agrupar_list': [], 'variables_a_agrupar_regex': ['_num$']}
+        ]
+    }
+    config.update(campos)
+    ruta = directorio / f'{nombre}.json'
+    with open(ruta, 'w') as f:
+        json.dump(config, f)
+    return str(ruta)
+
+def ejecutar_preprocesador(ruta_config:str, *argumentos) -> subprocess.CompletedProcess:
+    return subprocess.run(
+        [sys.executable, '-m', 'preprocesador.main_preprocesador', '--config', ruta_config, *argumentos],
+        cwd=RUTA_SRC, capture_output=True, text=True
+    )
+
+def leer(ruta) -> str:
+    with open(ruta) as f:
+        return f.read()
+
+@pytest.fixture(scope='module')
+def salida_memoria(microdatos):
+    directorio, _ = microdatos
+    assert ejecutar_preprocesador(configuracion(directorio, 'memoria', suma_exacta=True)).returncode == 0
+    return leer(directorio / 'memoria.csv'), leer(directorio / 'memoria_diccionario.csv')
+
+@pytest.fixture(scope='module')
+def salida_memoria_cuantiles(microdatos):
+    directorio, _ = microdatos
+    assert ejecutar_preprocesador(configuracion(directorio, 'memoria_cuantiles', operaciones=OPERACIONES + OPERACIONES_CUANTILES, suma_exacta=True)).returncode == 0
+    return leer(directorio / 'memoria_cuantiles.csv'), leer(directorio / 'memoria_cuantiles_diccionario.csv')
+
+@pytest.mark.parametrize('tamano_chunk', [97, 1000, 4999])
+def test_chunks_igual_a_memoria(microdatos, salida_memoria, tamano_chunk):
+    directorio, _ = microdatos
+    nombre = f'chunk_{tamano_chunk}'
+    assert ejecutar_preprocesador(configuracion(directorio, nombre, tamano_chunk=tamano_chunk, suma_exacta=True)).returncode == 0
+    assert leer(directorio / f'{nombre}.csv') == salida_memoria[0]
+    assert leer(directorio / f'{nombre}_diccionario.csv') == salida_memoria[1]
+
+def test_chunks_rechazan_cuantiles(microdatos):
+    directorio, _ = microdatos
+    ejecucion = ejecutar_preprocesador(configuracion(directorio, 'chunk_cuantiles', operaciones=OPERACIONES + OPERACIONES_CUANTILES, tamano_chunk=1000))
+    assert ejecucion.returncode != 0
+    assert 'mediana, percentil_90 no se pueden calcular por chunks' in ejecucion.stderr
+
+def test_chunks_sin_suma_exacta_difieren_solo_por_redondeo(microdatos):
+    directorio, _ = microdatos
+    for nombre, campos in [('flotante_memoria', {}), ('flotante_chunk', {'tamano_chunk': 997})]:
+        assert ejecutar_preprocesador(configuracion(directorio, nombre, **campos)).returncode == 0
+    pd.testing.assert_frame_equal(
+        pd.read_csv(directorio / 'flotante_memoria.csv'),
+        pd.read_csv(directorio / 'flotante_chunk.csv'),
+        check_exact=False, rtol=1e-12
+    )
+
+@pytest.mark.parametrize('tamano_chunk', [None, 1000])
+def test_ingestion_compacta_igual_a_memoria(microdatos, salida_memoria, tamano_chunk):
+    directorio, _ = microdatos
+    nombre = f'compacta_{tamano_chunk}'
+    campos = {'ingestion_compacta': True, 'suma_exacta': True}
+    if tamano_chunk is not None:
+        campos['tamano_chunk'] = tamano_chunk
+    assert ejecutar_preprocesador(configuracion(directorio, nombre, **campos)).returncode == 0
+    assert leer(directorio / f'{nombre}.csv') == salida_memoria[0]
+
+def test_estado_y_deltas_igual_a_recalculo(microdatos, salida_memoria_cuantiles):
+    directorio, df = microdatos
+
+    # el dataset se divide en una historia y dos deltas con las mismas columnas
+    partes = {'historia': df.iloc[:11000], 'delta_1': df.iloc[11000:16000], 'delta_2': df.iloc[16000:]}
+    for nombre, parte in partes.items():
+        parte.to_csv(directorio / f'{nombre}.csv', index=False)
+
+    ruta_config = configuracion(
+        directorio, 'incremental',
+        operaciones=OPERACIONES + OPERACIONES_CUANTILES,
+        ruta_csv_dataset=str(directorio / 'historia.csv'),
+        ruta_estado_agregados=str(directorio / 'estado.pkl'),
+        suma_exacta=True
+    )
+    assert ejecutar_preprocesador(ruta_config).returncode == 0
+    for nombre in ['delta_1', 'delta_2']:
+        assert ejecutar_preprocesador(ruta_config, '--ruta-delta', str(directorio / f'{nombre}.csv')).returncode == 0
+    assert leer(directorio / 'incremental.csv') == salida_memoria_cuantiles[0]
+
+    # un estado construido con otra configuracion de agrupacion no se puede continuar
+    ruta_config_distinta = configuracion(
+        directorio, 'incremental_distinta',
+        ruta_csv_dataset=str(directorio / 'historia.csv'),
+        ruta_estado_agregados=str(directorio / 'estado.pkl'),
+        suma_exacta=True,
+        variables_a_agrupar=[{'tipo_variables': 'numerico', 'operacion': 'suma', 'variables_a_agrupar_list': [], 'variables_a_agrupar_regex': ['_num$']}]
+    )
+    ejecucion = ejecutar_preprocesador(ruta_config_distinta, '--ruta-delta', str(directorio / 'delta_1.csv'))
+    assert ejecucion.returncode != 0
+    assert 'no coincide' in ejecucion.stderr
+
+@pytest.mark.parametrize('tamano_chunk', [None, 1000])
+def test_conteos_dispersos_igual_a_densos(microdatos, salida_memoria, tamano_chunk):
+    directorio, _ = microdatos
+    nombre = f'dispersos_{tamano_chunk}'
+    campos = {'conteos_categoricos_dispersos': True, 'suma_exacta': True}
+    if tamano_chunk is not None:
+        campos['tamano_chunk'] = tamano_chunk
+    assert ejecutar_preprocesador(configuracion(directorio, nombre, **campos)).returncode == 0
+
+    tipos = {var: str for var in IDS}
+    df_denso = pd.read_csv(directorio / 'memoria.csv', dtype=tipos)
+    df_disperso = pd.read_csv(directorio / f'{nombre}.csv', dtype=tipos)
+    df_coordenadas = pd.read_csv(directorio / f'{nombre}_conteos.csv', dtype=tipos)
+    df_columnas = pd.read_csv(directorio / f'{nombre}_columnas.csv')
+
+    df_reconstruido = df_disperso.merge(densificar_conteos(df_coordenadas, df_columnas, IDS), on=IDS, how='left')
+    assert sorted(df_reconstruido.columns) == sorted(df_denso.columns)
+    pd.testing.assert_frame_equal(df_reconstruido[df_denso.columns], df_denso)
+    assert leer(directorio / f'{nombre}_diccionario.csv') == salida_memoria[1]
+
+def test_operaciones_en_lista_igual_a_operaciones_separadas(microdatos, salida_memoria_cuantiles):
+    directorio, _ = microdatos
+    df_lista = pd.read_csv(directorio / 'memoria_cuantiles.csv', dtype={var: str for var in IDS})
+    for operacion in OPERACIONES + OPERACIONES_CUANTILES:
+        nombre = f'operacion_{operacion}'
+        variables_a_agrupar = [{'tipo_variables': 'numerico', 'operacion': operacion, 'variables_a_agrupar_list': [], 'variables_a_agrupar_regex': ['_num$']}]
+        assert ejecutar_preprocesador(configuracion(directorio, nombre, variables_a_agrupar=variables_a_agrupar, suma_exacta=True)).returncode == 0
+        df_operacion = pd.read_csv(directorio / f'{nombre}.csv', dtype={var: str for var in IDS})
+        columnas = [f'{operacion}::p{i}_num' for i in range(3)]
+        pd.testing.assert_frame_equal(df_operacion.set_index(IDS)[columnas], df_lista.set_index(IDS).loc[df_operacion.set_index(IDS).index, columnas])
+
+def test_desviacion_estandar_por_chunks(microdatos):
+    directorio, _ = microdatos
+
+    # los momentos combinados coinciden con groupby.std salvo por redondeo
+    variables_a_agrupar = [{'tipo_variables': 'numerico', 'operacion': 'desviacion_estandar', 'variables_a_agrupar_list': [], 'variables_a_agrupar_regex': ['_num$']}]
+    for nombre, campos in [('std_memoria', {}), ('std_chunk', {'tamano_chunk': 997})]:
+        assert ejecutar_preprocesador(configuracion(directorio, nombre, variables_a_agrupar=variables_a_agrupar, **campos)).returncode == 0
+    pd.testing.assert_frame_equal(
+        pd.read_csv(directorio / 'std_memoria.csv'),
+        pd.read_csv(directorio / 'std_chunk.csv'),
+        check_exact=False, rtol=1e-12
+    )
+
+@pytest.fixture(scope='module')
+def escalas():
+    dataframes_escalas, diccionario_traducciones = generar_escalas({'mun': 400, 'state': 32}, variables=8)
+
+    # la base de normalizacion tiene ceros, que se reemplazan por NaN al normalizar
+    for dataframe in dataframes_escalas.values():
+        dataframe.loc[::7, 'VAR_001'] = 0
+    return dataframes_escalas, diccionario_traducciones
+
+def procesar(escalas, workers:int, cache:CacheResultados=None, variables_excluidas_list:list=None) -> pd.DataFrame:
+    dataframes_escalas, diccionario_traducciones = escalas
+    procesador = Procesador(
+        dataframes_escalas={escala: dataframe.copy() for escala, dataframe in dataframes_escalas.items()},
+        diccionario_traducciones=diccionario_traducciones,
+        columna_diccionario_traducciones_nombres='traduccion',
+        columna_diccionario_traducciones_alias='variable',
+        variables_identificadoras=['ENTIDAD', 'MUN', 'LOC'],
+        variables_excluidas_list=variables_excluidas_list or [],
+        variables_excluidas_regex=['^NOM_']
+    )
+    if cache is not None:
+        procesador.set_cache(cache)
+
+    # una lista normalizada por VAR_001 seguida de una expresion regular que incluye a VAR_001 como variable
+    escalas_procesar = list(dataframes_escalas.keys())
+    listas = procesador.procesar_multiples_variables_list(escalas=escalas_procesar, dicc={'VAR_001': ['VAR_002', 'VAR_003', 'VAR_004']}, q=5, workers=workers)
+    regex = procesador.procesar_multiples_variables_regex(escalas=escalas_procesar, dicc={None: '^VAR_00'}, q=5, workers=workers)
+    return pd.concat(list(listas.values()) + list(regex.values()), ignore_index=True)
+
+def test_varios_procesos_igual_a_secuencial(escalas):
+    secuencial = procesar(escalas, workers=1)
+    for workers in [2, 4]:
+        pd.testing.assert_frame_equal(procesar(escalas, workers=workers), secuencial)
+
+def test_cache_igual_a_sin_cache(escalas, tmp_path):
+    sin_cache = procesar(escalas, workers=1)
+    cache = CacheResultados(directorio=str(tmp_path / 'cache'))
+    pd.testing.assert_frame_equal(procesar(escalas, workers=1, cache=cache), sin_cache) # sin resultados guardados
+    pd.testing.assert_frame_equal(procesar(escalas, workers=1, cache=cache), sin_cache) # todos desde la cache
+    pd.testing.assert_frame_equal(procesar(escalas, workers=2, cache=cache), sin_cache)
+
+def test_cache_valida_parametros(escalas, tmp_path):
+    dataframes_escalas, diccionario_traducciones = escalas
+    cache = CacheResultados(directorio=str(tmp_path / 'cache'))
+    argumentos = dict(
+        dataframes_escalas=dataframes_escalas,
+        diccionario_traducciones=diccionario_traducciones,
+        columna_diccionario_traducciones_nombres='traduccion',
+        columna_diccionario_traducciones_alias='variable',
+        variables_identificadoras=['ENTIDAD', 'MUN', 'LOC'],
+        variables_excluidas_regex=['^NOM_']
+    )
+    procesador = Procesador(variables_excluidas_list=[], **argumentos)
+    procesador.set_cache(cache)
+    procesador.procesar_variable(escalas=['mun'], var='VAR_002', q=5)
+
+    # con el resultado ya guardado, una variable excluida se rechaza igual que sin cache
+    procesador_excluida = Procesador(variables_excluidas_list=['VAR_002'], **argumentos)
+    procesador_excluida.set_cache(cache)
+    with pytest.raises(ValueError):
+        procesador_excluida.procesar_variable(escalas=['mun'], var='VAR_002', q=5)
+
+def test_normalizacion_no_modifica_escalas(escalas):
+    dataframes_escalas, _ = escalas
+    originales = {escala: dataframe.copy() for escala, dataframe in dataframes_escalas.items()}
+    procesar(escalas, workers=1)
+    for escala, dataframe in dataframes_escalas.items():
+        pd.testing.assert_frame_equal(dataframe, originales[escala])
+    assert (np.asarray(dataframes_escalas['mun']['VAR_001']) == 0).any()
+
+def test_carga_de_escalas_igual_a_carga_completa(escalas, tmp_path):
+    dataframes_escalas, diccionario_traducciones = escalas
+    for escala, dataframe in dataframes_escalas.items():
+        dataframe.to_csv(tmp_path / f'{escala}.csv', index=False)
+    diccionario_traducciones.to_csv(tmp_path / 'diccionario.csv', index=False)
+    listas = {'VAR_001': ['VAR_002', 'VAR_003']}
+    regex = {'None': '^VAR_00[45]$'}
+    config = {
+        'rutas_csv_escalas': {escala: str(tmp_path / f'{escala}.csv') for escala in dataframes_escalas},
+        'ruta_csv_diccionario_traducciones': str(tmp_path / 'diccionario.csv'),
+        'columna_diccionario_traducciones_nombres': 'traduccion',
+        'columna_diccionario_traducciones_alias': 'variable',
+        'variables_identificadoras': ['ENTIDAD', 'MUN', 'LOC'],
+        'variables_excluidas_regex': ['^NOM_'],
+        'variables_a_procesar_list': listas,
+        'variables_a_procesar_regex': regex,
+        'q': 5,
+        'ruta_csv_salida': str(tmp_path / 'salida.csv')
+    }
+    with open(tmp_path / 'config.json', 'w') as f:
+        json.dump(config, f)
+    ejecucion = subprocess.run(
+        [sys.executable, '-m', 'procesador.main_procesador', '--config', str(tmp_path / 'config.json')],
+        cwd=RUTA_SRC, capture_output=True, text=True
+    )
+    assert ejecucion.returncode == 0, ejecucion.stderr
+
+    # todas las escalas con todas sus columnas, leidas una por una; la salida debe incluir las dos escalas aunque solo
+    # se carguen las columnas usadas
+    procesador = Procesador(
+        dataframes_escalas={escala: pd.read_csv(tmp_path / f'{escala}.csv', dtype={col: str for col in ['ENTIDAD', 'MUN', 'LOC']}) for escala in dataframes_escalas},
+        diccionario_traducciones=diccionario_traducciones,
+        columna_diccionario_traducciones_nombres='traduccion',
+        columna_diccionario_traducciones_alias='variable',
+        variables_identificadoras=['ENTIDAD', 'MUN', 'LOC'],
+        variables_excluidas_list=[],
+        variables_excluidas_regex=['^NOM_']
+    )
+    escalas_procesar = list(dataframes_escalas.keys())
+    esperado = pd.concat(
+        list(procesador.procesar_multiples_variables_regex(escalas=escalas_procesar, dicc={None: regex['None']}, q=5).values()) +
+        list(procesador.procesar_multiples_variables_list(escalas=escalas_procesar, dicc=listas, q=5).values())
+    )
+    assert all(f'cells_{escala}' in esperado.columns for escala in escalas_procesar)
+    esperado.to_csv(tmp_path / 'esperado.csv', index=False)
+    assert leer(tmp_path / 'salida.csv') == leer(tmp_path / 'esperado.csv')
@@ -0,0 +1,38 @@
+import functools
+import numpy as np
+import pandas as pd
+import pytest
+from preprocesador.preprocesador import Preprocesador
+
+IDS = ['entidad', 'municipio']
+
+def unir_por_pares(agrupaciones:list) -> pd.DataFrame:
+    # union original: pd.merge de cada agrupacion con el resultado acumulado
+    return functools.reduce(lambda left, right: pd.merge(left, right, on=IDS, how='inner'), agrupaciones)
+
+def agrupacion(rng, llaves:pd.DataFrame, columnas:list, proporcion:float) -> pd.DataFrame:
+    # subconjunto de las llaves en orden aleatorio, con columnas enteras, float y de texto
+    df = llaves.sample(frac=proporcion, random_state=int(rng.integers(1000))).reset_index(drop=True)
+    for i, col in enumerate(columnas):
+        if i % 3 == 0:
+            df[col] = rng.integers(0, 100, len(df))
+        elif i % 3 == 1:
+            df[col] = rng.normal(size=len(df))
+        else:
+            df[col] = rng.choice(['a', 'b', None], len(df))
+    return df
+
+@pytest.mark.parametrize('proporciones', [[1, 1, 1], [1, 0.8, 0.6, 0.9], [0.5, 1]])
+def test_union_igual_a_merge_por_pares(proporciones):
+    rng = np.random.default_rng(0)
+    llaves = pd.DataFrame({'entidad': np.repeat(np.arange(1, 11), 20), 'municipio': np.tile(np.arange(1, 21), 10)})
+    agrupaciones = [agrupacion(rng, llaves, [f'b{i}_c{j}' for j in range(4)], proporcion) for i, proporcion in enumerate(proporciones)]
+    pd.testing.assert_frame_equal(Preprocesador.unir_agrupaciones(agrupaciones=agrupaciones, variables_id_agrupacion=IDS), unir_por_pares(agrupaciones))
+
+def test_union_con_columnas_repetidas_conserva_sufijos():
+    rng = np.random.default_rng(1)
+    llaves = pd.DataFrame({'entidad': np.repeat(np.arange(1, 6), 4), 'municipio': np.tile(np.arange(1, 5), 5)})
+    agrupaciones = [agrupacion(rng, llaves, ['conteo::total_datos', 'x'], 1), agrupacion(rng, llaves, ['conteo::total_datos', 'y'], 0.7)]
+    resultado = Preprocesador.unir_agrupaciones(agrupaciones=agrupaciones, variables_id_agrupacion=IDS)
+    assert 'conteo::total_datos_x' in resultado.columns
+    pd.testing.assert_frame_equal(resultado, unir_por_pares(agrupaciones))
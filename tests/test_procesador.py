@@ -0,0 +1,157 @@
+import numpy as np
+import pandas as pd
+import pytest
+from procesador.procesador import Procesador
+
+# escala pequeña con columnas que cubren los casos limite de pd.qcut: valores repetidos, constantes, sin valores,
+# con pocos valores no nulos, enteros, con infinitos y una base de normalizacion con ceros
+
+N = 60
+
+def crear_procesador(columnas:dict) -> Procesador:
+    ids = np.arange(N)
+    df = pd.DataFrame({
+        'ENTIDAD': [f'{i % 32 + 1:02d}' for i in ids],
+        'MUN': [f'{i // 32 + 1:03d}' for i in ids],
+        'LOC': ['0000'] * N,
+        **columnas
+    })
+    diccionario = pd.DataFrame({'variable': list(df.columns), 'traduccion': [f'Descripción de {col}' for col in df.columns]})
+    return Procesador(
+        dataframes_escalas={'mun': df},
+        diccionario_traducciones=diccionario,
+        columna_diccionario_traducciones_nombres='traduccion',
+        columna_diccionario_traducciones_alias='variable',
+        variables_identificadoras=['ENTIDAD', 'MUN', 'LOC'],
+        variables_excluidas_list=[],
+        variables_excluidas_regex=[]
+    )
+
+@pytest.fixture
+def procesador():
+    rng = np.random.default_rng(0)
+    pocos = np.full(N, np.nan)
+    pocos[[3, 10, 40]] = [2.0, 7.0, 7.0]
+    infinitos = rng.normal(size=N)
+    infinitos[5] = np.inf
+    base = rng.integers(1, 100, N).astype(np.float64)
+    base[::9] = 0
+    return crear_procesador({
+        'REPETIDOS': np.repeat([1.0, 1.0, 1.0, 2.0, 5.0, 5.0], N // 6),
+        'CONSTANTE': np.full(N, 4.0),
+        'VACIA': np.full(N, np.nan),
+        'POCOS': pocos,
+        'ENTEROS': rng.integers(0, 1000, N),
+        'NORMAL': rng.normal(size=N),
+        'INFINITOS': infinitos,
+        'BASE': base
+    })
+
+def qcut_o_error(serie:pd.Series, q:int):
+    try:
+        return pd.qcut(serie, q=q, duplicates='drop')
+    except Exception as error:
+        return error
+
+VARIABLES = ['REPETIDOS', 'CONSTANTE', 'VACIA', 'POCOS', 'ENTEROS', 'NORMAL', 'INFINITOS']
+
+@pytest.mark.parametrize('q', [2, 4, 10])
+@pytest.mark.parametrize('var_base_normalizacion', [None, 'BASE'])
+def test_categorizacion_agrupada_igual_a_qcut(procesador, q, var_base_normalizacion):
+    df = procesador.dataframes_escalas['mun']
+    esperados = {}
+    for var in VARIABLES:
+        serie = df[var] if var_base_normalizacion is None else df[var] / df[var_base_normalizacion].replace(0, np.nan)
+        esperados[var] = qcut_o_error(serie, q)
+
+    # las columnas que pd.qcut acepta se categorizan juntas; las demas reportan el mismo error que pd.qcut
+    validas = [var for var in VARIABLES if not isinstance(esperados[var], Exception)]
+    resultado = procesador.categorizar_multiples_variables(escala='mun', variables=validas, var_base_normalizacion=var_base_normalizacion, q=q)
+    for var in validas:
+        pd.testing.assert_series_equal(resultado[var], esperados[var], check_names=False)
+
+    for var in VARIABLES:
+        if isinstance(esperados[var], Exception):
+            with pytest.raises(type(esperados[var])):
+                procesador.categorizar_multiples_variables(escala='mun', variables=['NORMAL', var], var_base_normalizacion=var_base_normalizacion, q=q)
+
+@pytest.mark.parametrize('error_cuantiles', [None, 0.01])
+def test_infinitos_reportan_error_de_qcut(procesador, error_cuantiles):
+    # los bordes exactos de una columna con infinitos son NaN, los aproximados son infinitos; en ambos casos se
+    # reporta el error de pd.qcut en lugar de un intervalo con limite infinito
+    if error_cuantiles is not None:
+        procesador.set_error_cuantiles(error_cuantiles)
+    with pytest.raises(ValueError):
+        procesador.categorizar_multiples_variables(escala='mun', variables=['INFINITOS'], q=4)
+    with pytest.raises(ValueError):
+        procesador.categorizar_variable(escala='mun', var='INFINITOS', q=4)
+
+def test_categorizacion_agrupada_no_modifica_escala(procesador):
+    df = procesador.dataframes_escalas['mun'].copy()
+    procesador.categorizar_multiples_variables(escala='mun', variables=['NORMAL', 'ENTEROS'], var_base_normalizacion='BASE', q=4)
+    pd.testing.assert_frame_equal(procesador.dataframes_escalas['mun'], df)
+
+def test_error_cuantiles_mayor_al_validado_advierte(procesador, capsys):
+    procesador.set_error_cuantiles(0.01)
+    assert 'Advertencia' not in capsys.readouterr().out
+    procesador.set_error_cuantiles(0.05)
+    assert 'Advertencia' in capsys.readouterr().out
+    with pytest.raises(ValueError):
+        procesador.set_error_cuantiles(1.5)
+
+def cells_por_fila(procesador, escala:str, var:str, var_base_normalizacion:str, q:int) -> list:
+    # agrupacion original: se recorre fila por fila y la llave de cada entidad se arma con df.iloc[i]
+    df = procesador.dataframes_escalas[escala]
+    categorizada = procesador.categorizar_variable(escala=escala, var=var, var_base_normalizacion=var_base_normalizacion, q=q)
+    categorizada = categorizada.cat.add_categories(['NaN']).fillna('NaN')
+    cells = {intervalo: [] for intervalo in categorizada.cat.categories}
+    for i, intervalo in enumerate(categorizada):
+        cells[intervalo].append(''.join(str(df.iloc[i][col]) for col in procesador.variables_identificadoras))
+    intervalos = sorted((intervalo for intervalo, entidades in cells.items() if len(entidades) > 0), key=lambda x: (isinstance(x, str), x))
+    return ['{' + ','.join(cells[intervalo]) + '}' for intervalo in intervalos]
+
+@pytest.mark.parametrize('var, var_base_normalizacion', [('NORMAL', None), ('REPETIDOS', None), ('POCOS', None), ('ENTEROS', 'BASE')])
+def test_cells_igual_a_agrupacion_por_fila(procesador, var, var_base_normalizacion):
+    resultado = procesador.procesar_variable(escalas=['mun'], var=var, var_base_normalizacion=var_base_normalizacion, q=4)
+    assert resultado['cells_mun'].tolist() == cells_por_fila(procesador, 'mun', var, var_base_normalizacion, 4)
+
+def test_indice_entidades_igual_a_llave_por_fila():
+    # identificadores enteros junto a una columna float: df.iloc[i] convierte la fila completa a float, y las ultimas
+    # filas repiten entidades
+    ids = np.arange(N)
+    df = pd.DataFrame({'ENTIDAD': ids % 32 + 1, 'MUN': ids // 32 + 1, 'LOC': 0, 'NORMAL': np.random.default_rng(1).normal(size=N)})
+    df = pd.concat([df, df.iloc[:5]], ignore_index=True)
+    procesador = Procesador(
+        dataframes_escalas={'mun': df},
+        diccionario_traducciones=pd.DataFrame({'variable': ['NORMAL'], 'traduccion': ['Normal']}),
+        columna_diccionario_traducciones_nombres='traduccion',
+        columna_diccionario_traducciones_alias='variable',
+        variables_identificadoras=['ENTIDAD', 'MUN', 'LOC'],
+        variables_excluidas_list=[],
+        variables_excluidas_regex=[]
+    )
+    indice = procesador.get_indice_entidades('mun')
+    assert indice['entidad'].tolist() == [''.join(str(df.iloc[i][col]) for col in ['ENTIDAD', 'MUN', 'LOC']) for i in range(len(df))]
+    assert indice['orden'].tolist() == list(range(len(df)))
+    
+    # el id entero numera las llaves distintas en orden de aparicion, las filas repetidas comparten id
+    assert indice['id_entidad'].tolist() == indice.groupby('entidad', sort=False).ngroup().tolist()
+    
+    resultado = procesador.procesar_variable(escalas=['mun'], var='NORMAL', q=4)
+    assert resultado['cells_mun'].tolist() == cells_por_fila(procesador, 'mun', 'NORMAL', None, 4)
+
+@pytest.mark.parametrize('var, var_base_normalizacion', [('NORMAL', None), ('POCOS', None), ('ENTEROS', 'BASE')])
+def test_cells_enteros_igual_a_cadenas(procesador, var, var_base_normalizacion):
+    cadenas = procesador.procesar_variable(escalas=['mun'], var=var, var_base_normalizacion=var_base_normalizacion, q=4)
+    procesador.set_representacion_cells('enteros')
+    enteros = procesador.procesar_variable(escalas=['mun'], var=var, var_base_normalizacion=var_base_normalizacion, q=4)
+    pd.testing.assert_frame_equal(enteros.drop(columns=['cells_mun']), cadenas.drop(columns=['cells_mun']))
+
+    # con el diccionario de entidades cada lista de ids corresponde a la misma lista de llaves, en otro orden
+    diccionario = procesador.generar_diccionario_entidades(['mun'])
+    assert diccionario['id_entidad'].is_unique
+    entidades = dict(zip(diccionario['id_entidad'], diccionario['entidad']))
+    for cells_enteros, cells_cadenas in zip(enteros['cells_mun'], cadenas['cells_mun']):
+        ids = [int(id_entidad) for id_entidad in cells_enteros.strip('{}').split(',') if id_entidad != '']
+        assert ids == sorted(ids)
+        assert sorted(entidades[id_entidad] for id_entidad in ids) == sorted(entidad for entidad in cells_cadenas.strip('{}').split(',') if entidad != '')
@@ -0,0 +1,46 @@
+import pandas as pd
+import pytest
+from utils.regex_utils import SelectorColumnas, obtener_variables_regex_df
+
+COLUMNAS = ['ENTIDAD', 'MUN', 'LOC', 'NOM_ENT', 'POBTOT', 'P_0A2', 'P_3YMAS', 'p3_cat', 'P3_NUM', 'aa_bb', 'abab', 'VAR_001', 'VAR_010', 'var_001', 7, 'x|y']
+
+# anclas, alternancias, clases, lookahead, referencias a grupos y banderas globales
+EXPRESIONES = [
+    '^P_', 'NUM$', '^(ENTIDAD|MUN)$', 'P_[0-9]', '(?i)^var_', '^VAR_0(?!01)', r'^(ab)\1$', r'(?P<c>[a-z])(?P=c)_',
+    '^$', r'x\|y', 'TOT|ENT', '[', '^NO'
+]
+
+@pytest.fixture
+def df():
+    return pd.DataFrame([[0] * len(COLUMNAS)], columns=COLUMNAS)
+
+def esperado(df:pd.DataFrame, regex:str) -> list:
+    # DataFrame.filter convierte los nombres a str antes de buscar
+    return list(df.filter(regex=regex).columns)
+
+@pytest.mark.parametrize('orden', [1, -1])
+def test_lote_igual_a_filter(df, orden):
+    validas = [regex for regex in EXPRESIONES if regex != '['][::orden]
+    selector = SelectorColumnas(list(df.columns))
+    resultado = selector.seleccionar_lote(validas)
+    assert list(resultado.keys()) == validas
+    for regex in validas:
+        assert resultado[regex] == esperado(df, regex)
+        # el resultado memorizado es el mismo que con una seleccion individual
+        assert selector.seleccionar(regex) == esperado(df, regex)
+        assert SelectorColumnas(list(df.columns)).seleccionar(regex) == esperado(df, regex)
+
+def test_expresion_invalida(df):
+    with pytest.raises(ValueError):
+        SelectorColumnas(list(df.columns)).seleccionar_lote(['^P_', '['])
+    with pytest.raises(ValueError):
+        obtener_variables_regex_df(df, '[')
+    # DataFrame.filter(regex='') falla en lugar de seleccionar todas las columnas
+    with pytest.raises(ValueError):
+        SelectorColumnas(list(df.columns)).seleccionar_lote(['^P_', ''])
+
+def test_resultado_no_comparte_listas(df):
+    selector = SelectorColumnas(list(df.columns))
+    selector.seleccionar('^P_').append('OTRA')
+    assert selector.seleccionar('^P_') == esperado(df, '^P_')
+    assert obtener_variables_regex_df(df, '^VAR') == esperado(df, '^VAR')
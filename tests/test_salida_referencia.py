@@ -0,0 +1,96 @@
+import os
+import sys
+import json
+import subprocess
+import pandas as pd
+import pytest
+from conftest import RUTA_SRC
+
+# las salidas en datos_referencia se generaron con la version original del repositorio (commit 2ee7c38) sobre los
+# mismos datos sinteticos; con la configuracion por defecto la salida actual debe ser identica byte a byte
+
+DIRECTORIO_REFERENCIA = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'datos_referencia')
+
+def referencia(nombre:str) -> str:
+    return os.path.join(DIRECTORIO_REFERENCIA, nombre)
+
+def leer(ruta) -> str:
+    with open(ruta) as f:
+        return f.read()
+
+def ejecutar(modulo:str, directorio, config:dict) -> subprocess.CompletedProcess:
+    ruta_config = directorio / 'config.json'
+    with open(ruta_config, 'w') as f:
+        json.dump(config, f)
+    return subprocess.run([sys.executable, '-m', modulo, '--config', str(ruta_config)], cwd=RUTA_SRC, capture_output=True, text=True)
+
+def test_preprocesador_igual_a_referencia(tmp_path):
+    config = {
+        'ruta_csv_metadatos': referencia('metadatos.csv'),
+        'ruta_csv_dataset': referencia('microdatos.csv'),
+        'ruta_salida_dataset': str(tmp_path / 'preprocesado.csv'),
+        'ruta_salida_diccionario_traducciones': str(tmp_path / 'preprocesado_diccionario.csv'),
+        'columna_metadatos_nombres': 'var',
+        'columna_metadatos_posibles_valores': 'posibles_valores',
+        'columna_metadatos_alias': 'var_alias',
+        'columna_metadatos_posibles_valores_alias': 'posibles_valores_alias',
+        'variables_identificadoras_list': ['entidad', 'municipio'],
+        'variables_a_agrupar': [{'tipo_variables': 'categorico', 'variables_a_agrupar_list': [], 'variables_a_agrupar_regex': ['_cat$']}] + [
+            {'tipo_variables': 'numerico', 'operacion': operacion, 'variables_a_agrupar_list': [], 'variables_a_agrupar_regex': ['_num$']}
+            for operacion in ['suma', 'media', 'mediana']
+        ]
+    }
+    ejecucion = ejecutar('preprocesador.main_preprocesador', tmp_path, config)
+    assert ejecucion.returncode == 0, ejecucion.stderr
+    for nombre in ['preprocesado.csv', 'preprocesado_diccionario.csv']:
+        assert leer(tmp_path / nombre) == leer(referencia(nombre))
+
+def test_preprocesador_carga_solo_columnas_utilizadas(tmp_path):
+    # dataset con columna de indice (Unnamed: 0) y columnas sin usar; cada agrupacion usa un filtro distinto
+    df = pd.read_csv(referencia('microdatos.csv'), dtype=str)
+    df['sin_uso_txt'] = 'x'
+    df['p0_num_copia'] = df['p0_num']
+    df.to_csv(tmp_path / 'microdatos_columnas.csv')
+    config = {
+        'ruta_csv_metadatos': referencia('metadatos.csv'),
+        'ruta_csv_dataset': str(tmp_path / 'microdatos_columnas.csv'),
+        'ruta_salida_dataset': str(tmp_path / 'preprocesado_columnas.csv'),
+        'ruta_salida_diccionario_traducciones': str(tmp_path / 'preprocesado_columnas_diccionario.csv'),
+        'columna_metadatos_nombres': 'var',
+        'columna_metadatos_posibles_valores': 'posibles_valores',
+        'columna_metadatos_alias': 'var_alias',
+        'columna_metadatos_posibles_valores_alias': 'posibles_valores_alias',
+        'variables_identificadoras_list': ['entidad', 'municipio'],
+        'variables_a_agrupar': [
+            {'tipo_variables': 'categorico', 'variables_a_agrupar_list': ['p1_cat'], 'variables_a_agrupar_regex': []},
+            {
+                'tipo_variables': 'numerico', 'operacion': 'suma', 'variables_a_agrupar_list': [], 'variables_a_agrupar_regex': [],
+                'variables_a_agrupar_clasificacion_metadatos': {'columna_metadatos_filtro': 'var', 'valores': ['p1_num']}
+            },
+            {'tipo_variables': 'numerico', 'operacion': 'media', 'variables_a_agrupar_list': [], 'variables_a_agrupar_regex': ['^p0_num$']}
+        ]
+    }
+    ejecucion = ejecutar('preprocesador.main_preprocesador', tmp_path, config)
+    assert ejecucion.returncode == 0, ejecucion.stderr
+    assert 'Se cargarán 5 de 8 columnas del dataset' in ejecucion.stdout
+    for nombre in ['preprocesado_columnas.csv', 'preprocesado_columnas_diccionario.csv']:
+        assert leer(tmp_path / nombre) == leer(referencia(nombre))
+
+@pytest.mark.parametrize('campos', [{}, {'workers': 2}], ids=['secuencial', 'workers'])
+def test_procesador_igual_a_referencia(tmp_path, campos):
+    config = {
+        'rutas_csv_escalas': {'mun': referencia('escala_mun.csv')},
+        'ruta_csv_diccionario_traducciones': referencia('diccionario_escalas.csv'),
+        'columna_diccionario_traducciones_nombres': 'traduccion',
+        'columna_diccionario_traducciones_alias': 'variable',
+        'variables_identificadoras': ['ENTIDAD', 'MUN', 'LOC'],
+        'variables_excluidas_regex': ['^NOM_'],
+        'variables_a_procesar_list': {'None': ['VAR_001'], 'POBTOT': ['VAR_002']},
+        'variables_a_procesar_regex': {'POBTOT': '^VAR_00[34]$'},
+        'q': 4,
+        'ruta_csv_salida': str(tmp_path / 'procesado.csv'),
+        **campos
+    }
+    ejecucion = ejecutar('procesador.main_procesador', tmp_path, config)
+    assert ejecucion.returncode == 0, ejecucion.stderr
+    assert leer(tmp_path / 'procesado.csv') == leer(referencia('procesado.csv'))